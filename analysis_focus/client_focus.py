@@ -1,15 +1,14 @@
 from utils.data_utils import filter_dataframes_by_idcontacto
 
-def filter_by_client(dataframes, supplier_info):
+def select_client(supplier_info):
     """
-    Filter dataframes for a specific client.
+    Prompt the user to pick a client from the supplier information.
 
     Args:
-        dataframes (list of pd.DataFrame): The dataframes to filter.
         supplier_info (pd.DataFrame): Supplier information DataFrame.
 
     Returns:
-        tuple: (entity_id, entity_name, filtered_dataframes)
+        tuple: (entity_id, entity_name), or (None, None) if the selection is invalid.
     """
     # Display the list of clients
     unique_clients = supplier_info[['idcontacto', 'descrip']].drop_duplicates().reset_index(drop=True)
@@ -24,7 +23,7 @@ def filter_by_client(dataframes, supplier_info):
             raise ValueError(f"Invalid selection '{selected_idx}'")
     except ValueError as e:
         print(f"Error: {e}")
-        return None, None, None
+        return None, None
 
     # Identify selected client
     selected_entity = unique_clients.iloc[selected_idx]
@@ -32,7 +31,26 @@ def filter_by_client(dataframes, supplier_info):
     entity_name = selected_entity['descrip']
     print(f"Selected client: {entity_name} (idcontacto: {entity_id})")
 
+    return entity_id, entity_name
+
+
+def filter_by_client(dataframes, supplier_info):
+    """
+    Filter dataframes for a specific client.
+
+    Args:
+        dataframes (list of pd.DataFrame or DataFrameFilterIndex): The dataframes to filter, or an index built once
+            over them (e.g. load_clean_layer_index) so repeated selections don't rescan the tables.
+        supplier_info (pd.DataFrame): Supplier information DataFrame.
+
+    Returns:
+        tuple: (entity_id, entity_name, filtered_dataframes)
+    """
+    entity_id, entity_name = select_client(supplier_info)
+    if entity_id is None:
+        return None, None, None
+
     # Filter dataframes by client
     filtered_dataframes = filter_dataframes_by_idcontacto(dataframes, entity_id)
 
-    return entity_id, entity_name, filtered_dataframes
\ No newline at end of file
+    return entity_id, entity_name, filtered_dataframes
@@ -1,17 +1,23 @@
+import numpy as np
+import pandas as pd
 from utils.data_utils import filter_dataframes_by_warehouse
+from utils.numeric_utils import safe_divide, pct_change_safe
+
+WAREHOUSES = ["BODA", "BODC", "BODE", "BODG", "BODJ", "OPL", "INCOHERENT VALUES", "DESCONOCIDO", "INTEMPERIE", "PISO"]
 
 def filter_by_warehouse(dataframes):
     """
     Filter dataframes for a specific warehouse.
 
     Args:
-        dataframes (list of pd.DataFrame): The dataframes to filter.
+        dataframes (list of pd.DataFrame or DataFrameFilterIndex): The dataframes to filter, or an index built once
+            over them (e.g. load_clean_layer_index) so repeated selections don't rescan the tables.
 
     Returns:
         tuple: (entity_id, entity_name, filtered_dataframes)
     """
     # Display the list of warehouses
-    warehouses = ["BODA", "BODC", "BODE", "BODG", "BODJ", "OPL", "INCOHERENT VALUES", "DESCONOCIDO", "INTEMPERIE", "PISO"]
+    warehouses = WAREHOUSES
     print("List of warehouses:")
     for idx, warehouse in enumerate(warehouses):
         print(f"{idx}: {warehouse}")
@@ -20,7 +26,7 @@ def filter_by_warehouse(dataframes):
     try:
         selected_idx = input("Enter the number of the warehouse you want to analyze data by (or 'A' for All Warehouses): ").strip().upper()
         if selected_idx == 'A':
-            return None, "All Warehouses", dataframes
+            return None, "All Warehouses", list(getattr(dataframes, 'dataframes', dataframes))
         selected_idx = int(selected_idx)
         if selected_idx < 0 or selected_idx >= len(warehouses):
             raise ValueError(f"Invalid selection '{selected_idx}'")
@@ -36,4 +42,61 @@ def filter_by_warehouse(dataframes):
     # Filter dataframes by warehouse
     filtered_dataframes = filter_dataframes_by_warehouse(dataframes, entity_id)
 
-    return entity_id, entity_name, filtered_dataframes
\ No newline at end of file
+    return entity_id, entity_name, filtered_dataframes
+
+
+def _monthly_flows_by_warehouse(resumen_mensual, prefix):
+    # The monthly summaries name the warehouse column 'bodega' or 'Bodega' depending on its values
+    resumen_mensual = resumen_mensual.rename(columns={'bodega': 'Bodega'})
+    flows = resumen_mensual.groupby(['Bodega', 'month'])[['CBM', 'Pallets', 'Unidades']].sum()
+    return flows.rename(columns=lambda col: f'{prefix} {col}')
+
+
+def warehouse_month_cube(resumen_mensual_ingresos_clientes, resumen_mensual_despachos_clientes,
+                         warehouses=WAREHOUSES):
+    """
+    Receptions, dispatches, occupancy and KPIs for every warehouse and month in one grouped pass.
+
+    Takes the all-client monthly summaries (computed once from a single screened dataset) instead of
+    re-running the pipeline on a filtered copy per warehouse.
+
+    Args:
+        resumen_mensual_ingresos_clientes (pd.DataFrame): Output of `monthly_receptions_summary`.
+        resumen_mensual_despachos_clientes (pd.DataFrame): Output of `monthly_dispatch_summary`.
+        warehouses (list of str): Warehouses always present in the cube, even without movements.
+
+    Returns:
+        pd.DataFrame: One row per (Bodega, month) with inflow/outflow CBM, pallets and units, closing
+        occupancy in CBM and pallets, inventory turnover, days on hand and month-over-month inflow change.
+    """
+    inflows = _monthly_flows_by_warehouse(resumen_mensual_ingresos_clientes, 'Inflow')
+    outflows = _monthly_flows_by_warehouse(resumen_mensual_despachos_clientes, 'Outflow')
+    cube = inflows.join(outflows, how='outer')
+
+    # Complete warehouse x month grid so that running levels and MoM changes see every month
+    months = cube.index.get_level_values('month')
+    bodegas = list(warehouses) + sorted(set(cube.index.get_level_values('Bodega')) - set(warehouses))
+    grid = pd.MultiIndex.from_product(
+        [bodegas, pd.period_range(months.min(), months.max(), freq='M')], names=['Bodega', 'month'])
+    cube = cube.reindex(grid).fillna(0)
+
+    # Occupancy: running net flow per warehouse that never goes below zero (running-minimum identity)
+    for measure in ['CBM', 'Pallets']:
+        running = (cube[f'Inflow {measure}'] - cube[f'Outflow {measure}']).groupby(level='Bodega').cumsum()
+        floor = running.groupby(level='Bodega').cummin().clip(upper=0)
+        cube[f'Occupancy {measure}'] = running - floor
+
+    opening_cbm = cube.groupby(level='Bodega')['Occupancy CBM'].shift(1).fillna(0)
+    average_cbm = (opening_cbm + cube['Occupancy CBM']) / 2
+    days_in_month = cube.index.get_level_values('month').days_in_month
+
+    cube['Inventory Turnover'] = safe_divide(cube['Outflow CBM'], average_cbm).fillna(0)
+    cube['Days on Hand'] = safe_divide(cube['Occupancy CBM'], cube['Outflow CBM'] / days_in_month).fillna(0)
+    cube['Inflow MoM %'] = cube.groupby(level='Bodega')['Inflow CBM'].transform(pct_change_safe).fillna(0)
+
+    cube = cube.round(2).reset_index()
+
+    print("\nWarehouse x month operations cube:\n", cube)
+
+    return cube
+
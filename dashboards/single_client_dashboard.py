@@ -1,17 +1,18 @@
-from data.data_load import load_data
-from analysis_focus.client_focus import filter_by_client
-from data_processing.data_processing import data_processing
-from data_processing.data_screening import data_screening
+from data.clean_layer import ensure_clean_layer, load_clean_table, load_clean_layer
+from analysis_focus.client_focus import select_client
 from data_processing.monthly_summary import monthly_receptions_summary, monthly_dispatch_summary
 from utils.kpi_calculations import kpi_calculation
 from utils.inventory_proportions import inventory_proportions_by_product
 from utils.actual_inventory import inventory_oldest_products
-from data_processing.billing_reconstruction import billing_data_reconstruction
+from data_processing.period_billing import get_billing_history
+from data_processing.storage_billing import build_storage_accumulator
 from data_processing.inventory_behavior_reconstruction import reconstruct_inventory_over_time
+from data_processing.inventory_ledger import update_inventory_ledger
 from utils.date_utils import get_date_range
 from utils.grouping_functions import  group_by_month_bodega
 from utils.insaldo_complement import insaldo_bode_comp
 from utils.actual_inventory import capacity_measured_in_cubic_meters
+from utils.memory_profiler import is_memory_profiling_enabled, memory_report
 import pandas as pd
 
 # Specify default dates (optional)
@@ -23,45 +24,24 @@ start_date, end_date = get_date_range(default_start, default_end)
 
 print(f"Analysis will run for the range: {start_date.date()} to {end_date.date()}")
 
-# Step 1: Load Raw Data
-print("Loading data...")
-(wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
- inmovih_table, saldo_inventory, supplier_info, ctcentro_table, producto_modelos,
- dispatched_inventory, inventario_sin_filtro) = load_data()
+# Step 1: Screened data from the clean layer, rebuilt only when the raw exports changed
+print("Loading screened data...")
+ensure_clean_layer()
+supplier_info = load_clean_table('supplier_info')
 
 # Step 2: Client Focus Analysis
 print("Filtering data by client...")
-dataframes_to_filter = [
-    wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
-    inmovih_table, saldo_inventory, dispatched_inventory, inventario_sin_filtro
-]
-entity_id, entity_name, filtered_dataframes = filter_by_client(dataframes_to_filter, supplier_info)
+entity_id, entity_name = select_client(supplier_info)
 
-if not filtered_dataframes:
+if entity_id is None:
     print("No data available for the selected client.")
     exit()
 
-# Unpack filtered dataframes
-(wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
- inmovih_table, saldo_inventory, dispatched_inventory, inventario_sin_filtro) = filtered_dataframes
-
-# Step 3: Data Processing
-print("Processing data...")
+# Steps 3 and 4 (processing and screening) are already applied in the clean layer: only the partitions of the
+# selected client are read
 (wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
  inmovih_table, saldo_inventory, supplier_info, ctcentro_table, producto_modelos,
- dispatched_inventory, inventario_sin_filtro) = data_processing(
-    wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
-    inmovih_table, saldo_inventory, supplier_info, ctcentro_table, producto_modelos, dispatched_inventory,
-    inventario_sin_filtro
-)
-
-# Step 4: Data Screening
-print("Screening data...")
-(saldo_inventory, registro_ingresos, registro_salidas, rpsdt_productos, rpshd_despachos, wl_ingresos,
- inmovih_table, dispatched_inventory) = data_screening(
-    saldo_inventory, registro_ingresos, registro_salidas, rpsdt_productos, rpshd_despachos,
-    wl_ingresos, inmovih_table, dispatched_inventory
-)
+ dispatched_inventory, inventario_sin_filtro) = load_clean_layer(idcontacto=entity_id)
 
 pd.set_option(
     "display.max_rows", 100,
@@ -96,22 +76,46 @@ else:
     print("\nCannot proceed with inventory status calculations - Client currently has no "
           "product on any warehouse.\n")
 
-# Step 6: Billing Data Reconstruction
+# Step 6: Billing Data Reconstruction. The historical pallets and CBM are built once per dataset version; the
+# selected range is a query over them
 print("Reconstructing billing data...")
 if not saldo_inv_cliente_fact.empty:
-    inflow_with_mode_historical, outflow_with_mode_historical, final_df = billing_data_reconstruction(
+    billing_history = get_billing_history(
         saldo_inv_cliente_fact, resumen_mensual_ingresos_fact, resumen_despachos_cliente_fact,
-        start_date, end_date, registro_ingresos, supplier_info
+        registro_ingresos, supplier_info, idcontacto=entity_id
     )
+    inflow_with_mode_historical, outflow_with_mode_historical, final_df = (
+        billing_history.inflow, billing_history.outflow, billing_history.final_df)
+
+    inflow_grouped, outflow_grouped = billing_history.bill(start_date, end_date)
+    print("\nInflow billed for the selected range:\n", inflow_grouped)
+    print("\nOutflow billed for the selected range:\n", outflow_grouped)
+
+    print("\n Total Pallets and CBM count for the selected range:\n")
+    print("Pallets received:\n", inflow_grouped['Pallets'].sum())
+    print("CBM received:\n", inflow_grouped['CBM'].sum())
+    print("Pallets shipped:\n", outflow_grouped['Pallets'].sum())
+    print("CBM shipped:\n", outflow_grouped['CBM'].sum())
+    print("Pallets on inventory - Actual:\n", final_df['Pallets'].sum())
+    print("CBM on inventory - Actual:\n", final_df['CBM'].sum())
+
+    # Storage billed on pallet-days and CBM-days of the selected range, from the inflow / outflow movements
+    storage_accumulator = build_storage_accumulator(inflow_with_mode_historical, outflow_with_mode_historical)
+    storage_billed = storage_accumulator.bill(start_date, end_date, by=['idcontacto', 'Bodega'])
+    print("\nStorage billed for the selected range (pallet-days and CBM-days):\n", storage_billed)
 else:
     print("No inventory data available for billing reconstruction.")
     inflow_with_mode_historical, outflow_with_mode_historical = None, None
 
 # Step 7: Behavior Over Time
 if inflow_with_mode_historical is not None and outflow_with_mode_historical is not None:
+    # Daily ledger by client and warehouse, replayed only from the earliest day whose movements changed
+    inventory_ledger = update_inventory_ledger(inflow_with_mode_historical, outflow_with_mode_historical,
+                                               idcontacto=entity_id)
+
     print("Reconstructing inventory behavior over time...")
     inventory_over_time, inventory_ot_by_month = reconstruct_inventory_over_time(
-        inflow_with_mode_historical, outflow_with_mode_historical
+        inflow_with_mode_historical, outflow_with_mode_historical, ledger=inventory_ledger
     )
 else:
     print("Skipping inventory behavior reconstruction due to missing inflow/outflow data.")
@@ -123,4 +127,8 @@ if inventory_over_time is not None and not inventory_over_time.empty:
     print("Calculating KPIs...")
     kpis = kpi_calculation(inventory_over_time, inventory_ot_by_month, start_date, end_date)
 else:
-    print("Skipping KPI calculations due to missing inventory data.")
\ No newline at end of file
+    print("Skipping KPI calculations due to missing inventory data.")
+
+# Memory profile of the intermediate frames (only when OPS_MEMORY_PROFILE is set)
+if is_memory_profiling_enabled():
+    memory_report()
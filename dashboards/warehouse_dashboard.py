@@ -0,0 +1,52 @@
+from data.clean_layer import load_clean_layer
+from analysis_focus.warehouse_focus import warehouse_month_cube
+from data_processing.incremental_summary import incremental_receptions_summary, incremental_dispatch_summary
+from utils.date_utils import get_date_range
+from utils.memory_profiler import is_memory_profiling_enabled, memory_report
+import pandas as pd
+
+# Specify default dates (optional)
+default_start = '01/12/2024'
+default_end = '31/12/2024'
+
+# Get the date range from the user
+start_date, end_date = get_date_range(default_start, default_end)
+
+print(f"Analysis will run for the range: {start_date.date()} to {end_date.date()}")
+
+# Steps 1 to 3: Load, process and screen every client and warehouse. The screened tables come from the clean
+# layer, which is rebuilt only when the raw exports changed
+print("Loading screened data...")
+(wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
+ inmovih_table, saldo_inventory, supplier_info, ctcentro_table, producto_modelos,
+ dispatched_inventory, inventario_sin_filtro) = load_clean_layer()
+
+pd.set_option(
+    "display.max_rows", 100,
+    "display.max_columns", None,
+    "display.expand_frame_repr", False
+)
+
+# Step 4: Monthly Summaries for every client and warehouse. Only the months whose source rows changed since the
+# last run are recomputed, the others come from the summary store
+print("Generating monthly summaries...")
+resumen_mensual_ingresos_clientes = incremental_receptions_summary(
+    registro_ingresos, supplier_info, inventario_sin_filtro, rpsdt_productos
+)
+resumen_mensual_despachos_clientes_grouped = incremental_dispatch_summary(
+    registro_salidas, dispatched_inventory, supplier_info
+)
+
+# Step 5: Warehouse x month cube (receptions, dispatches, occupancy and KPIs for all warehouses)
+if not resumen_mensual_ingresos_clientes.empty and not resumen_mensual_despachos_clientes_grouped.empty:
+    warehouse_cube = warehouse_month_cube(resumen_mensual_ingresos_clientes, resumen_mensual_despachos_clientes_grouped)
+
+    selected_months = (warehouse_cube['month'] >= start_date.to_period('M')) & (
+            warehouse_cube['month'] <= end_date.to_period('M'))
+    print("\nWarehouse KPIs for the selected months:\n", warehouse_cube[selected_months])
+else:
+    print("\nCannot build the warehouse cube due to lack of data.\n")
+
+# Memory profile of the intermediate frames (only when OPS_MEMORY_PROFILE is set)
+if is_memory_profiling_enabled():
+    memory_report()
@@ -1 +1,5 @@
-from .data_load import load_data
\ No newline at end of file
+from .data_load import load_data
+from .clean_layer import (
+    load_clean_layer, load_clean_layer_index, load_clean_table, ensure_clean_layer, build_clean_layer,
+    clean_layer_is_current, run_screening_pipeline, CLEAN_LAYER_TABLES
+)
@@ -0,0 +1,409 @@
+from rich.progress import Progress
+from datetime import datetime
+from utils import get_base_path, get_base_output_path, parse_date_column, DataFrameFilterIndex
+from data.data_load import load_data
+from data_processing import data_processing, data_screening
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # Sin pyarrow la capa limpia se mantiene solo en memoria durante la ejecución
+    pa = None
+    ds = None
+
+# Exportaciones crudas de las que depende la capa limpia (MOBU, BODC '_c' y BODE '_e')
+SOURCE_FILES = [
+    f'{table}{suffix}.csv'
+    for suffix in ('', '_c', '_e')
+    for table in ('cohd', 'rpshd', 'rpsdt', 'incompra', 'inmovid', 'inmovih', 'insaldo', 'inmodelo', 'ctcentro',
+                  'incontac')
+]
+
+# Tables in the order returned by load_data / data_processing
+CLEAN_LAYER_TABLES = [
+    'wl_ingresos', 'rpshd_despachos', 'rpsdt_productos', 'registro_ingresos', 'registro_salidas', 'inmovih_table',
+    'saldo_inventory', 'supplier_info', 'ctcentro_table', 'producto_modelos', 'dispatched_inventory',
+    'inventario_sin_filtro',
+]
+
+# Dimension tables are stored whole; every other table is partitioned by site, client and year-month
+DIMENSION_TABLES = ['supplier_info', 'ctcentro_table', 'producto_modelos']
+
+# Site of each client, from the suffix load_data appends to idcontacto
+SITE_SUFFIXES = [('_c', 'BODC'), ('_e', 'BODE')]
+DEFAULT_SITE = 'MOBU'
+
+PARTITION_COLUMNS = ['site', 'client', 'year_month']
+NO_CLIENT = 'SIN_CLIENTE'
+NO_DATE = 'SIN_FECHA'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 2
+
+# Tables of the current run when pyarrow is not available
+_memory_layer = {}
+
+# Filter indexes over the loaded layer, one per build and set of filters, dropped when the layer is rebuilt
+_filter_indexes = {}
+
+
+def get_clean_layer_path():
+    return os.path.join(get_base_output_path(), 'clean_layer')
+
+
+def _file_sha256(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_snapshot(base_path=None, previous=None):
+    """
+    Describe the raw exports the clean layer is built from.
+
+    Args:
+        base_path (str, optional): Folder of the raw CSV exports. Defaults to get_base_path().
+        previous (dict, optional): Snapshot of a previous build. Files whose size and mtime did not change reuse
+            its hash instead of being read again.
+
+    Returns:
+        dict: {file name: {'size', 'mtime', 'sha256'}} for every source file that exists.
+    """
+    base_path = base_path or get_base_path()
+    previous = previous or {}
+    snapshot = {}
+    for name in SOURCE_FILES:
+        file_path = os.path.join(base_path, name)
+        if not os.path.exists(file_path):
+            continue
+        stat = os.stat(file_path)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        old = previous.get(name, {})
+        if old.get('size') == entry['size'] and old.get('mtime') == entry['mtime'] and old.get('sha256'):
+            entry['sha256'] = old['sha256']
+        else:
+            entry['sha256'] = _file_sha256(file_path)
+        snapshot[name] = entry
+    return snapshot
+
+
+def read_manifest(path=None):
+    manifest_path = os.path.join(path or get_clean_layer_path(), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as handle:
+        return json.load(handle)
+
+
+def clean_layer_is_current(path=None, base_path=None):
+    """
+    Check whether the persisted clean layer was built from the current raw exports.
+
+    Only files whose size or mtime changed are hashed again, so an untouched export costs one stat call.
+
+    Returns:
+        bool: True if the layer exists and every source file has the same content as when it was built.
+    """
+    manifest = read_manifest(path)
+    if manifest is None or manifest.get('version') != MANIFEST_VERSION:
+        return False
+    sources = manifest.get('sources', {})
+    snapshot = source_snapshot(base_path, sources)
+    current = {name: entry['sha256'] for name, entry in snapshot.items()} == \
+        {name: entry['sha256'] for name, entry in sources.items()}
+
+    if current and snapshot != sources:
+        # Touched but unchanged exports: record the new mtimes so they are not hashed again next run
+        manifest['sources'] = snapshot
+        with open(os.path.join(path or get_clean_layer_path(), MANIFEST_NAME), 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+    return current
+
+
+def _site_of(client):
+    site = pd.Series(DEFAULT_SITE, index=client.index, dtype=object)
+    for suffix, name in reversed(SITE_SUFFIXES):
+        site = site.mask(client.str.endswith(suffix), name)
+    return site
+
+
+def _client_columns(columns):
+    # Same columns the client filters have always matched: every column whose name contains 'idcontacto'
+    return [col for col in columns if 'idcontacto' in col]
+
+
+def _partition_keys(df):
+    """
+    Partition keys of every row: site (from the idcontacto suffix), client and year-month of `fecha`.
+    The client comes from the first idcontacto column; tables without idcontacto or fecha get a constant key in
+    that level.
+    """
+    keys = pd.DataFrame(index=df.index)
+    client_columns = _client_columns(df.columns)
+    if client_columns:
+        raw_client = df[client_columns[0]]
+        client = raw_client.astype(str).str.strip()
+        client = client.mask(raw_client.isna() | client.isin(['', 'nan']), NO_CLIENT)
+    else:
+        client = pd.Series(NO_CLIENT, index=df.index, dtype=object)
+    keys['site'] = _site_of(client)
+    keys['client'] = client
+    if 'fecha' in df.columns:
+        fecha = parse_date_column(df['fecha'], dayfirst=False, errors='coerce')
+        keys['year_month'] = fecha.dt.strftime('%Y-%m').fillna(NO_DATE)
+    else:
+        keys['year_month'] = NO_DATE
+    return keys
+
+
+def _rows_of_clients(df, client_columns, idcontacto):
+    """
+    Rows where any of `client_columns` equals one of the requested clients (after stripping), as
+    filter_dataframes_by_idcontacto selects them.
+    """
+    clients = [str(client).strip() for client in ([idcontacto] if isinstance(idcontacto, str) else idcontacto)]
+    mask = np.zeros(len(df), dtype=bool)
+    for col in client_columns:
+        mask |= df[col].astype(str).str.strip().isin(clients).to_numpy()
+    return df[mask]
+
+
+def _parquet_safe(df):
+    """
+    Cast object columns holding mixed Python types to strings (missing values stay missing) so pyarrow can
+    store them as one column type.
+    """
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ('mixed', 'mixed-integer', 'mixed-integer-float'):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _partition_filters(idcontacto=None, sites=None, start_month=None, end_month=None):
+    filters = []
+    if idcontacto is not None:
+        clients = [idcontacto] if isinstance(idcontacto, str) else list(idcontacto)
+        filters.append(('client', 'in', [str(client).strip() for client in clients]))
+    if sites is not None:
+        filters.append(('site', 'in', [sites] if isinstance(sites, str) else list(sites)))
+    if start_month is not None:
+        filters.append(('year_month', '>=', str(pd.Period(start_month, freq='M'))))
+    if end_month is not None:
+        filters.append(('year_month', '<=', str(pd.Period(end_month, freq='M'))))
+    if start_month is not None or end_month is not None:
+        filters.append(('year_month', '!=', NO_DATE))
+    return filters
+
+
+def _apply_filters(df, filters):
+    """
+    In-memory equivalent of the partition filters, for the layer kept in memory.
+    """
+    if not filters:
+        return df
+    keys = _partition_keys(df)
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in filters:
+        if op == 'in':
+            mask &= keys[col].isin(value).to_numpy()
+        elif op == '>=':
+            mask &= (keys[col] >= value).to_numpy()
+        elif op == '<=':
+            mask &= (keys[col] <= value).to_numpy()
+        elif op == '!=':
+            mask &= (keys[col] != value).to_numpy()
+    return df[mask]
+
+
+def build_clean_layer(tables, path=None, sources=None):
+    """
+    Persist the screened tables as a partitioned parquet dataset with a manifest of their source exports.
+
+    The layer is written to a temporary folder and swapped in once complete, so a failed build never leaves a
+    half-written layer behind.
+
+    Args:
+        tables (dict): {table name: DataFrame} for every name in CLEAN_LAYER_TABLES.
+        path (str, optional): Root of the clean layer. Defaults to get_clean_layer_path().
+        sources (dict, optional): Source snapshot to record. Defaults to the current snapshot.
+    """
+    path = path or get_clean_layer_path()
+    sources = sources if sources is not None else source_snapshot()
+    _filter_indexes.clear()
+
+    if pa is None:
+        print("pyarrow is not installed: the clean layer is kept in memory for this run only.")
+        _memory_layer.clear()
+        _memory_layer.update(tables)
+        return
+
+    staging_path = f"{path}.building"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    os.makedirs(staging_path)
+
+    table_info = {}
+    with Progress() as progress:
+        task = progress.add_task("[green]Writing clean layer: ", total=len(CLEAN_LAYER_TABLES))
+
+        for name in CLEAN_LAYER_TABLES:
+            df = _parquet_safe(tables[name].reset_index(drop=True))
+            if name in DIMENSION_TABLES:
+                df.to_parquet(os.path.join(staging_path, f'{name}.parquet'), index=False)
+                table_info[name] = {'rows': len(df), 'partition_cols': []}
+            else:
+                client_columns = _client_columns(df.columns)
+                df = pd.concat([df, _partition_keys(df)], axis=1)
+                df.to_parquet(os.path.join(staging_path, name), index=False, partition_cols=PARTITION_COLUMNS,
+                              max_partitions=1_000_000)
+                table_info[name] = {'rows': len(df), 'partition_cols': PARTITION_COLUMNS,
+                                    'client_columns': client_columns}
+
+            progress.update(task, advance=1)
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'sources': sources,
+        'tables': table_info,
+    }
+    with open(os.path.join(staging_path, MANIFEST_NAME), 'w') as handle:
+        json.dump(manifest, handle, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging_path, path)
+    print(f"\nClean layer written to {path}\n")
+
+
+def run_screening_pipeline():
+    """
+    Raw exports -> data_processing -> data_screening, for every client and warehouse.
+
+    Returns:
+        dict: {table name: DataFrame} for every name in CLEAN_LAYER_TABLES.
+    """
+    (wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
+     inmovih_table, saldo_inventory, supplier_info, ctcentro_table, producto_modelos,
+     dispatched_inventory, inventario_sin_filtro) = load_data()
+
+    (wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
+     inmovih_table, saldo_inventory, supplier_info, ctcentro_table, producto_modelos,
+     dispatched_inventory, inventario_sin_filtro) = data_processing(
+        wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas,
+        inmovih_table, saldo_inventory, supplier_info, ctcentro_table, producto_modelos, dispatched_inventory,
+        inventario_sin_filtro
+    )
+
+    (saldo_inventory, registro_ingresos, registro_salidas, rpsdt_productos, rpshd_despachos, wl_ingresos,
+     inmovih_table, dispatched_inventory) = data_screening(
+        saldo_inventory, registro_ingresos, registro_salidas, rpsdt_productos, rpshd_despachos,
+        wl_ingresos, inmovih_table, dispatched_inventory
+    )
+
+    return dict(zip(CLEAN_LAYER_TABLES, (
+        wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos, registro_salidas, inmovih_table,
+        saldo_inventory, supplier_info, ctcentro_table, producto_modelos, dispatched_inventory, inventario_sin_filtro
+    )))
+
+
+def ensure_clean_layer(path=None, rebuild=False):
+    """
+    Rebuild the clean layer if it is missing or the raw exports changed since it was built.
+
+    Returns:
+        bool: True if the layer was rebuilt.
+    """
+    if pa is None:
+        if _memory_layer and not rebuild:
+            return False
+    elif not rebuild and clean_layer_is_current(path):
+        return False
+
+    manifest = read_manifest(path) if pa is not None else None
+    sources = source_snapshot(previous=manifest.get('sources') if manifest else None)
+    build_clean_layer(run_screening_pipeline(), path, sources)
+    return True
+
+
+def load_clean_table(name, idcontacto=None, sites=None, start_month=None, end_month=None, path=None):
+    """
+    Read one table of the clean layer, reading only the partitions that match the filters.
+
+    Args:
+        name (str): Table name, one of CLEAN_LAYER_TABLES.
+        idcontacto (str or list, optional): Client(s) to keep.
+        sites (str or list, optional): Sites to keep ('MOBU', 'BODC', 'BODE').
+        start_month, end_month (str or pd.Period, optional): Month range of `fecha` to keep. Rows without a date
+            are dropped when a month range is given.
+        path (str, optional): Root of the clean layer.
+
+    Returns:
+        pd.DataFrame: The screened table. Dimension tables and tables without a client column are returned for
+        every client and site.
+    """
+    if name in DIMENSION_TABLES:
+        if pa is None:
+            return _memory_layer[name].copy()
+        return pd.read_parquet(os.path.join(path or get_clean_layer_path(), f'{name}.parquet'))
+
+    if pa is None:
+        client_columns = _client_columns(_memory_layer[name].columns)
+    else:
+        path = path or get_clean_layer_path()
+        client_columns = read_manifest(path)['tables'][name]['client_columns']
+
+    # Only tables with a single client column can be selected by the client partition alone; with several, a row
+    # belongs to a client if any of them matches, so those rows are selected after reading. Tables without a client
+    # column (rpshd_despachos) have no client or site to filter on
+    partition_client = idcontacto if len(client_columns) == 1 else None
+    partition_sites = sites if client_columns else None
+    filters = _partition_filters(partition_client, partition_sites, start_month, end_month)
+
+    if pa is None:
+        df = _apply_filters(_memory_layer[name], filters).copy()
+    else:
+        partitioning = ds.partitioning(pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS]),
+                                       flavor='hive')
+        df = pd.read_parquet(os.path.join(path, name), filters=filters or None, partitioning=partitioning)
+        df = df.drop(columns=PARTITION_COLUMNS)
+
+    if idcontacto is not None and len(client_columns) > 1:
+        df = _rows_of_clients(df, client_columns, idcontacto)
+    return df.reset_index(drop=True)
+
+
+def load_clean_layer(idcontacto=None, sites=None, start_month=None, end_month=None, path=None, rebuild=False):
+    """
+    Screened tables for the downstream analyses, rebuilt first if the raw exports changed.
+
+    Returns:
+        tuple: The tables in the same order as load_data / data_processing.
+    """
+    ensure_clean_layer(path, rebuild)
+    return tuple(load_clean_table(name, idcontacto, sites, start_month, end_month, path)
+                 for name in CLEAN_LAYER_TABLES)
+
+
+def load_clean_layer_index(sites=None, start_month=None, end_month=None, path=None, rebuild=False):
+    """
+    DataFrameFilterIndex over the screened tables of every client, built once per loaded layer so client and
+    warehouse selections (filter_by_client, filter_by_warehouse) and batch runs over all clients
+    (DataFrameFilterIndex.selections) share it instead of rescanning the tables.
+
+    Returns:
+        DataFrameFilterIndex: Index over the tables of load_clean_layer, in the same order.
+    """
+    ensure_clean_layer(path, rebuild)
+    built_at = read_manifest(path).get('built_at') if pa is not None else None
+    key = (path, built_at, str(sites), str(start_month), str(end_month))
+    if key not in _filter_indexes:
+        _filter_indexes[key] = DataFrameFilterIndex(
+            load_clean_table(name, None, sites, start_month, end_month, path) for name in CLEAN_LAYER_TABLES)
+    return _filter_indexes[key]
@@ -1,6 +1,23 @@
-from .warehouse_handler import resolve_bodega, handle_unknown_bodega
+from .location_rules import (
+    asignar_ubicacion, asignar_ubicaciones, override_bodega_by_idcontacto, LOCATION_RULES,
+    IDCONTACTO_BODEGA_OVERRIDES
+)
+from .warehouse_handler import (
+    resolve_bodega, resolve_bodega_column, handle_unknown_bodega, single_warehouse_clients, fill_unknown_bodega
+)
+from .pallet_modes import (
+    estimate_pallet_modes, load_pallet_mode_overrides, pallet_mode_overrides_version, attach_pallet_modes
+)
+from .dimension_lookups import DimensionLookups, normalize_idingreso
 from .billing_reconstruction import billing_data_reconstruction
 from .data_processing import data_processing
 from .data_screening import data_screening
+from .inventory_ledger import (
+    daily_inventory_flows, replay_ledger, update_inventory_ledger, monthly_inventory_ledger, company_inventory_levels,
+    ledger_levels_on, client_initial_inventory
+)
 from .inventory_behavior_reconstruction import reconstruct_inventory_over_time
 from .monthly_summary import monthly_dispatch_summary, monthly_receptions_summary
+from .incremental_summary import incremental_receptions_summary, incremental_dispatch_summary
+from .period_billing import BillingHistory, get_billing_history
+from .storage_billing import StorageBillingAccumulator, build_storage_accumulator
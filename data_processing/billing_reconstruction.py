@@ -1,16 +1,17 @@
-import os
-from utils import get_base_output_path
+from utils import memory_checkpoint, consolidate_actual_inventory
+from data_processing.dimension_lookups import DimensionLookups
+from data_processing.pallet_modes import (
+    estimate_pallet_modes, load_pallet_mode_overrides, attach_pallet_modes
+)
 from rich.progress import Progress
 import time
 import pandas as pd
 import random
 import numpy as np
-from datetime import datetime
-import socket
 
 
 def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos_fact, resumen_despachos_cliente_fact,
-                                start_date, end_date, registro_ingresos, supplier_info):
+                                start_date, end_date, registro_ingresos, supplier_info, lookups=None, verbose=True):
 
     with Progress() as progress:
         # Add a new task
@@ -20,15 +21,9 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
         resumen_despachos_cliente_fact['fecha_x'] = pd.to_datetime(resumen_despachos_cliente_fact['fecha_x'])
         resumen_mensual_ingresos_fact['ddma'] = resumen_mensual_ingresos_fact['ddma'].fillna("")
 
-        supplier_info = supplier_info.loc[:,['idcontacto', 'descrip']]
-
-        supplier_info['idcontacto'] = supplier_info['idcontacto'].fillna("")
-        supplier_info['descrip'] = supplier_info['descrip'].fillna("")
-
-        # Step 3: Rename columns as needed
-        supplier_info = supplier_info.rename(columns={
-            'descrip': 'Client'
-        })
+        # idingreso -> OC description and idcontacto -> Client, built once per dataset
+        if lookups is None:
+            lookups = DimensionLookups(registro_ingresos, supplier_info)
 
         # Step:
         time.sleep(1)  # Simulate a task
@@ -42,95 +37,57 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
 
         # *** INFLOW CBM AND PALLETS ***
 
-        # Replace values in 'idubica1' that start with 'R' with an empty string
-        saldo_inv_cliente_fact['idubica1'] = saldo_inv_cliente_fact['idubica1'].str.replace(r'^R.*', '', regex=True)
-        saldo_inv_cliente_fact['idubica1'] = saldo_inv_cliente_fact['idubica1'].str.replace(r'^TM.*', '', regex=True)
-
-        # Replace values in 'idubica1' that do not start with 'TA' with an empty string
-        mask = ~saldo_inv_cliente_fact['idubica1'].str.startswith('TA', na=False)
-        saldo_inv_cliente_fact.loc[mask, 'idubica1'] = ''
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Fill empty values in 'idubica1' with random and unique values
-        empty_indices = saldo_inv_cliente_fact[saldo_inv_cliente_fact['idubica1'] == ''].index
-
-        # Generate unique random values using random.sample(), which guarantees uniqueness
-        unique_values = random.sample(range(1, 1000000), len(empty_indices))
-
-        # Convert to strings and assign back to the empty slots
-        unique_values = [str(value) for value in unique_values]
-        saldo_inv_cliente_fact.loc[empty_indices, 'idubica1'] = unique_values
+        normalize_pallet_locations(saldo_inv_cliente_fact)
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        inflow_with_mode_clean = saldo_inv_cliente_fact.dropna(subset=['idmodelo', 'idubica1'])
+        progress.update(task, advance=2)
 
-        # Step 1: Group by 'idmodelo' and 'idubica1' to count occurrences
-        grouped_by_idubica1 = inflow_with_mode_clean[saldo_inv_cliente_fact['idubica1'].notna()].groupby(
-            ['idmodelo', 'idubica1']).size().reset_index(name='count')
+        # Step 1: Modal number of rows per pallet location of every idmodelo, shared by the inflow and the outflow
+        pallet_modes = estimate_pallet_modes(saldo_inv_cliente_fact)
 
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Step 2: Find the mode of the count for each idmodelo
-        mode_grouping = grouped_by_idubica1.groupby('idmodelo')['count'].agg(lambda x: x.mode()[0]).reset_index(
-            name='mode_count')
+        # Step 2: Manual overrides from 'pallet_mode_KC.xlsx', when available on this host
+        pallet_mode_overrides = load_pallet_mode_overrides()
 
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Step 3: Merge mode count with the inflow data (resumen_mensual_ingresos_fact)
-        inflow_with_mode = pd.merge(resumen_mensual_ingresos_fact, mode_grouping, on='idmodelo', how='left')
+        # Step 3: Mode count of the inflow data (resumen_mensual_ingresos_fact)
+        inflow_with_mode = resumen_mensual_ingresos_fact.reset_index(drop=True)
 
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Step 4: Fill missing mode_count with a default value (e.g., 1 if no grouping is available)
-        inflow_with_mode['mode_count'] = inflow_with_mode['mode_count'].fillna(1)
+        # Step 4: Missing mode_count defaults to 1 if no grouping is available
+        attach_pallet_modes(inflow_with_mode, pallet_modes)
 
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
         # Step 5: Calculate the number of rows per idingreso and idmodelo (consider specific products within each ingreso)
-        df_grouped = inflow_with_mode.groupby(['idingreso', 'idmodelo']).size().reset_index(name='num_rows')
+        pallet_groups = [inflow_with_mode['idingreso'], inflow_with_mode['idmodelo']]
+        inflow_with_mode['num_rows'] = inflow_with_mode['idingreso'].groupby(pallet_groups).transform('size')
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 6: Merge the number of rows per idingreso and idmodelo back into the inflow_with_mode dataframe
-        inflow_with_mode = pd.merge(inflow_with_mode, df_grouped, on=['idingreso', 'idmodelo'], how='left')
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
-        # Step 7: Calculate the number of pallets by dividing the num_rows by mode_count
-        inflow_with_mode['pallets'] = (inflow_with_mode['num_rows'] / inflow_with_mode['mode_count']).apply(np.ceil)
+        # Step 6: Calculate the number of pallets by dividing the num_rows by mode_count
+        inflow_with_mode['pallets'] = np.ceil(inflow_with_mode['num_rows'] / inflow_with_mode['mode_count'])
 
-        # Step 8: Group by idingreso and idmodelo to get the correct number of pallets for each combination
-        pallets_per_ingreso = inflow_with_mode.groupby(['idingreso', 'idmodelo'])['pallets'].first().reset_index()
+        # Step 7: Correct number of pallets for each combination of idingreso and idmodelo
+        inflow_with_mode['pallets_final'] = inflow_with_mode['pallets'].groupby(pallet_groups).transform('first')
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 9: Merge the pallet count back to the original dataframe
-        inflow_with_mode = pd.merge(inflow_with_mode, pallets_per_ingreso[['idingreso', 'idmodelo', 'pallets']],
-                                    on=['idingreso', 'idmodelo'], how='left', suffixes=('', '_final'))
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
         inflow_with_mode['inicial'] = pd.to_numeric(inflow_with_mode['inicial'], errors='coerce')
         inflow_with_mode['pallets_final'] = pd.to_numeric(inflow_with_mode['pallets_final'], errors='coerce').astype(
@@ -142,13 +99,9 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Step 1: Define a function to apply the conditional logic
-        def choose_pallets(row):
-            # If pallet_oficial is available, use it; otherwise, use pallets_final
-            return row['pallet_oficial'] if not pd.isna(row['pallet_oficial']) else row['pallets_final']
-
-        # Step 2: Apply the custom function
-        inflow_with_mode['pallets_final'] = inflow_with_mode.apply(choose_pallets, axis=1)
+        # If pallet_oficial is available, use it; otherwise, use pallets_final
+        inflow_with_mode['pallets_final'] = inflow_with_mode['pallet_oficial'].where(
+            inflow_with_mode['pallet_oficial'].notna(), inflow_with_mode['pallets_final'].astype('float64'))
 
         # Ensure all values in 'ddma' are numeric, and replace any non-numeric values with NaN
         inflow_with_mode['ddma'] = pd.to_numeric(inflow_with_mode['ddma'], errors='coerce')
@@ -164,26 +117,14 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Define a function to adjust the pallet count for each group
-        def adjust_pallets_final(group):
-            # Count the number of rows with 'ddma' > 0
-            num_splits = (group['ddma'] > 0).sum()
-
-            # Subtract the number of splits from the initial pallet count (applies to all rows in the group)
-            adjusted_pallets = group['pallets'].iloc[0] - num_splits
-
-            # Assign the adjusted value to 'pallets_final' for all rows in the group
-            group['pallets_final'] = adjusted_pallets
-
-            return group
-
-        # Group by 'idingreso' and 'idmodelo' and apply the adjustment function
-        inflow_with_mode = inflow_with_mode.groupby(['idingreso', 'idmodelo'], group_keys=False).apply(
-            adjust_pallets_final)
-
-        # Reset the index after applying the group operation to ensure grouping columns are retained
-        if 'idingreso' not in inflow_with_mode.columns or 'idmodelo' not in inflow_with_mode.columns:
-            inflow_with_mode = inflow_with_mode.reset_index()
+        # Adjust the pallet count of every (idingreso, idmodelo): the first pallet count minus the number of rows with
+        # 'ddma' > 0 (splits), for all rows of the group. Rows without idingreso or idmodelo have no group
+        pallet_keys = ['idingreso', 'idmodelo']
+        inflow_with_mode = inflow_with_mode.dropna(subset=pallet_keys)
+        pallet_groups = [inflow_with_mode[key] for key in pallet_keys]
+        num_splits = (inflow_with_mode['ddma'] > 0).groupby(pallet_groups).transform('sum')
+        inflow_with_mode['pallets_final'] = inflow_with_mode['pallets'].groupby(pallet_groups).transform('first') - \
+            num_splits
 
         # Ensure that the pallet count is not less than zero after adjustment
         inflow_with_mode['pallets_final'] = inflow_with_mode['pallets_final'].clip(lower=0)
@@ -194,6 +135,7 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
 
         # Keep the historical df for further purposes.
         inflow_with_mode_historical = inflow_with_mode
+        memory_checkpoint('billing_data_reconstruction: inflow pallets', inflow_with_mode_historical=inflow_with_mode)
 
         # Filter data within the date range
         inflow_with_mode = inflow_with_mode[
@@ -205,34 +147,8 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Step 3: Rename columns as needed
-        inflow_with_mode = inflow_with_mode.rename(columns={
-            'fecha_x': 'Date',
-            'descrip': 'Description',
-            'Bodega': 'Warehouse',
-            'inicial': 'CBM',
-            'pesokgs': 'Weight or Units',
-            'pallets_final': 'Pallets'
-        })
-
-        # Ensure 'idingreso' is not part of the index before performing groupby
-        if 'idingreso' in inflow_with_mode.index.names:
-            inflow_with_mode.reset_index(drop=True, inplace=True)
-
-            # Step:
-            time.sleep(1)  # Simulate a task
-            progress.update(task, advance=1)
-
-        # Step 4: Final grouping by 'idingreso' and 'idmodelo' to aggregate relevant columns
-        inflow_grouped = inflow_with_mode.groupby(['idingreso', 'idmodelo']).agg({
-            'Date': 'first',
-            'Description': 'first',
-            'CBM': 'sum',
-            'Pallets': 'min',
-            'Weight or Units': 'sum',
-            'Warehouse': 'first'
-
-        }).reset_index()
+        # Steps 3 and 4: Final grouping by 'idingreso' and 'idmodelo'
+        inflow_grouped = group_inflow_for_billing(inflow_with_mode)
 
         # Step:
         time.sleep(1)  # Simulate a task
@@ -250,254 +166,51 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
 
         # *** ACTUAL INVENTORY DATAFRAME ***
 
-        # Step 1: Filter rows where 'idubica1' is not blank, not NaN, and does not start with 'R'
-        filtered_df = saldo_inv_cliente_fact[
-            saldo_inv_cliente_fact['idubica1'].notna() &  # Not NaN
-            (saldo_inv_cliente_fact['idubica1'] != '') &  # Not blank
-            ~saldo_inv_cliente_fact['idubica1'].str.startswith('R') &  # Does not start with 'R'
-            ~saldo_inv_cliente_fact['idubica1'].str.startswith('TM')  # Does not start with 'R'
-            ]
+        # One pallet per tagged location and per row without a location, consolidated by idingreso
+        final_df, _ = consolidate_actual_inventory(saldo_inv_cliente_fact)
+        memory_checkpoint('billing_data_reconstruction: actual inventory', saldo_inv_cliente_fact=saldo_inv_cliente_fact,
+                          final_df=final_df)
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # output_path = os.path.join(get_base_output_path(), 'saldo_inv_cliente_fact.csv')
-        # saldo_inv_cliente_fact.to_csv(output_path, index=False)
-        # output_path = os.path.join(get_base_output_path(), 'filtered_df.csv')
-        # filtered_df.to_csv(output_path, index=False)
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 2: Create a 'pallets' column with value 1 for each row
-        filtered_df['pallets'] = 1
-
-        if 'dup_key' not in filtered_df.columns:
-            filtered_df['dup_key'] = filtered_df['idingreso'] + filtered_df['itemno']
-
-
-        # Step 3: Group by 'idubica1' and aggregate columns
-        grouped_df = filtered_df.groupby('idubica1').agg({
-            'idcentro': 'first',
-            'idbodega': 'first',
-            'idingreso': 'first',
-            'itemno': 'last',
-            'idstatus': 'first',
-            'fecha': 'first',
-            'idcontacto': 'first',
-            'idubica': 'first',
-            'pesokgs': 'sum',  # Summing numerical columns
-            'inicial': 'sum',  # Summing 'inicial'
-            'salidas': 'sum',  # Summing 'salidas'
-            'bodega': 'first',
-            'dup_key': 'first',
-            'pallets': 'count'  # Summing 'pallets', which should now be 1 for each row
-        }).reset_index()
-
-        # Step 4: Get the rows where 'idubica1' is blank or starts with 'R'
-        remaining_df = saldo_inv_cliente_fact[
-            saldo_inv_cliente_fact['idubica1'].isna() |
-            (saldo_inv_cliente_fact['idubica1'] == '') |
-            saldo_inv_cliente_fact['idubica1'].str.startswith('R') &  # Does not start with 'R'
-            saldo_inv_cliente_fact['idubica1'].str.startswith('TM')  # Does not start with 'R'
-            ]
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 5: Assign 'pallets' = 1 for rows without 'idubica1' or starting with 'R'
-        remaining_df['pallets'] = 1
-
-        # Step 6: Concatenate the grouped rows with the remaining rows
-        final_df = pd.concat([grouped_df, remaining_df]).reset_index(drop=True)
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 7: Group by 'idingreso' and aggregate columns (final)
-        final_df = final_df.groupby('idingreso').agg({
-            'itemno': 'first',
-            'dup_key': 'first',
-            'fecha': 'first',
-            'idcontacto': 'first',
-            'idubica': 'first',
-            'inicial': 'sum',  # Summing 'inicial'
-            'pallets': 'count',
-            'pesokgs': 'sum',  # Summing numerical columns
-            'bodega': 'first',
-        }).reset_index()
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Add the 'Days' column that calculates the number of days from the 'Date' to the current date
-        final_df['fecha'] = pd.to_datetime(final_df['fecha']).dt.date
-        final_df['Days'] = (datetime.now().date() - pd.to_datetime(final_df['fecha']).dt.date).apply(
-            lambda x: x.days) + 1
-
-        final_df = final_df.rename(columns={
-            'fecha': 'Date',
-            'idubica': 'locationID',
-            'idubica1': 'Tarima',
-            'inicial': 'CBM',
-            'pesokgs': 'Weight or Units',
-            'bodega': 'Warehouse',
-            'idcontacto': 'ClientID',
-            'idcoldis': 'ProductID',
-            'pallets': 'Pallets',
-            'dup_key': 'Label'
-
-        })
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=7)
 
         # output_path = os.path.join(get_base_output_path(), 'final_inventory_dataframe.csv')
         # final_df.to_csv(output_path, index=False)
 
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
         # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
         # *** OUTFLOW CBM AND PALLETS ***
 
-        # Step 1: Drop rows with NaN or missing values for 'idmodelo' and 'idubica1' in saldo_inv_cliente_fact
-        saldo_clean = saldo_inv_cliente_fact.dropna(subset=['idmodelo', 'idubica1'])
-
-        # Step 2: Filter rows in 'saldo_inv_cliente_fact' where 'idubica1' is not blank, NaN, or starting with 'R'
-        filtered_saldo = saldo_clean[saldo_clean['idubica1'].notna() &
-                                     (saldo_clean['idubica1'] != '') &
-                                     ~saldo_clean['idubica1'].str.startswith('R') &  # Does not start with 'R'
-                                     ~saldo_inv_cliente_fact['idubica1'].str.startswith(
-                                         'TM')]  # Does not start with 'R'
-
-
+        # Steps 1 to 4: The 'idubica1' of saldo_inv_cliente_fact were already normalized for the inflow (no blank,
+        # 'R' or 'TM' locations left), so the outflow uses the same pallet modes
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=3)
 
-        # Step 3: Group by 'idmodelo' and 'idubica1' to count occurrences in saldo_inv_cliente_fact
-        grouped_by_idubica1_saldo = filtered_saldo.groupby(['idmodelo', 'idubica1']).size().reset_index(name='count')
-
-        # output_path = os.path.join(get_base_output_path(), 'grouped_by_idubica1_saldo.csv')
-        # grouped_by_idubica1_saldo.to_csv(output_path, index=False)
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 4: Find the mode of the count for each 'idmodelo'
-        mode_grouping_saldo = grouped_by_idubica1_saldo.groupby('idmodelo')['count'].agg(
-            lambda x: x.mode()[0]).reset_index(
-            name='mode_count')
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 5: Merge the mode count with the outflow data (resumen_despachos_cliente_fact) using 'idmodelo_x'
-        outflow_with_mode = pd.merge(resumen_despachos_cliente_fact, mode_grouping_saldo, left_on='idmodelo_x',
-                                     right_on='idmodelo', how='left')
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 6: Fill missing 'mode_count' with a default value (e.g., 1 if no grouping is available)
-        outflow_with_mode['mode_count'] = outflow_with_mode['mode_count'].fillna(1)
-
-        """
-        Returns the appropriate file path to the 'pallet_mode_KC.xlsx' depending on the operating system.
-        """
-        if os.name == 'nt':  # Windows
-            unique_modes_file_path = None
-            #unique_modes_file_path = r'\\192.168.10.18\gem\006 MORIBUS\ANALISIS y PROYECTOS\assets\'
-            #inventory_analysis_client\pallet_mode_KC.xlsx'
-            #return unique_modes_file_path
-
-        else:  # macOS or others
-            hostname = socket.gethostname()
-            if 'JM-MS.local' in hostname:  # For Mac Studio
-                unique_modes_df = pd.read_excel(
-                    r'/Users/jm/Library/Mobile Documents/com~apple~CloudDocs/GM/MOBU - OPL/assets/'
-                    r'inventory_analysis_client/pallet_mode_KC.xlsx')
-            elif 'MacBook-Pro.local' in hostname:  # For MacBook Pro
-                unique_modes_df = pd.read_excel(
-                    r'/Users/j.m./Library/Mobile Documents/com~apple~CloudDocs/GM/MOBU - OPL/assets/'
-                    r'inventory_analysis_client/pallet_mode_KC.xlsx')
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Get the unique idmodelo
-        unique_modes_df['idmodelo'] = unique_modes_df[['idmodelo']].drop_duplicates()
-
-        # Ensure 'idmodelo' is a string
-        unique_modes_df['idmodelo'] = unique_modes_df['idmodelo'].astype(str).str.strip()
-
-        # Merge 'unique_modes_df' into 'outflow_with_mode' on 'idmodelo'
-        outflow_with_mode = pd.merge(
-            outflow_with_mode,
-            unique_modes_df[['idmodelo', 'mode_count']],
-            left_on='idmodelo_x',
-            right_on='idmodelo',
-            how='left',
-            suffixes=('_existing', '_new')
-        )
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Now, compare 'mode_count_existing' and 'mode_count_new', and if 'mode_count_new' > 'mode_count_existing', replace 'mode_count_existing' with 'mode_count_new'
-        # First, ensure 'mode_count_existing' and 'mode_count_new' are numeric
-        outflow_with_mode['mode_count_existing'] = pd.to_numeric(outflow_with_mode['mode_count_existing'],
-                                                                 errors='coerce')
-        outflow_with_mode['mode_count_new'] = pd.to_numeric(outflow_with_mode['mode_count_new'], errors='coerce')
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Where 'mode_count_new' > 'mode_count_existing', replace 'mode_count_existing' with 'mode_count_new'
-        condition = outflow_with_mode['mode_count_new'] > outflow_with_mode['mode_count_existing']
-        outflow_with_mode.loc[condition, 'mode_count_existing'] = outflow_with_mode.loc[condition, 'mode_count_new']
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Now, drop 'mode_count_new' and rename 'mode_count_existing' back to 'mode_count'
-        outflow_with_mode.drop(columns=['mode_count_new', 'idmodelo_y'], inplace=True)
-        outflow_with_mode.rename(columns={'mode_count_existing': 'mode_count'}, inplace=True)
+        # Step 5: Mode count of the outflow data (resumen_despachos_cliente_fact) using 'idmodelo_x'
+        outflow_with_mode = resumen_despachos_cliente_fact.reset_index(drop=True)
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
-        # Step 7: Calculate the number of rows per 'trannum' and 'idmodelo_x'
-        df_grouped_outflow = outflow_with_mode.groupby(['trannum', 'idmodelo_x']).size().reset_index(name='num_rows')
+        # Step 6: Missing 'mode_count' defaults to 1 if no grouping is available, and the manual overrides replace
+        # the estimated mode where they are larger
+        attach_pallet_modes(outflow_with_mode, pallet_modes, sku_col='idmodelo_x', overrides=pallet_mode_overrides)
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=4)
 
-        # Step 8: Merge the number of rows back into the outflow_with_mode dataframe
-        outflow_with_mode = pd.merge(outflow_with_mode, df_grouped_outflow, on=['trannum', 'idmodelo_x'], how='left')
+        # Steps 7 and 8: Number of rows per 'trannum' and 'idmodelo_x' on every row of outflow_with_mode
+        outflow_with_mode['num_rows'] = outflow_with_mode['trannum'].groupby(
+            [outflow_with_mode['trannum'], outflow_with_mode['idmodelo_x']]).transform('size')
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
         # Ensure num_rows and mode_count are numeric
         outflow_with_mode['num_rows'] = pd.to_numeric(outflow_with_mode['num_rows'], errors='coerce')
@@ -525,58 +238,11 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # output_path = os.path.join(get_base_output_path(), 'outflow_with_mode_before_merge.csv')
-        # outflow_with_mode.to_csv(output_path, index=False)
-
-        # Use lambda function to pad idingreso with leading zeros
-        # outflow_with_mode['idingreso'] = outflow_with_mode['idingreso'].apply(
-        #     lambda x: f"{int(x):010}" if pd.notna(x) else x)
-
-        outflow_with_mode['idingreso'] = outflow_with_mode['idingreso'].apply(
-            lambda x: f"{int(x):010}" if pd.notna(x) and str(x).isnumeric() else x
-        )
-
-        registro_ingresos['idingreso'] = registro_ingresos['idingreso'].apply(
-            lambda x: f"{int(x):010}" if pd.notna(x) and str(x).isnumeric() else x
-        )
-
-        # registro_ingresos['idingreso'] = registro_ingresos['idingreso'].apply(
-        #     lambda x: f"{int(x):010}" if pd.notna(x) else x)
-
-        # print("outflow_with_mode['idingreso'] unique values:\n", outflow_with_mode['idingreso'].unique())
-        # print("registro_ingresos['idingreso'] unique values:\n", registro_ingresos['idingreso'].unique())
-
-        duplicates = registro_ingresos[registro_ingresos.duplicated(subset='idingreso', keep=False)]
-        # print("Duplicate idingreso in registro_ingresos:\n", duplicates)
-
-        # print("registro_ingresos['descrip'] sample values:\n", registro_ingresos['descrip'].head())
-        missing_descrip = registro_ingresos[registro_ingresos['descrip'].isna()]
-        # print(f"Rows in registro_ingresos with missing descrip: {len(missing_descrip)}")
-
-        outflow_with_mode['idingreso'] = outflow_with_mode['idingreso'].astype(str).str.strip().str.zfill(10)
-        registro_ingresos['idingreso'] = registro_ingresos['idingreso'].astype(str).str.strip().str.zfill(10)
-
-        missing_keys = outflow_with_mode.loc[
-            ~outflow_with_mode['idingreso'].isin(registro_ingresos['idingreso']), 'idingreso']
-        # print("Missing idingreso values (not found in registro_ingresos):")
-        # print(missing_keys.unique())
-
-        # Merge with registro_ingresos to get OC description.
-        outflow_with_mode = pd.merge(outflow_with_mode, registro_ingresos[['idingreso', 'descrip']], on='idingreso',
-                                     how="left", indicator=True)
-
-        # Replace None or NaN values in 'descrip' column with 'Unknown'
-        outflow_with_mode['descrip'] = outflow_with_mode['descrip'].fillna('Unknown')
-
         # Rename 'idcontacto_x' to 'idcontacto' for consistency
         outflow_with_mode.rename(columns={'idcontacto_x': 'idcontacto'}, inplace=True)
 
-        #Merge with supplier info to get Client name.
-        outflow_with_mode = pd.merge(outflow_with_mode, supplier_info[['idcontacto', 'Client']], on= 'idcontacto',
-                                     how = 'left')
-
-        # Rename 'idcontacto_x' to 'idcontacto' for consistency
-        outflow_with_mode.rename(columns={'idcontacto_x': 'idcontacto'}, inplace=True)
+        # OC description (by the zero-padded 'idingreso') and Client name from the prebuilt dimension lookups
+        lookups.enrich_outflow(outflow_with_mode)
 
         # output_path = os.path.join(get_base_output_path(), 'outflow_with_mode_after_merge.csv')
         # outflow_with_mode.to_csv(output_path, index=False)
@@ -604,6 +270,7 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
 
         # Keep the historical df for further purposes.
         outflow_with_mode_historical = outflow_with_mode
+        memory_checkpoint('billing_data_reconstruction: outflow pallets', outflow_with_mode_historical=outflow_with_mode)
 
         # Filter by date
         outflow_with_mode = outflow_with_mode[
@@ -615,60 +282,12 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Step 13: Group by 'trannum' and 'idmodelo_x' and perform the final aggregations
-        outflow_grouped = outflow_with_mode.groupby(['trannum', 'idmodelo_x']).agg({
-            'fecha_x': 'first',  # First occurrence of 'fecha_x'
-            'fecha_y': 'last',
-            'Days': 'mean',
-            'descrip': 'first',  # Purchase Order
-            'cantidad': 'sum',  # Sum of 'cantidad'
-            'pallets': 'first',
-            'pesokgs': 'sum',
-            'calculated_pallets': 'first',
-            'bodega': 'first',
-            'idcontacto': 'first',
-            'Client': 'first'
-        }).reset_index()
+        # Steps 13 to 16: Final grouping by 'trannum' and 'idmodelo_x'
+        outflow_grouped = group_outflow_for_billing(outflow_with_mode)
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Round 'Days' to 2 decimal places
-        outflow_grouped['Days'] = outflow_grouped['Days'].round(2)
-
-        # Step 14: Drop the unnecessary columns
-        outflow_grouped = outflow_grouped.drop(columns=['pallets'])
-
-        # Step 15: Round 'calculated_pallets' to the nearest integer
-        outflow_grouped['calculated_pallets'] = np.ceil(outflow_grouped['calculated_pallets']).astype('Int64')
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Step 16: Rename columns for the final output
-        outflow_grouped = outflow_grouped.rename(columns={
-            'fecha_x': 'Shipping_Date',
-            'fecha_y': 'Arrival_Date',
-            'pesokgs': 'Weight or Units',
-            'calculated_pallets': 'Pallets',
-            'cantidad': 'CBM',
-            'idmodelo_x': 'idmodelo',
-            # 'idcontacto_x': 'idcontacto',
-            'descrip': 'Description',
-            'bodega': 'Warehouse'
-        })
-
-        # print("\noutflow_grouped:\n", outflow_grouped.head())
-
-
-        outflow_grouped = outflow_grouped.loc[:,
-                          ['trannum', 'idmodelo', 'Arrival_Date', 'Shipping_Date', 'Days', 'Description', 'idcontacto',
-                           'Client','CBM',
-                           'Pallets',
-                           'Weight or Units',
-                           'Warehouse']]
+        progress.update(task, advance=2)
 
         # # Write the cleaned outflow data to CSV
         # output_path = os.path.join(get_base_output_path(), 'final_outflow_df_fact.csv')
@@ -704,6 +323,9 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
+    if not verbose:
+        return inflow_with_mode_historical, outflow_with_mode_historical, final_df
+
     print("\n Total Pallets and CBM count:\n")
     print("Pallets received:\n", total_inflow_pallets)
     print("CBM received:\n", total_inflow_cbm)
@@ -723,3 +345,122 @@ def billing_data_reconstruction(saldo_inv_cliente_fact, resumen_mensual_ingresos
 
     return inflow_with_mode_historical, outflow_with_mode_historical, final_df
 
+
+def normalize_pallet_locations(saldo_inv_cliente_fact):
+    """
+    Keep only the tagged pallet locations ('TA...') in 'idubica1' and give every other row a unique random
+    location of its own, in place.
+
+    Args:
+        saldo_inv_cliente_fact (pd.DataFrame): Actual inventory rows with 'idubica1'.
+
+    Returns:
+        pd.DataFrame: The same frame with the normalized 'idubica1'.
+    """
+    # Replace values in 'idubica1' that start with 'R' with an empty string
+    saldo_inv_cliente_fact['idubica1'] = saldo_inv_cliente_fact['idubica1'].str.replace(r'^R.*', '', regex=True)
+    saldo_inv_cliente_fact['idubica1'] = saldo_inv_cliente_fact['idubica1'].str.replace(r'^TM.*', '', regex=True)
+
+    # Replace values in 'idubica1' that do not start with 'TA' with an empty string
+    mask = ~saldo_inv_cliente_fact['idubica1'].str.startswith('TA', na=False)
+    saldo_inv_cliente_fact.loc[mask, 'idubica1'] = ''
+
+    # Fill empty values in 'idubica1' with random and unique values
+    empty_indices = saldo_inv_cliente_fact[saldo_inv_cliente_fact['idubica1'] == ''].index
+
+    # Generate unique random values using random.sample(), which guarantees uniqueness
+    unique_values = random.sample(range(1, 1000000), len(empty_indices))
+
+    # Convert to strings and assign back to the empty slots
+    unique_values = [str(value) for value in unique_values]
+    saldo_inv_cliente_fact.loc[empty_indices, 'idubica1'] = unique_values
+    return saldo_inv_cliente_fact
+
+
+def group_inflow_for_billing(inflow_with_mode):
+    """
+    Final inflow billing table: one row per (idingreso, idmodelo) of the given inflow rows.
+
+    Args:
+        inflow_with_mode (pd.DataFrame): Rows of `inflow_with_mode_historical` to bill.
+
+    Returns:
+        pd.DataFrame: Date, description, CBM, pallets, weight or units and warehouse by idingreso and idmodelo.
+    """
+    # Rename columns as needed
+    inflow_with_mode = inflow_with_mode.rename(columns={
+        'fecha_x': 'Date',
+        'descrip': 'Description',
+        'Bodega': 'Warehouse',
+        'inicial': 'CBM',
+        'pesokgs': 'Weight or Units',
+        'pallets_final': 'Pallets'
+    })
+
+    # Ensure 'idingreso' is not part of the index before performing groupby
+    if 'idingreso' in inflow_with_mode.index.names:
+        inflow_with_mode = inflow_with_mode.reset_index(drop=True)
+
+    # Final grouping by 'idingreso' and 'idmodelo' to aggregate relevant columns
+    return inflow_with_mode.groupby(['idingreso', 'idmodelo']).agg({
+        'Date': 'first',
+        'Description': 'first',
+        'CBM': 'sum',
+        'Pallets': 'min',
+        'Weight or Units': 'sum',
+        'Warehouse': 'first'
+
+    }).reset_index()
+
+
+def group_outflow_for_billing(outflow_with_mode):
+    """
+    Final outflow billing table: one row per (trannum, idmodelo_x) of the given outflow rows.
+
+    Args:
+        outflow_with_mode (pd.DataFrame): Rows of `outflow_with_mode_historical` to bill.
+
+    Returns:
+        pd.DataFrame: Arrival and shipping dates, days, description, client, CBM, pallets, weight or units and
+        warehouse by trannum and idmodelo.
+    """
+    # Group by 'trannum' and 'idmodelo_x' and perform the final aggregations
+    outflow_grouped = outflow_with_mode.groupby(['trannum', 'idmodelo_x']).agg({
+        'fecha_x': 'first',  # First occurrence of 'fecha_x'
+        'fecha_y': 'last',
+        'Days': 'mean',
+        'descrip': 'first',  # Purchase Order
+        'cantidad': 'sum',  # Sum of 'cantidad'
+        'pallets': 'first',
+        'pesokgs': 'sum',
+        'calculated_pallets': 'first',
+        'bodega': 'first',
+        'idcontacto': 'first',
+        'Client': 'first'
+    }).reset_index()
+
+    # Round 'Days' to 2 decimal places
+    outflow_grouped['Days'] = outflow_grouped['Days'].round(2)
+
+    # Drop the unnecessary columns
+    outflow_grouped = outflow_grouped.drop(columns=['pallets'])
+
+    # Round 'calculated_pallets' to the nearest integer
+    outflow_grouped['calculated_pallets'] = np.ceil(outflow_grouped['calculated_pallets']).astype('Int64')
+
+    # Rename columns for the final output
+    outflow_grouped = outflow_grouped.rename(columns={
+        'fecha_x': 'Shipping_Date',
+        'fecha_y': 'Arrival_Date',
+        'pesokgs': 'Weight or Units',
+        'calculated_pallets': 'Pallets',
+        'cantidad': 'CBM',
+        'idmodelo_x': 'idmodelo',
+        # 'idcontacto_x': 'idcontacto',
+        'descrip': 'Description',
+        'bodega': 'Warehouse'
+    })
+
+    return outflow_grouped.loc[:,
+                               ['trannum', 'idmodelo', 'Arrival_Date', 'Shipping_Date', 'Days', 'Description',
+                                'idcontacto', 'Client', 'CBM', 'Pallets', 'Weight or Units', 'Warehouse']]
@@ -1,6 +1,7 @@
 from rich.progress import Progress
 import pandas as pd
 import time
+from utils import fill_blank_with_sentinel, parse_date_column
 
 def data_processing(wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingresos,
                     registro_salidas, inmovih_table, saldo_inventory, supplier_info, ctcentro_table,
@@ -122,13 +123,21 @@ def data_processing(wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingr
         # Aplicar la función de corrección a las columnas relevantes
         #     print("\n***Aplicando la función de corrección de columnas.***")
 
-        saldo_inventory.loc[:, 'fecha'] = pd.to_datetime(saldo_inventory['fecha'], errors='coerce')
-        dispatched_inventory.loc[:, 'fecha'] = pd.to_datetime(dispatched_inventory['fecha'], errors='coerce')
-        registro_salidas.loc[:, 'fecha'] = pd.to_datetime(registro_salidas['fecha'], errors='coerce')
-        registro_ingresos.loc[:, 'fecha'] = pd.to_datetime(registro_ingresos['fecha'], errors='coerce')
-        wl_ingresos.loc[:, 'fecha'] = pd.to_datetime(wl_ingresos['fecha'], errors='coerce')
-        inmovih_table.loc[:, 'fecha'] = pd.to_datetime(inmovih_table['fecha'], errors='coerce')
-        rpshd_despachos.loc[:, 'fecha'] = pd.to_datetime(rpshd_despachos['fecha'], errors='coerce')
+        # Formato detectado una vez por archivo fuente (cache_key) y aplicado a toda la columna
+        saldo_inventory.loc[:, 'fecha'] = parse_date_column(saldo_inventory['fecha'],
+                                                            cache_key='insaldo', dayfirst=False, errors='coerce')
+        dispatched_inventory.loc[:, 'fecha'] = parse_date_column(dispatched_inventory['fecha'],
+                                                                 cache_key='insaldo', dayfirst=False, errors='coerce')
+        registro_salidas.loc[:, 'fecha'] = parse_date_column(registro_salidas['fecha'],
+                                                             cache_key='inmovid', dayfirst=False, errors='coerce')
+        registro_ingresos.loc[:, 'fecha'] = parse_date_column(registro_ingresos['fecha'],
+                                                              cache_key='incompra', dayfirst=False, errors='coerce')
+        wl_ingresos.loc[:, 'fecha'] = parse_date_column(wl_ingresos['fecha'],
+                                                        cache_key='cohd', dayfirst=False, errors='coerce')
+        inmovih_table.loc[:, 'fecha'] = parse_date_column(inmovih_table['fecha'],
+                                                          cache_key='inmovih', dayfirst=False, errors='coerce')
+        rpshd_despachos.loc[:, 'fecha'] = parse_date_column(rpshd_despachos['fecha'],
+                                                            cache_key='rpshd', dayfirst=False, errors='coerce')
 
 
 
@@ -201,10 +210,7 @@ def data_processing(wl_ingresos, rpshd_despachos, rpsdt_productos, registro_ingr
                                 ]
         rpsdt_productos.loc[:, rpsdt_productos_cnan] = rpsdt_productos[rpsdt_productos_cnan].fillna("")
 
-        rpsdt_productos['idubica1'] = rpsdt_productos['idubica1'].apply(
-            lambda x: "DESCONOCIDO" if pd.isna(x) or str(x).strip() == "" else x)
-        rpsdt_productos['idubica'] = rpsdt_productos['idubica'].apply(
-            lambda x: "DESCONOCIDO" if pd.isna(x) or str(x).strip() == "" else x)
+        rpsdt_productos = fill_blank_with_sentinel(rpsdt_productos, ['idubica1', 'idubica'])
 
         # Step 6: Filling NaNs
         time.sleep(1)  # Simulate a task
@@ -2,7 +2,8 @@ from rich.progress import Progress
 import time
 import pandas as pd
 import os
-from utils import get_base_output_path
+from utils import get_base_output_path, fill_blank_with_sentinel
+from data_processing import asignar_ubicaciones, override_bodega_by_idcontacto
 
 def data_screening(saldo_inventory, registro_ingresos, registro_salidas, rpsdt_productos, rpshd_despachos,
                    wl_ingresos, inmovih_table, dispatched_inventory):
@@ -14,47 +15,12 @@ def data_screening(saldo_inventory, registro_ingresos, registro_salidas, rpsdt_p
         # Add a new task
         task = progress.add_task("[green]Screening Data: ", total=14)
 
-        def asignar_ubicacion(idubica):
-
-            if idubica == 'P00000':
-                return 'PISO'
-            elif idubica.startswith('E'):
-                return 'BODE'
-            elif idubica in ['PE0000']:
-                return 'BODE'
-            elif idubica in ['C2PD', 'C2PE', 'C2PF', 'C2PG', 'C2PL', 'C1PA', 'C2PN',
-                             'C2PA', 'C2P0', 'C2PK', 'C2PJ', 'C2PI']:
-                return 'INTEMPERIE'
-            elif idubica.startswith('A'):
-                return 'BODA'
-            elif idubica in ['PA0000']:
-                return 'BODA'
-            elif idubica.startswith('C'):
-                return 'BODC'
-            elif idubica in ['PC0000']:
-                return 'BODC'
-            elif idubica.startswith('G'):
-                return 'BODG'
-            elif idubica in ['PG0000']:
-                return 'BODG'
-            elif idubica in [
-                'C1PA', 'C2PJ', 'C2PA', 'C2P0', 'C2PN', 'C2PO', 'C1PE', 'C1PF',
-                'C1PG', 'C1PL', 'C1PJ', 'C1PK', 'C1PI', 'C2PJ', 'C2PK', 'C2PI'
-            ]:
-                return 'BODJ'
-            elif idubica in ['PN0000']:
-                return 'BODJ'
-            elif idubica.startswith(('P', 'B', 'M', 'V')):
-                return 'BODJ'
-            else:
-                return 'DESCONOCIDO'
-
         # Step: Defining object location
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
         # Apply the location assignment logic to `saldo_inventory`
-        saldo_inventory['bodega'] = saldo_inventory['idubica'].apply(asignar_ubicacion)
+        saldo_inventory['bodega'] = asignar_ubicaciones(saldo_inventory['idubica'])
 
         # Step: Locating objects
         time.sleep(1)  # Simulate a task
@@ -94,8 +60,8 @@ def data_screening(saldo_inventory, registro_ingresos, registro_salidas, rpsdt_p
 
         # Tabla registro_salidas - Asignación de bodegas
 
-        # Crear la nueva columna 'bodega' en rpsdt_productos usando la función asignar_ubicación
-        rpsdt_productos['bodega'] = rpsdt_productos['idubica'].apply(asignar_ubicacion)
+        # Crear la nueva columna 'bodega' en rpsdt_productos usando la tabla de reglas de ubicación
+        rpsdt_productos['bodega'] = asignar_ubicaciones(rpsdt_productos['idubica'])
 
         # Step: Defining object location
         time.sleep(1)  # Simulate a task
@@ -130,16 +96,9 @@ def data_screening(saldo_inventory, registro_ingresos, registro_salidas, rpsdt_p
         # output_path = r'C:\Users\josemaria\Downloads\registro_salidas_post_merge.csv'
         # registro_salidas.to_csv(output_path, index=True)
 
-        # Aplicar lambda para asingar DESCONOCIDO a idubica
-        registro_salidas['idubica'] = registro_salidas['idubica'].apply(
-            lambda x: "DESCONOCIDO" if pd.isna(x) or str(x).strip() == "" else x)
-        registro_salidas['bodega'] = registro_salidas['bodega'].apply(
-            lambda x: "DESCONOCIDO" if pd.isna(x) or str(x).strip() == "" else x)
-        # Aplicar lambda para asingar DESCONOCIDO a idubica
-        registro_ingresos['idubica'] = registro_ingresos['idubica'].apply(
-            lambda x: "DESCONOCIDO" if pd.isna(x) or str(x).strip() == "" else x)
-        registro_ingresos['bodega'] = registro_ingresos['bodega'].apply(
-            lambda x: "DESCONOCIDO" if pd.isna(x) or str(x).strip() == "" else x)
+        # Asignar DESCONOCIDO a idubica y bodega vacíos
+        registro_salidas = fill_blank_with_sentinel(registro_salidas, ['idubica', 'bodega'])
+        registro_ingresos = fill_blank_with_sentinel(registro_ingresos, ['idubica', 'bodega'])
 
         # Step: Defining unknown locations
         time.sleep(1)  # Simulate a task
@@ -185,22 +144,9 @@ def data_screening(saldo_inventory, registro_ingresos, registro_salidas, rpsdt_p
         registro_salidas['idcontacto'] = registro_salidas['idcontacto'].astype(str).fillna('')
         inmovih_table['idcontacto'] = inmovih_table['idcontacto'].astype(str).fillna('')
 
-        # Final Step: Updating `bodega` based on `idcontacto`
-        def update_bodega_based_on_idcontacto(row):
-            idcontacto = str(row['idcontacto']) if pd.notna(row['idcontacto']) else ''
-
-            if row['idcontacto'].endswith('_c') and row['bodega'] != 'BODC':
-                return 'BODC'
-            elif row['idcontacto'].endswith('_e') and row['bodega'] != 'BODE':
-                return 'BODE'
-            elif row['idcontacto'].endswith('_opl') and row['bodega'] != 'OPL':
-                return 'OPL'
-            else:
-                return row['bodega']
-
-        # Apply the logic to update `bodega` for all relevant DataFrames
+        # Final Step: Updating `bodega` based on the site suffix of `idcontacto`
         for df in [saldo_inventory, registro_ingresos, registro_salidas, rpsdt_productos]:
-            df['bodega'] = df.apply(update_bodega_based_on_idcontacto, axis=1)
+            df['bodega'] = override_bodega_by_idcontacto(df)
 
         # Step: Cleaning data
         time.sleep(1)  # Simulate a task
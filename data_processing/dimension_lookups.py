@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+
+def normalize_idingreso(idingreso):
+    """
+    Ten-digit, zero-padded 'idingreso' keys, as billing_data_reconstruction has always joined them.
+
+    Numeric keys lose their leading zeros before padding (as `f"{int(x):010}"` does); any other value is only
+    stripped and padded.
+
+    Args:
+        idingreso (pd.Series): Raw 'idingreso' values.
+
+    Returns:
+        pd.Series: The normalized keys.
+    """
+    keys = idingreso.astype(str).str.strip()
+    numeric = idingreso.notna() & keys.str.isnumeric().fillna(False).astype(bool)
+    keys = keys.where(~numeric, keys.str.lstrip('0'))
+    return keys.str.zfill(10)
+
+
+class _Lookup:
+    """
+    Key -> value map over the first occurrence of every key, answered with `get_indexer` / `take`.
+    """
+
+    def __init__(self, keys, values):
+        first = ~keys.duplicated(keep='first').to_numpy()
+        self.index = pd.Index(keys.to_numpy()[first])
+        self.values = values.to_numpy()[first]
+
+    def __call__(self, keys, default=np.nan):
+        positions = self.index.get_indexer(pd.Index(keys))
+        found = positions >= 0
+        result = np.full(len(positions), default, dtype=object)
+        result[found] = self.values.take(positions[found])
+        return pd.Series(result, index=keys.index)
+
+
+class DimensionLookups:
+    """
+    Prebuilt dimension lookups of a dataset: idingreso -> purchase order description and idcontacto -> client.
+
+    Built once from registro_ingresos and supplier_info; every enrichment afterwards is a vectorized index lookup
+    over the fact rows instead of padding and merging the full dimension tables. Duplicated keys resolve to their
+    first occurrence, as the left merges followed by `drop_duplicates` did.
+
+    Args:
+        registro_ingresos (pd.DataFrame): Receptions with 'idingreso' and its 'descrip'.
+        supplier_info (pd.DataFrame): Clients with 'idcontacto' and its 'descrip'.
+    """
+
+    def __init__(self, registro_ingresos, supplier_info):
+        self._purchase_orders = _Lookup(normalize_idingreso(registro_ingresos['idingreso']),
+                                        registro_ingresos['descrip'])
+        self._clients = _Lookup(supplier_info['idcontacto'].fillna(""), supplier_info['descrip'].fillna(""))
+
+    def purchase_order(self, idingreso, default=np.nan):
+        """
+        Purchase order description of every 'idingreso' (already normalized with normalize_idingreso).
+        """
+        return self._purchase_orders(idingreso, default)
+
+    def client(self, idcontacto, default=np.nan):
+        """
+        Client name of every 'idcontacto'.
+        """
+        return self._clients(idcontacto, default)
+
+    def enrich_outflow(self, outflow):
+        """
+        Add the purchase order 'descrip' ('Unknown' when missing) and the 'Client' name to outflow rows, in place.
+
+        Args:
+            outflow (pd.DataFrame): Outflow rows with 'idingreso' and 'idcontacto'.
+
+        Returns:
+            pd.DataFrame: The same frame with 'idingreso' normalized, 'descrip' and 'Client'.
+        """
+        outflow['idingreso'] = normalize_idingreso(outflow['idingreso'])
+        outflow['descrip'] = self.purchase_order(outflow['idingreso']).fillna('Unknown')
+        outflow['Client'] = self.client(outflow['idcontacto'])
+        return outflow
@@ -0,0 +1,299 @@
+import os
+import numpy as np
+import pandas as pd
+from utils import get_base_output_path
+from data_processing import single_warehouse_clients
+from data_processing.monthly_summary import (
+    monthly_receptions_summary, monthly_dispatch_summary, group_receptions_by_client, group_dispatches_by_client
+)
+
+SUMMARY_STORE_NAME = 'monthly_summary_store.pkl'
+STORE_VERSION = 1
+NO_MONTH = 'NaT'
+UNKNOWN_BODEGA = 'DESCONOCIDO'
+
+RECEPTION_KEYS = ['month', 'idcontacto', 'Bodega']
+DISPATCH_KEYS = ['month', 'idcontacto_x', 'bodega']
+SUMMARY_COLUMNS = ['month', 'Bodega', 'Cliente', 'fecha_x', 'idcontacto', 'Pallets', 'Unidades', 'CBM']
+
+
+def get_summary_store_path():
+    return os.path.join(get_base_output_path(), SUMMARY_STORE_NAME)
+
+
+def load_summary_store(path=None):
+    """
+    Read the per-month partial aggregates saved by previous runs, or an empty store.
+    """
+    path = path or get_summary_store_path()
+    if not os.path.exists(path):
+        return {}
+    store = pd.read_pickle(path)
+    return store if store.get('version') == STORE_VERSION else {}
+
+
+def save_summary_store(store, path=None):
+    store['version'] = STORE_VERSION
+    pd.to_pickle(store, path or get_summary_store_path())
+
+
+def _row_hashes(df):
+    # int64 so sums wrap around instead of overflowing
+    return pd.util.hash_pandas_object(df, index=False).to_numpy().view(np.int64)
+
+
+def _owner_months(df, grain):
+    """
+    Month of the most recent row of each grain key, for every row of `df`.
+
+    The summaries keep the most recent row per grain key, so all rows of a key belong to the month of that row.
+    """
+    fecha = pd.to_datetime(df['fecha'], errors='coerce')
+    keys = [df[col].astype(str) if col == 'idingreso' else df[col] for col in grain]
+    latest = fecha.groupby(keys, dropna=False).transform('max')
+    return latest.dt.strftime('%Y-%m').fillna(NO_MONTH)
+
+
+def _reception_owner_months(registro_ingresos, inventario_sin_filtro):
+    """
+    Owner month of every idingreso with receptions.
+
+    monthly_receptions_summary deduplicates on idingreso + itemno, and two idingreso can build the same key
+    ('1' + '23' and '12' + '3'), so the idingreso sharing a key are owned together by the month of the most recent
+    of them.
+    """
+    idingreso = registro_ingresos['idingreso'].astype(str)
+    latest = pd.to_datetime(registro_ingresos['fecha'], errors='coerce').groupby(idingreso).max()
+
+    items = pd.DataFrame({'idingreso': inventario_sin_filtro['idingreso'].astype(str).to_numpy(),
+                          'itemno': inventario_sin_filtro['itemno'].to_numpy()}).dropna().drop_duplicates()
+    items = items[items['idingreso'].isin(latest.index)]
+    items['dup_key'] = items['idingreso'].astype(str) + items['itemno'].astype(str)
+    items = items[items['dup_key'].duplicated(keep=False)]
+
+    # Spread the latest date over the shared keys until every group of linked idingreso agrees
+    while not items.empty:
+        items['latest'] = items['idingreso'].map(latest)
+        shared = items.groupby('dup_key')['latest'].transform('max').groupby(items['idingreso']).max()
+        later = shared[shared.gt(latest[shared.index])]
+        if later.empty:
+            break
+        latest[later.index] = later
+
+    return latest.dt.strftime('%Y-%m').fillna(NO_MONTH)
+
+
+def month_signatures(source, months, related=()):
+    """
+    Row count and order-independent content hash of the source rows behind every month.
+
+    Args:
+        source (pd.DataFrame): Rows that own the months (incompra / inmovid lines).
+        months (pd.Series): Owner month of every row of `source`.
+        related (sequence of pd.DataFrame): Tables joined on `idingreso`; their rows count for every month that
+            owns one of their idingreso.
+
+    Returns:
+        dict: {month: tuple of (rows, hash) per table}.
+    """
+    hashed = pd.DataFrame({'month': months.to_numpy(), 'hash': _row_hashes(source)})
+    signatures = [hashed.groupby('month')['hash'].agg(['size', 'sum'])]
+
+    month_of_idingreso = pd.DataFrame({'idingreso': source['idingreso'].astype(str).to_numpy(),
+                                       'month': months.to_numpy()}).drop_duplicates()
+    for df in related:
+        hashed = pd.DataFrame({'idingreso': df['idingreso'].astype(str).to_numpy(), 'hash': _row_hashes(df)})
+        by_idingreso = hashed.groupby('idingreso')['hash'].agg(['size', 'sum'])
+        signatures.append(month_of_idingreso.join(by_idingreso, on='idingreso', how='inner')
+                          .groupby('month')[['size', 'sum']].sum())
+
+    all_months = sorted(set().union(*(sig.index for sig in signatures)))
+    return {
+        month: tuple((int(sig.at[month, 'size']), int(sig.at[month, 'sum'])) if month in sig.index else (0, 0)
+                     for sig in signatures)
+        for month in all_months
+    }
+
+
+def _changed_months(section, signatures, context):
+    """
+    Months whose signature differs from the stored one (every month if the store was built in another context).
+    """
+    if section.get('context') != context:
+        return set(signatures)
+    stored = section.get('signatures', {})
+    return {month for month, signature in signatures.items() if stored.get(month) != signature}
+
+
+def _context_signature(supplier_info, *lengths):
+    return int(_row_hashes(supplier_info).sum()), len(supplier_info), lengths
+
+
+def _max_len(*columns):
+    return max(int(col.str.len().max()) if len(col) else 0 for col in columns)
+
+
+def incremental_receptions_summary(registro_ingresos, supplier_info, inventario_sin_filtro, rpsdt_productos,
+                                   store_path=None):
+    """
+    `resumen_mensual_ingresos_clientes` recomputing only the months whose source rows changed.
+
+    Every month owns the reception rows of the idingreso whose most recent reception falls in it, together with
+    the inventory and rpsdt rows of those idingreso. Months whose rows have the same count and hash as in the
+    store are taken from the store; the others go through monthly_receptions_summary on a subset copy.
+
+    Args:
+        registro_ingresos, supplier_info, inventario_sin_filtro, rpsdt_productos (pd.DataFrame): Same inputs as
+            monthly_receptions_summary. They are not modified.
+        store_path (str, optional): Pickle holding the per-month partial aggregates.
+
+    Returns:
+        pd.DataFrame: Same table as the first output of monthly_receptions_summary.
+    """
+    store = load_summary_store(store_path)
+    section = store.get('receptions', {})
+
+    # Pad idcontacto as monthly_receptions_summary does, with the lengths of the full history
+    idcontacto = registro_ingresos['idcontacto'].astype(str).str.strip()
+    supplier_ids = supplier_info['idcontacto'].astype(str).str.strip()
+    max_length = _max_len(idcontacto, supplier_ids)
+    supplier_info = supplier_info.copy()
+    supplier_info['idcontacto'] = supplier_ids.str.zfill(max_length)
+
+    owner_by_idingreso = _reception_owner_months(registro_ingresos, inventario_sin_filtro)
+    owner = registro_ingresos['idingreso'].astype(str).map(owner_by_idingreso)
+    dated = (owner != NO_MONTH).to_numpy()  # idingreso without a reception date never reach the summary
+    signatures = month_signatures(registro_ingresos[dated], owner[dated], (inventario_sin_filtro, rpsdt_productos))
+    context = _context_signature(supplier_info, max_length)
+    changed = _changed_months(section, signatures, context)
+
+    partials = section.get('partials') if section.get('context') == context else None
+    if partials is not None:
+        # Keep the closed months, drop the changed ones and the ones that no longer have rows
+        stored_months = partials['owner_month']
+        partials = partials[stored_months.isin(signatures.keys()) & ~stored_months.isin(changed)]
+
+    if changed:
+        print(f"\nRecomputing receptions for {len(changed)} month(s): {', '.join(sorted(changed))}\n")
+        subset = registro_ingresos[owner.isin(changed).to_numpy()].copy()
+        subset['idcontacto'] = subset['idcontacto'].astype(str).str.strip().str.zfill(max_length)
+        ids = subset['idingreso'].astype(str)
+        _, resumen_mensual_ingresos_sd, _ = monthly_receptions_summary(
+            subset, supplier_info.copy(),
+            inventario_sin_filtro[inventario_sin_filtro['idingreso'].astype(str).isin(ids)].copy(),
+            rpsdt_productos[rpsdt_productos['idingreso'].astype(str).isin(ids)].copy(), write_csv=False)
+
+        resumen_mensual_ingresos_sd['owner_month'] = resumen_mensual_ingresos_sd['idingreso'].map(owner_by_idingreso)
+        recomputed = resumen_mensual_ingresos_sd.groupby(['owner_month'] + RECEPTION_KEYS).agg({
+            'fecha_x': 'max',
+            'retnum_x': 'count',
+            'pesokgs': 'sum',
+            'inicial': 'sum',
+            'ddma': 'sum'
+        }).reset_index()
+        partials = recomputed if partials is None else pd.concat([partials, recomputed], ignore_index=True)
+
+    store['receptions'] = {'context': context, 'signatures': signatures, 'partials': partials}
+    save_summary_store(store, store_path)
+
+    if partials is None:  # Sin recepciones con fecha: nada que resumir
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    # The rows are sorted by date, most recent first, so 'first' was the latest date of every group
+    resumen_mensual_ingresos = partials.groupby(RECEPTION_KEYS).agg({
+        'fecha_x': 'max',
+        'retnum_x': 'sum',
+        'pesokgs': 'sum',
+        'inicial': 'sum',
+        'ddma': 'sum'
+    }).reset_index()
+
+    return group_receptions_by_client(resumen_mensual_ingresos, supplier_info)
+
+
+def incremental_dispatch_summary(registro_salidas, dispatched_inventory, supplier_info, store_path=None):
+    """
+    `resumen_mensual_despachos_clientes_grouped` recomputing only the months whose source rows changed.
+
+    Every month owns the dispatch lines of the (idingreso, itemno) whose most recent line falls in it, together
+    with the inventory rows of those idingreso. The store keeps the monthly aggregates before the 'DESCONOCIDO'
+    back-fill, since that back-fill depends on the warehouses of the client over its whole history; it is applied
+    to the combined aggregates.
+
+    Args:
+        registro_salidas, dispatched_inventory, supplier_info (pd.DataFrame): Same inputs as
+            monthly_dispatch_summary. They are not modified.
+        store_path (str, optional): Pickle holding the per-month partial aggregates.
+
+    Returns:
+        pd.DataFrame: Same table as the first output of monthly_dispatch_summary.
+    """
+    store = load_summary_store(store_path)
+    section = store.get('dispatches', {})
+
+    # Pad idcontacto and idingreso as monthly_dispatch_summary does, with the lengths of the full history
+    idcontacto = registro_salidas['idcontacto'].astype(str)
+    supplier_ids = supplier_info['idcontacto'].astype(str).str.strip()
+    max_length_idc = _max_len(idcontacto, supplier_ids)
+    max_length_idi = _max_len(registro_salidas['idingreso'].astype(str),
+                              dispatched_inventory['idingreso'].astype(str))
+    supplier_info = supplier_info.copy()
+    supplier_info['idcontacto'] = supplier_ids.str.zfill(max_length_idc)
+
+    # Lines without a date still count for the warehouses a client is known to use
+    owner = _owner_months(registro_salidas, ['idingreso', 'itemno'])
+    signatures = month_signatures(registro_salidas, owner, (dispatched_inventory,))
+    context = _context_signature(supplier_info, max_length_idc, max_length_idi)
+    changed = _changed_months(section, signatures, context)
+
+    partials = section.get('partials') if section.get('context') == context else None
+    if partials is not None:
+        stored_months = partials['owner_month']
+        partials = partials[stored_months.isin(signatures.keys()) & ~stored_months.isin(changed)]
+
+    if changed:
+        print(f"\nRecomputing dispatches for {len(changed)} month(s): {', '.join(sorted(changed))}\n")
+        mask = owner.isin(changed).to_numpy()
+        subset = registro_salidas[mask].copy()
+        subset['idcontacto'] = subset['idcontacto'].astype(str).str.zfill(max_length_idc)
+        subset['idingreso'] = subset['idingreso'].astype(str).str.zfill(max_length_idi)
+        inventory = dispatched_inventory[dispatched_inventory['idingreso'].astype(str).isin(
+            registro_salidas.loc[mask, 'idingreso'].astype(str))].copy()
+        inventory['idingreso'] = inventory['idingreso'].astype(str).str.zfill(max_length_idi)
+
+        _, merged_despachos_inventario, _ = monthly_dispatch_summary(subset, inventory, supplier_info.copy(),
+                                                                     fill_unknown=False, write_csv=False)
+
+        merged_despachos_inventario['owner_month'] = merged_despachos_inventario['month'].astype(str) \
+            .where(merged_despachos_inventario['month'].notna(), NO_MONTH)
+        recomputed = merged_despachos_inventario.groupby(['owner_month'] + DISPATCH_KEYS, dropna=False).agg({
+            'fecha_x': 'max',
+            'numero': 'count',
+            'pesokgs': 'sum',
+            'cantidad': 'sum',
+        }).reset_index()
+        partials = recomputed if partials is None else pd.concat([partials, recomputed], ignore_index=True)
+
+    store['dispatches'] = {'context': context, 'signatures': signatures, 'partials': partials}
+    save_summary_store(store, store_path)
+
+    if partials is None:  # Sin despachos: nada que resumir
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    # Handle 'DESCONOCIDO' in 'bodega' with the warehouses of the client over the whole history. The lines are sorted
+    # by date, most recent first, so 'first' was the latest date of every group
+    resumen_mensual_despachos = partials.copy()
+    replacement_bodega = single_warehouse_clients(resumen_mensual_despachos, client_col='idcontacto_x')
+    unknown = (resumen_mensual_despachos['bodega'] == UNKNOWN_BODEGA) & \
+        resumen_mensual_despachos['idcontacto_x'].isin(replacement_bodega.index)
+    resumen_mensual_despachos.loc[unknown, 'bodega'] = \
+        resumen_mensual_despachos.loc[unknown, 'idcontacto_x'].map(replacement_bodega)
+
+    resumen_mensual_despachos = resumen_mensual_despachos.groupby(DISPATCH_KEYS).agg({
+        'fecha_x': 'max',
+        'numero': 'sum',
+        'pesokgs': 'sum',
+        'cantidad': 'sum',
+    }).reset_index()
+
+    return group_dispatches_by_client(resumen_mensual_despachos, supplier_info)
@@ -2,16 +2,71 @@ from rich.progress import Progress
 import time
 import pandas as pd
 from utils import clip_near_zero
+from data_processing.inventory_ledger import (
+    daily_inventory_flows, replay_ledger, monthly_inventory_ledger, company_inventory_levels, client_initial_inventory,
+    LEDGER_KEYS
+)
+from data_processing.warehouse_handler import single_warehouse_clients
 import os
-from utils import get_base_output_path
+from utils import get_base_output_path, memory_checkpoint
+
+# Company-wide daily columns, in the names used by the KPI calculations
+DAILY_COLUMNS = {
+    'date': 'date',
+    'Inflow CBM': 'Inflow (CBM)',
+    'Inflow Units': 'Units inflow',
+    'Inflow Pallets': 'Pallets inflow',
+    'Outflow CBM': 'Outflow (CBM)',
+    'Outflow Units': 'Units outflow',
+    'Outflow Pallets': 'Pallets outflow',
+    'Opening CBM': 'Opening Inventory level (CBM)',
+    'Closing CBM': 'Inventory level (CBM)',
+    'Opening Units': 'Opening Inventory level (Units)',
+    'Closing Units': 'Inventory level (Units)',
+    'Opening Pallets': 'Opening Inventory level (Pallets)',
+    'Closing Pallets': 'Inventory level (Pallets)',
+    'initial_inventory': 'initial_inventory',
+}
+
+
+def _ledger_seeds(flows, initial_inventory):
+    """
+    Initial CBM of every client, on its 'Bodega' when given or otherwise on the only warehouse it uses. The initial
+    inventory of a client with several warehouses can't be placed on any of them, so it only counts company-wide.
+    """
+    if initial_inventory is None:
+        return None
+    seeds = initial_inventory.rename(columns={'initial_inventory': 'Closing CBM'})
+    if 'Bodega' not in seeds.columns:
+        only_bodega = single_warehouse_clients(flows, client_col='idcontacto', bodega_col='Bodega')
+        seeds = seeds.drop_duplicates('idcontacto')
+        seeds = seeds.assign(Bodega=seeds['idcontacto'].map(only_bodega)).dropna(subset=['Bodega'])
+    return seeds.reindex(columns=LEDGER_KEYS + ['Closing CBM', 'Closing Units', 'Closing Pallets'])
+
 
 def reconstruct_inventory_over_time(
         inflow_with_mode_historical,
         outflow_with_mode_historical,
         start_date=None,
         end_date=None,
-        initial_inventory=None
+        initial_inventory=None,
+        ledger=None
 ):
+    """
+    Company-wide daily inventory levels and the monthly levels per client and warehouse.
+
+    Args:
+        inflow_with_mode_historical (pd.DataFrame): Inflow rows from billing_data_reconstruction.
+        outflow_with_mode_historical (pd.DataFrame): Outflow rows from billing_data_reconstruction.
+        start_date, end_date (datetime, optional): Day range. Defaults to the first and last movement.
+        initial_inventory (pd.DataFrame, optional): 'initial_inventory' by 'idcontacto' (and 'Bodega').
+        ledger (pd.DataFrame, optional): Ledger of the same movements from update_inventory_ledger. When given,
+            its rows in the range are used instead of replaying the flows; their levels carry in from before
+            `start_date`.
+
+    Returns:
+        tuple: (company-wide daily flows and levels, monthly levels per client and warehouse)
+    """
     with Progress() as progress:
         # Add a new task
         task = progress.add_task("[green]Reconstructing inventory behavior Data: ", total=18)
@@ -110,223 +165,73 @@ def reconstruct_inventory_over_time(
         print("Pallets final check (inflow):\n", inflow_with_mode_historical)
         print("Pallets final check (outflow):\n", outflow_with_mode_historical)
 
-        # Aggregate daily inflows
-        daily_inflows = inflow_with_mode_historical.groupby(['fecha_x', 'idcontacto']).agg({
-            'inicial': 'sum',
-            'pesokgs': 'sum',
-            'pallets_final': 'sum'  # no. de palets
-        }).reset_index()
-
-        daily_inflows.rename(columns={
-            'fecha_x': 'date',
-            'inicial': 'Inflow (CBM)',
-            'pesokgs': 'Units inflow',
-            'pallets_final': 'Pallets inflow'
-        }, inplace=True)
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Aggregate daily outflows
-        daily_outflows = outflow_with_mode_historical.groupby(['fecha_x', 'idcontacto']).agg({
-            'cantidad': 'sum',
-            'pesokgs': 'sum',
-            'calculated_pallets': 'sum'
-        }).reset_index()
-
-        daily_outflows.rename(columns={
-            'fecha_x': 'date',
-            'cantidad': 'Outflow (CBM)',
-            'pesokgs': 'Units outflow',
-            'calculated_pallets': 'Pallets outflow'
-        }, inplace=True)
-
-        # Prepare clients list
-        clients = pd.concat([
-            daily_inflows[['idcontacto']].drop_duplicates(),
-            daily_outflows[['idcontacto']].drop_duplicates()
-        ]).drop_duplicates()
-
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Cross join clients with date range
-        inventory_over_time = clients.merge(date_df, how='cross')
-
-        # Merge inflows and outflows
-        inventory_over_time = inventory_over_time.merge(
-            daily_inflows,
-            on=['date', 'idcontacto'],
-            how='left'
-        ).merge(
-            daily_outflows,
-            on=['date', 'idcontacto'],
-            how='left'
-        )
+        if ledger is None:
+            # Daily inflows and outflows by client and warehouse, with the pallets counted once per pallet group
+            all_flows = daily_inventory_flows(inflow_with_mode_historical, outflow_with_mode_historical)
+            in_range = (all_flows['date'] >= pd.Timestamp(start_date)) & (all_flows['date'] <= pd.Timestamp(end_date))
+            flows = all_flows[in_range]
 
-        # Step:
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+            # Prepare clients list
+            clients = all_flows['idcontacto'].drop_duplicates().sort_values()
 
-        # Fill NaNs with zeros for inflow and outflow columns
-        inventory_over_time['Inflow (CBM)'] = inventory_over_time['Inflow (CBM)'].fillna(0)
-        inventory_over_time['Outflow (CBM)'] = inventory_over_time['Outflow (CBM)'].fillna(0)
-        inventory_over_time['Units inflow'] = inventory_over_time['Units inflow'].fillna(0)
-        inventory_over_time['Units outflow'] = inventory_over_time['Units outflow'].fillna(0)
-        inventory_over_time['Pallets inflow'] = inventory_over_time['Pallets inflow'].fillna(0)
-        inventory_over_time['Pallets outflow'] = inventory_over_time['Pallets outflow'].fillna(0)
+            # Running CBM, units and pallets levels per client and warehouse, all measures in one pass. Only the
+            # days with movements are stored; levels carry forward in between
+            ledger = replay_ledger(flows, _ledger_seeds(flows, initial_inventory))
+        else:
+            # Ledger kept up to date by update_inventory_ledger: its rows already hold the daily flows and levels
+            clients = ledger['idcontacto'].drop_duplicates().sort_values()
+            ledger = ledger[(ledger['date'] >= pd.Timestamp(start_date)) & (ledger['date'] <= pd.Timestamp(end_date))]
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
-        # Calculate cumulative inventory levels per client
-        inventory_over_time = inventory_over_time.sort_values(['idcontacto', 'date'])
-        inventory_over_time['Inventory level (CBM)'] = 0.0
-
-        # Set initial inventory levels
-        if initial_inventory is None:
-            initial_inventory = pd.DataFrame({
-                'idcontacto': clients['idcontacto'],
-                'initial_inventory': 0.0
-            })
-
-        # Merge initial inventory
-        inventory_over_time = inventory_over_time.merge(
-            initial_inventory,
-            on='idcontacto',
-            how='left'
-        )
+        memory_checkpoint('reconstruct_inventory_over_time: ledger', ledger=ledger)
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=3)
 
+        # Clients without movements in the range keep a zero share
         df_client_share = (
-            inventory_over_time
-            .groupby('idcontacto', as_index=False)
-            .agg({'Inflow (CBM)': 'sum', 'Outflow (CBM)': 'sum'})
+            ledger
+            .groupby('idcontacto')
+            .agg({'Inflow CBM': 'sum', 'Outflow CBM': 'sum'})
+            .reindex(clients, fill_value=0)
+            .rename(columns={'Inflow CBM': 'Inflow (CBM)', 'Outflow CBM': 'Outflow (CBM)'})
+            .reset_index()
         )
 
         # Compute percentages
         total_inflow = df_client_share['Inflow (CBM)'].sum()
         df_client_share['Inflow %'] = df_client_share['Inflow (CBM)'] / total_inflow * 100
 
-        inventory_ot_by_month = inventory_over_time
-
-        # 1. Group by date only, summing relevant numeric columns you care about:
-        daily_agg = (
-            inventory_over_time
-            .groupby('date', as_index=False)
-            .agg({
-                'Inflow (CBM)': 'sum',
-                'Outflow (CBM)': 'sum',
-                # If you also track 'Units inflow', 'Units outflow', etc., include them here:
-                'Units inflow': 'sum',
-                'Pallets inflow': 'sum',
-                'Units outflow': 'sum',
-                'Pallets outflow': 'sum',
-                # If you want to incorporate any initial_inventory from each row:
-                'initial_inventory': 'sum'
-            })
-            .sort_values('date')  # Ensure ascending chronological order
-        )
-
-        # 2. Create an 'Inventory level (CBM)' column (start it at 0 or the sum of initial_inventory on the first day).
-        daily_agg['Inventory level (CBM)'] = 0.0
-
-        # If you have a reason to set the very first day's starting point from the sum of 'initial_inventory', do:
-        if not daily_agg.empty:
-            current_inventory = daily_agg.loc[daily_agg.index[0], 'initial_inventory']
-        else:
-            current_inventory = 0.0
-
-        # 3. Calculate the daily running total, preventing negative values.
-        inventory_levels = []
-        for idx, row in daily_agg.iterrows():
-            inflow = row['Inflow (CBM)']
-            outflow = row['Outflow (CBM)']
-
-            new_inventory = current_inventory + inflow - outflow
-            if new_inventory < 0:
-                new_inventory = 0
-            inventory_levels.append(new_inventory)
-
-            current_inventory = new_inventory
-
-        daily_agg['Inventory level (CBM)'] = inventory_levels
-
-        inventory_over_time = daily_agg.copy()
-
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Compute Opening Inventory level (CBM)
-        inventory_over_time['Opening Inventory level (CBM)'] = (
-                inventory_over_time['Inventory level (CBM)'] - inventory_over_time['Inflow (CBM)'] +
-                inventory_over_time['Outflow (CBM)']
-        )
+        # Company-wide daily series: every day with movements, even if none of them has a client. The levels run
+        # over the flows of all clients and warehouses together, starting from the clients' 'initial_inventory'
+        days = date_df['date'].sort_values()
+        initial_total = client_initial_inventory(clients, initial_inventory).sum()
+        inventory_over_time = company_inventory_levels(ledger, days, initial={'CBM': initial_total})
+        inventory_over_time['initial_inventory'] = initial_total
 
+        # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
-        # Group by month and calculate initial and final inventory levels
-        inventory_ot_by_month = inventory_ot_by_month.groupby(pd.Grouper(key='date', freq='M')).agg({
-            'idcontacto': 'first',
-            'Inflow (CBM)': 'sum',
-            'Units inflow': 'sum',
-            'Pallets inflow': 'sum',
-            'Outflow (CBM)': 'sum',
-            'Units outflow': 'sum',
-            'Pallets outflow': 'sum',
-            # 'Opening Inventory level (CBM)': 'first',  # Initial inventory
-            'Inventory level (CBM)': 'last',  # Final inventory
-        }).reset_index()
-
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        inventory_over_time = inventory_over_time.rename(columns=DAILY_COLUMNS)[list(DAILY_COLUMNS.values())]
 
-        # Rename the columns
-        inventory_ot_by_month.rename(columns={
-            # 'Opening Inventory level (CBM)': 'Initial Inventory level (CBM)',
-            'Inventory level (CBM)': 'Final Inventory level (CBM)'
-        }, inplace=True)
+        # Opening and closing levels per month, client and warehouse
+        inventory_ot_by_month = monthly_inventory_ledger(ledger)
 
+        # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
         print("Clients contained in analysis:\n", df_client_share.sort_values('Inflow (CBM)', ascending=False))
 
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        inventory_over_time = (
-            inventory_over_time
-            .groupby(['date'], as_index=False)
-            .agg({
-                'Inflow (CBM)': 'sum',
-                'Units inflow': 'sum',
-                'Pallets inflow': 'sum',
-                'Outflow (CBM)': 'sum',
-                'Units outflow': 'sum',
-                'Pallets outflow': 'sum',
-                # For inventory level, let's keep the last recorded value that day
-                'Inventory level (CBM)': 'last',
-                # If 'initial_inventory' is relevant, you can do 'first'
-                'initial_inventory': 'first',
-            })
-        )
-
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        inventory_ot_by_month.rename(columns={
-            'initial_inventory': 'Initial Inventory level (CBM)',
-        }, inplace=True)
-
         # Step 2: Clip near-zero values
         inventory_over_time = clip_near_zero(inventory_over_time)
 
@@ -338,7 +243,7 @@ def reconstruct_inventory_over_time(
 
         # Step:
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
+        progress.update(task, advance=2)
 
     print("\nInventory behavior reconstruction complete.\n")
 
@@ -0,0 +1,332 @@
+import os
+import numpy as np
+import pandas as pd
+from utils import get_base_output_path, clipped_cumsum_by_group
+from data_processing.warehouse_handler import fill_unknown_bodega
+
+INVENTORY_LEDGER_NAME = 'inventory_ledger.pkl'
+LEDGER_VERSION = 3
+UNKNOWN_BODEGA = 'DESCONOCIDO'
+UNKNOWN_SKU = 'SIN MODELO'
+INCOHERENT_BODEGA = 'INCOHERENT VALUES'
+
+LEDGER_KEYS = ['idcontacto', 'Bodega']
+MEASURES = ['CBM', 'Units', 'Pallets']
+FLOW_COLUMNS = [f'{flow} {measure}' for measure in MEASURES for flow in ['Inflow', 'Outflow']]
+LEDGER_COLUMNS = ['date'] + LEDGER_KEYS + [
+    f'{column} {measure}' for measure in MEASURES for column in ['Opening', 'Inflow', 'Outflow', 'Closing']
+]
+
+
+def get_inventory_ledger_path(idcontacto=None):
+    # One ledger per client, so switching clients does not overwrite the ledger of the previous one
+    name = INVENTORY_LEDGER_NAME if idcontacto is None else f'inventory_ledger_{idcontacto}.pkl'
+    return os.path.join(get_base_output_path(), name)
+
+
+def load_inventory_ledger(path=None):
+    """
+    Read the ledger saved by the last run, or None if there is none (or it has another layout).
+    """
+    path = path or get_inventory_ledger_path()
+    if not os.path.exists(path):
+        return None
+    stored = pd.read_pickle(path)
+    return stored['ledger'] if stored.get('version') == LEDGER_VERSION else None
+
+
+def save_inventory_ledger(ledger, path=None):
+    pd.to_pickle({'version': LEDGER_VERSION, 'ledger': ledger}, path or get_inventory_ledger_path())
+
+
+def warehouse_labels(bodega):
+    """
+    One warehouse label set for the inflow ('Bodega', resolved) and the outflow ('bodega', raw): stripped and
+    upper-cased, with blank, missing and 'INCOHERENT VALUES' warehouses as 'DESCONOCIDO'.
+    """
+    labels = bodega.astype('string').str.strip().str.upper()
+    unknown = labels.isna() | labels.isin(['', INCOHERENT_BODEGA])
+    return labels.astype(object).mask(unknown.to_numpy(), UNKNOWN_BODEGA)
+
+
+def _daily_flows(movements, flow, bodega_col, measures, pallet_grain, sku_col=None):
+    daily = pd.DataFrame({
+        'date': pd.to_datetime(movements['fecha_x'], errors='coerce').dt.normalize().to_numpy(),
+        'idcontacto': movements['idcontacto'].to_numpy(),
+        'Bodega': warehouse_labels(movements[bodega_col]).to_numpy(),
+    })
+    keys = list(LEDGER_KEYS)
+    if sku_col is not None:
+        daily['idmodelo'] = movements[sku_col].fillna(UNKNOWN_SKU).to_numpy()
+        keys.append('idmodelo')
+    for col, measure in measures.items():
+        daily[f'{flow} {measure}'] = pd.to_numeric(movements[col], errors='coerce').to_numpy()
+
+    valid = daily[['date', 'idcontacto']].notna().all(axis=1).to_numpy()
+    daily = daily[valid].reset_index(drop=True)
+
+    # The pallets of a group are repeated on every row of the group: count them once, on its first row
+    if all(key in movements.columns for key in pallet_grain):
+        first_of_group = ~movements.loc[valid, pallet_grain].duplicated(keep='first').to_numpy()
+        daily[f'{flow} Pallets'] = daily[f'{flow} Pallets'].where(first_of_group, 0)
+
+    return daily
+
+
+def daily_inventory_flows(inflow_with_mode_historical, outflow_with_mode_historical, by_sku=False):
+    """
+    Inflow and outflow CBM, units and pallets of every day with movements, by client and warehouse (and SKU).
+
+    CBM and units are summed over the rows. The pallets are counted at their grain, once per (idingreso, idmodelo)
+    for the inflow and per (trannum, idmodelo_x) for the outflow, as the billing tables count them.
+
+    Both sides are keyed on the same warehouse labels (warehouse_labels), and the unknown warehouse of a client
+    that uses a single known warehouse is that warehouse, so the inflow and the outflow of a stock meet in the same
+    running level.
+
+    Args:
+        inflow_with_mode_historical (pd.DataFrame): Inflow rows from billing_data_reconstruction.
+        outflow_with_mode_historical (pd.DataFrame): Outflow rows from billing_data_reconstruction.
+        by_sku (bool): Also split by 'idmodelo' (the outflow 'idmodelo_x').
+
+    Returns:
+        pd.DataFrame: One row per client, warehouse (SKU) and day, sorted by those keys and date.
+    """
+    inflows = _daily_flows(inflow_with_mode_historical, 'Inflow', 'Bodega',
+                           {'inicial': 'CBM', 'pesokgs': 'Units', 'pallets_final': 'Pallets'},
+                           ['idingreso', 'idmodelo'], 'idmodelo' if by_sku else None)
+    outflows = _daily_flows(outflow_with_mode_historical, 'Outflow', 'bodega',
+                            {'cantidad': 'CBM', 'pesokgs': 'Units', 'calculated_pallets': 'Pallets'},
+                            ['trannum', 'idmodelo_x'], 'idmodelo_x' if by_sku else None)
+
+    keys = LEDGER_KEYS + ['idmodelo'] if by_sku else LEDGER_KEYS
+    flows = pd.concat([inflows, outflows], ignore_index=True)
+    flows = flows.reindex(columns=['date'] + keys + FLOW_COLUMNS)
+    flows[FLOW_COLUMNS] = flows[FLOW_COLUMNS].fillna(0)
+    flows = fill_unknown_bodega(flows, client_col='idcontacto', bodega_col='Bodega', unknown=UNKNOWN_BODEGA)
+
+    flows = flows.groupby(['date'] + keys)[FLOW_COLUMNS].sum().reset_index()
+    return flows.sort_values(keys + ['date'], kind='stable').reset_index(drop=True)
+
+
+def replay_ledger(flows, seeds=None, keys=LEDGER_KEYS):
+    """
+    Opening and closing levels of every row of `flows`, as running levels per client and warehouse that never go
+    below zero.
+
+    Args:
+        flows (pd.DataFrame): Output of daily_inventory_flows (or a tail of it).
+        seeds (pd.DataFrame, optional): 'Closing CBM', 'Closing Units' and 'Closing Pallets' by client and
+            warehouse before the first row of `flows`. Defaults to 0.
+        keys (list of str): Columns identifying every running level, e.g. LEDGER_KEYS + ['idmodelo'].
+
+    Returns:
+        pd.DataFrame: The ledger rows, with the LEDGER_COLUMNS (and the extra keys).
+    """
+    ledger = flows.reset_index(drop=True)
+    groups = ledger.groupby(keys, sort=False).ngroup().to_numpy()
+    group_starts = np.ones(len(ledger), dtype=bool)
+    group_starts[1:] = groups[1:] != groups[:-1]
+
+    starts = ledger.loc[group_starts, keys]
+    closing_columns = [f'Closing {measure}' for measure in MEASURES]
+    if seeds is not None:
+        initial = starts.merge(seeds, on=keys, how='left')[closing_columns].fillna(0).to_numpy()
+    else:
+        initial = np.zeros((len(starts), len(MEASURES)))
+
+    # All measures in one pass: rows x (CBM, Units, Pallets)
+    closing = clipped_cumsum_by_group(ledger[[f'Inflow {measure}' for measure in MEASURES]].to_numpy(),
+                                      ledger[[f'Outflow {measure}' for measure in MEASURES]].to_numpy(),
+                                      groups, initial)
+    opening = np.roll(closing, 1, axis=0)
+    opening[group_starts] = initial
+
+    for j, measure in enumerate(MEASURES):
+        ledger[f'Opening {measure}'] = opening[:, j]
+        ledger[f'Closing {measure}'] = closing[:, j]
+
+    return ledger[['date'] + keys + LEDGER_COLUMNS[len(LEDGER_KEYS) + 1:]]
+
+
+def _earliest_changed_date(flows, ledger):
+    """
+    First day whose flows differ from the ledger's, including days added to or missing from either side.
+    """
+    compared = flows.merge(ledger[['date'] + LEDGER_KEYS + FLOW_COLUMNS], on=['date'] + LEDGER_KEYS, how='outer',
+                           suffixes=('', ' stored'), indicator=True)
+    changed = compared['_merge'] != 'both'
+    for col in FLOW_COLUMNS:
+        changed |= compared[col] != compared[f'{col} stored']
+    return compared.loc[changed, 'date'].min()
+
+
+def update_inventory_ledger(inflow_with_mode_historical, outflow_with_mode_historical, idcontacto=None, path=None):
+    """
+    Daily inventory ledger by client and warehouse, updated from the last run instead of replaying all history.
+
+    Days before the earliest day whose flows changed are kept as they are; from that day on the ledger is replayed,
+    seeded with the closing levels of the kept days. New days only append, and back-dated movements roll the ledger
+    back to their date.
+
+    Args:
+        inflow_with_mode_historical (pd.DataFrame): Inflow rows from billing_data_reconstruction.
+        outflow_with_mode_historical (pd.DataFrame): Outflow rows from billing_data_reconstruction.
+        idcontacto (str, optional): Client of the movements; every client keeps its own ledger on disk.
+        path (str, optional): Pickle holding the ledger of the last run. Defaults to get_inventory_ledger_path().
+
+    Returns:
+        pd.DataFrame: One row per client, warehouse and day with movements, with the opening, inflow, outflow and
+        closing CBM, units and pallets.
+    """
+    path = path or get_inventory_ledger_path(idcontacto)
+    flows = daily_inventory_flows(inflow_with_mode_historical, outflow_with_mode_historical)
+    stored = load_inventory_ledger(path)
+
+    if stored is None:
+        print("\nBuilding the inventory ledger from the first movement.\n")
+        ledger = replay_ledger(flows)
+    else:
+        replay_from = _earliest_changed_date(flows, stored)
+        if pd.isna(replay_from):
+            print("\nInventory ledger is up to date.\n")
+            return stored
+
+        kept = stored[stored['date'] < replay_from]
+        seeds = kept.drop_duplicates(LEDGER_KEYS, keep='last')[LEDGER_KEYS + [f'Closing {m}' for m in MEASURES]]
+        replayed = replay_ledger(flows[flows['date'] >= replay_from], seeds)
+        print(f"\nReplaying the inventory ledger from {replay_from.date()} ({len(replayed)} rows).\n")
+
+        ledger = pd.concat([kept, replayed], ignore_index=True)
+        ledger = ledger.sort_values(LEDGER_KEYS + ['date'], kind='stable').reset_index(drop=True)
+
+    save_inventory_ledger(ledger, path)
+    return ledger
+
+
+def monthly_inventory_ledger(ledger):
+    """
+    Opening, inflow, outflow and closing CBM, units and pallets per month, client and warehouse.
+
+    Every client and warehouse gets a row for each month from its first movement to the last month of the ledger;
+    months without movements carry the closing level of the previous one.
+
+    Args:
+        ledger (pd.DataFrame): Ledger rows from replay_ledger or update_inventory_ledger.
+
+    Returns:
+        pd.DataFrame: One row per client, warehouse and month.
+    """
+    columns = ['month'] + LEDGER_COLUMNS[1:]
+    if ledger.empty:
+        return pd.DataFrame(columns=columns)
+
+    agg = {}
+    for measure in MEASURES:
+        agg.update({f'Opening {measure}': 'first', f'Inflow {measure}': 'sum', f'Outflow {measure}': 'sum',
+                    f'Closing {measure}': 'last'})
+    monthly = ledger.assign(month=ledger['date'].dt.to_period('M')).groupby(LEDGER_KEYS + ['month']).agg(agg)
+    monthly = monthly.reset_index()
+
+    # Client x warehouse x month grid, from the first month of every client and warehouse
+    months = pd.period_range(monthly['month'].min(), monthly['month'].max(), freq='M')
+    starts = monthly.drop_duplicates(LEDGER_KEYS)
+    first_month = np.repeat(months.get_indexer(starts['month']), len(months))
+    month_position = np.tile(np.arange(len(months)), len(starts))
+    grid = starts.loc[starts.index.repeat(len(months)), LEDGER_KEYS].reset_index(drop=True)
+    grid['month'] = months[month_position]
+    grid = grid[month_position >= first_month]
+
+    monthly = grid.merge(monthly, on=LEDGER_KEYS + ['month'], how='left')
+    monthly[FLOW_COLUMNS] = monthly[FLOW_COLUMNS].fillna(0)
+    for measure in MEASURES:
+        closing = monthly.groupby(LEDGER_KEYS)[f'Closing {measure}'].ffill()
+        monthly[f'Closing {measure}'] = closing
+        monthly[f'Opening {measure}'] = monthly[f'Opening {measure}'].fillna(
+            closing.groupby([monthly[key] for key in LEDGER_KEYS]).shift(1))
+
+    return monthly[columns]
+
+
+def ledger_levels_on(ledger, dates, by=None):
+    """
+    Closing CBM, units and pallets on the given days, carrying forward the level of the last day with movements of
+    every client and warehouse (0 before its first movement).
+
+    Args:
+        ledger (pd.DataFrame): Ledger rows from replay_ledger or update_inventory_ledger.
+        dates (array-like): Days to read.
+        by (list of str, optional): Columns to report the levels by, e.g. ['idcontacto'] per client or ['Bodega']
+            per warehouse; the levels of the other keys are summed. Defaults to every key of the ledger.
+
+    Returns:
+        pd.DataFrame: One row per `by` group and day with 'date', the `by` columns and 'Closing <measure>'.
+    """
+    keys = [key for key in LEDGER_KEYS + ['idmodelo'] if key in ledger.columns]
+    by = keys if by is None else list(by)
+    closing_columns = [f'Closing {measure}' for measure in MEASURES]
+    if ledger.empty:
+        return pd.DataFrame(columns=['date'] + by + closing_columns)
+
+    dates = pd.DatetimeIndex(pd.to_datetime(dates)).unique().sort_values()
+    series = ledger[keys].drop_duplicates()
+    requested = series.loc[series.index.repeat(len(dates))].reset_index(drop=True)
+    requested['date'] = np.tile(dates.to_numpy(), len(series))
+    requested['date'] = requested['date'].astype(ledger['date'].dtype)
+
+    levels = pd.merge_asof(
+        requested.sort_values('date', kind='stable'),
+        ledger[['date'] + keys + closing_columns].sort_values('date', kind='stable'),
+        on='date', by=keys, direction='backward',
+    )
+    levels[closing_columns] = levels[closing_columns].fillna(0)
+    levels = levels.groupby(by + ['date'], dropna=False)[closing_columns].sum().reset_index()
+    return levels[['date'] + by + closing_columns]
+
+
+def client_initial_inventory(clients, initial_inventory=None):
+    """
+    Initial inventory of every client in `clients` (first row per client), NaN for the clients without one.
+    """
+    clients = pd.Series(clients).reset_index(drop=True)
+    if initial_inventory is None:
+        return pd.Series(0.0, index=clients)
+    seeds = initial_inventory.drop_duplicates('idcontacto').set_index('idcontacto')['initial_inventory']
+    return pd.Series(clients.map(seeds).to_numpy(dtype='float64'), index=clients)
+
+
+def company_inventory_levels(flows, days, initial=None):
+    """
+    Company-wide daily flows and opening and closing CBM, units and pallets, as one running level per measure
+    that never goes below zero.
+
+    The flows of all clients and warehouses are summed per day first, so an outflow booked on another warehouse
+    than its inflow still draws the same stock down, exactly as the company-wide loop always did.
+
+    Args:
+        flows (pd.DataFrame): Output of daily_inventory_flows (or a date range of it).
+        days (array-like): Days to report, in chronological order; days without flows keep the level.
+        initial (dict, optional): Company level per measure before the first day. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: One row per day with the FLOW_COLUMNS, 'Opening <measure>' and 'Closing <measure>'.
+    """
+    days = pd.DatetimeIndex(days)
+    initial = initial or {}
+    totals = flows.groupby('date')[FLOW_COLUMNS].sum().reindex(days, fill_value=0)
+    totals = totals.rename_axis('date').reset_index()
+
+    seeds = np.array([[initial.get(measure, 0.0) for measure in MEASURES]], dtype='float64')
+    if totals.empty:
+        closing = opening = np.empty((0, len(MEASURES)))
+    else:
+        # A single group: the whole company
+        closing = clipped_cumsum_by_group(totals[[f'Inflow {measure}' for measure in MEASURES]].to_numpy(),
+                                          totals[[f'Outflow {measure}' for measure in MEASURES]].to_numpy(),
+                                          np.zeros(len(totals)), seeds)
+        opening = np.vstack([seeds, closing[:-1]])
+
+    for j, measure in enumerate(MEASURES):
+        totals[f'Opening {measure}'] = opening[:, j]
+        totals[f'Closing {measure}'] = closing[:, j]
+    return totals
@@ -0,0 +1,121 @@
+import numpy as np
+from utils import map_distinct
+
+# Reglas para asignar bodega de acuerdo al idubica. The order matters: the first matching rule wins.
+#   ('exact', values, bodega)  -> idubica is one of `values`
+#   ('prefix', prefixes, bodega) -> idubica starts with one of `prefixes`
+LOCATION_RULES = [
+    ('exact', ['P00000'], 'PISO'),
+    ('prefix', ['E'], 'BODE'),
+    ('exact', ['PE0000'], 'BODE'),
+    ('exact', ['C2PD', 'C2PE', 'C2PF', 'C2PG', 'C2PL', 'C1PA', 'C2PN',
+               'C2PA', 'C2P0', 'C2PK', 'C2PJ', 'C2PI'], 'INTEMPERIE'),
+    ('prefix', ['A'], 'BODA'),
+    ('exact', ['PA0000'], 'BODA'),
+    ('prefix', ['C'], 'BODC'),
+    ('exact', ['PC0000'], 'BODC'),
+    ('prefix', ['G'], 'BODG'),
+    ('exact', ['PG0000'], 'BODG'),
+    # Shadowed by the 'C' prefix rule above, kept so the table mirrors the historic assignment logic.
+    ('exact', ['C1PA', 'C2PJ', 'C2PA', 'C2P0', 'C2PN', 'C2PO', 'C1PE', 'C1PF',
+               'C1PG', 'C1PL', 'C1PJ', 'C1PK', 'C1PI', 'C2PJ', 'C2PK', 'C2PI'], 'BODJ'),
+    ('exact', ['PN0000'], 'BODJ'),
+    ('prefix', ['P', 'B', 'M', 'V'], 'BODJ'),
+]
+
+DEFAULT_LOCATION = 'DESCONOCIDO'
+
+
+def asignar_ubicacion(idubica, rules=LOCATION_RULES, default=DEFAULT_LOCATION):
+    """
+    Assign the warehouse of a single idubica by walking the rule table.
+    """
+    if not isinstance(idubica, str):
+        return default
+    for kind, values, bodega in rules:
+        if kind == 'exact' and idubica in values:
+            return bodega
+        if kind == 'prefix' and idubica.startswith(tuple(values)):
+            return bodega
+    return default
+
+
+def compile_location_rules(rules=LOCATION_RULES, default=DEFAULT_LOCATION):
+    """
+    Compile the rule table into a vectorized function over a Series of idubica values.
+
+    Exact rules become `isin` lookups and prefix rules `str.startswith` masks; `np.select` keeps the
+    first matching rule, as in the original if/elif chain.
+
+    Args:
+        rules (list): Ordered (kind, values, bodega) rules.
+        default (str): Warehouse for locations matching no rule.
+
+    Returns:
+        callable: Function mapping a Series of idubica to an array of warehouses.
+    """
+    compiled = [(kind, tuple(values), bodega) for kind, values, bodega in rules]
+
+    def assign(idubica):
+        is_str = idubica.map(type).eq(str).to_numpy()
+        text = idubica.where(is_str, '').astype(str)
+        conditions = []
+        for kind, values, _ in compiled:
+            mask = text.isin(values) if kind == 'exact' else text.str.startswith(values)
+            conditions.append(mask.to_numpy(dtype=bool) & is_str)
+        return np.select(conditions, [bodega for _, _, bodega in compiled], default=default)
+
+    return assign
+
+
+_assign_locations = compile_location_rules()
+
+
+def asignar_ubicaciones(idubica):
+    """
+    Vectorized `asignar_ubicacion` over a whole idubica column.
+
+    The rules are evaluated once per distinct location and broadcast back through the factorized
+    codes, so the cost grows with the number of locations rather than the number of rows.
+
+    Args:
+        idubica (pd.Series): Location codes.
+
+    Returns:
+        pd.Series: Warehouse per row, aligned with `idubica`.
+    """
+    return map_distinct(idubica, _assign_locations, na_value=DEFAULT_LOCATION)
+
+
+# Sufijo de idcontacto agregado en load_data -> bodega forzada (BODC and BODE clients live in their own sites)
+IDCONTACTO_BODEGA_OVERRIDES = [
+    ('_c', 'BODC'),
+    ('_e', 'BODE'),
+    ('_opl', 'OPL'),
+]
+
+
+def override_bodega_by_idcontacto(df, idcontacto_col='idcontacto', bodega_col='bodega',
+                                  overrides=IDCONTACTO_BODEGA_OVERRIDES):
+    """
+    Force `bodega` from the site suffix of `idcontacto`, vectorized over the distinct clients.
+
+    Args:
+        df (pd.DataFrame): Any table with client and warehouse columns.
+        idcontacto_col (str): Client column.
+        bodega_col (str): Warehouse column.
+        overrides (list): Ordered (suffix, bodega) pairs; the first matching suffix wins.
+
+    Returns:
+        pd.Series: The overridden warehouse column, aligned with `df.index`.
+    """
+    suffixes = [suffix for suffix, _ in overrides]
+    bodegas = [bodega for _, bodega in overrides]
+
+    def forced_bodega(idcontacto):
+        text = idcontacto.where(idcontacto.map(type).eq(str), '').astype(str)
+        conditions = [text.str.endswith(suffix).to_numpy(dtype=bool) for suffix in suffixes]
+        return np.select(conditions, bodegas, default=None)
+
+    forced = map_distinct(df[idcontacto_col], forced_bodega, na_value=None)
+    return forced.where(forced.notna(), df[bodega_col])
@@ -1,13 +1,30 @@
 from rich.progress import Progress
 import os
-from utils import get_base_output_path
+from utils import get_base_output_path, memory_checkpoint, merge_at_grain
 import pandas as pd
 import time
 import numpy as np
-from data_processing import resolve_bodega
+from data_processing import resolve_bodega_column, fill_unknown_bodega
 
+# Prefix of the dup_key of rows missing idingreso or itemno; digits-only keys can't collide with it
+MISSING_ITEM_KEY = 'SIN_ITEM|'
 
-def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_filtro, rpsdt_productos):
+
+def duplicate_key(idingreso, itemno):
+    """
+    idingreso + itemno, the key the summaries keep one row of.
+
+    A row missing either part gets the key of its own (idingreso, itemno) pair instead of NaN. Otherwise all those
+    rows would share the NaN key and collapse into one, which depends on which rows are summarized together (the
+    whole history or a few months of it).
+    """
+    dup_key = idingreso + itemno
+    pair_key = MISSING_ITEM_KEY + idingreso.fillna('nan').astype(str) + '|' + itemno.fillna('nan').astype(str)
+    return dup_key.where(dup_key.notna(), pair_key)
+
+
+def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_filtro, rpsdt_productos,
+                               write_csv=True):
     with Progress() as progress:
         # Add a new task
         task = progress.add_task("[green]Analysing historic reception Data: ", total=19)
@@ -27,10 +44,12 @@ def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_
         inventario_sin_filtro['idcontacto'] = inventario_sin_filtro['idcontacto'].astype(str)
         inventario_sin_filtro['idingreso'] = inventario_sin_filtro['idingreso'].astype(str)
 
-        output_path = os.path.join(get_base_output_path(), 'registro_ingresos_monthly_summary.csv')
-        registro_ingresos.to_csv(output_path, index=True)
-        output_path = os.path.join(get_base_output_path(), 'inventario_sin_filtro_montly_summary.csv')
-        inventario_sin_filtro.to_csv(output_path, index=True)
+        # Subset recomputes (incremental summaries) must not overwrite the full-history CSVs
+        if write_csv:
+            output_path = os.path.join(get_base_output_path(), 'registro_ingresos_monthly_summary.csv')
+            registro_ingresos.to_csv(output_path, index=True)
+            output_path = os.path.join(get_base_output_path(), 'inventario_sin_filtro_montly_summary.csv')
+            inventario_sin_filtro.to_csv(output_path, index=True)
 
         # Step: Preparing data
         time.sleep(1)  # Simulate a task
@@ -80,24 +99,30 @@ def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_
         progress.update(task, advance=1)
 
         # Ordenar las filas filtradas de más recientes a más antiguas
-        monthly_registro_ingresos = monthly_registro_ingresos.sort_values(by='fecha', ascending=False)
-        monthly_inventario_sin_filtro = monthly_inventario_sin_filtro.sort_values(by='fecha', ascending=False)
+        monthly_registro_ingresos = monthly_registro_ingresos.sort_values(by='fecha', ascending=False, kind='stable')
+        monthly_inventario_sin_filtro = monthly_inventario_sin_filtro.sort_values(by='fecha', ascending=False, kind='stable')
 
         # Step: Sorting values
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Merge the DataFrames
-        merged_ingresos_inventario = pd.merge(monthly_registro_ingresos, monthly_inventario_sin_filtro, on='idingreso',
-                                              how='left')
+        # Merge the DataFrames. Only the first (most recent) reception row per idingreso and the first inventory row
+        # per (idingreso, itemno) survive the dup_key deduplication below, so each side is reduced to that grain first
+        merged_ingresos_inventario = merge_at_grain(
+            monthly_registro_ingresos, monthly_inventario_sin_filtro, on='idingreso', how='left',
+            left_grain='idingreso', right_grain=['idingreso', 'itemno'],
+            stage='monthly_receptions_summary: registro_ingresos/inventario_sin_filtro')
+        memory_checkpoint('monthly_receptions_summary: merge registro_ingresos/inventario_sin_filtro',
+                          registro_ingresos=monthly_registro_ingresos, inventario_sin_filtro=monthly_inventario_sin_filtro,
+                          merged_ingresos_inventario=merged_ingresos_inventario)
 
         # Step: Merging data
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
         # Create dup_key
-        merged_ingresos_inventario['dup_key'] = (merged_ingresos_inventario['idingreso'] +
-                                                 merged_ingresos_inventario['itemno'])
+        merged_ingresos_inventario['dup_key'] = duplicate_key(merged_ingresos_inventario['idingreso'],
+                                                              merged_ingresos_inventario['itemno'])
 
         # Drop duplicates based on 'idingreso'
         merged_ingresos_inventario = merged_ingresos_inventario.drop_duplicates(subset='dup_key', keep='first')
@@ -106,8 +131,9 @@ def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        output_path = os.path.join(get_base_output_path(), 'merged_ingresos_inventario_before_mask.csv')
-        merged_ingresos_inventario.to_csv(output_path, index=True)
+        if write_csv:
+            output_path = os.path.join(get_base_output_path(), 'merged_ingresos_inventario_before_mask.csv')
+            merged_ingresos_inventario.to_csv(output_path, index=True)
 
         # Step: Replacing unknown data
         time.sleep(1)  # Simulate a task
@@ -125,15 +151,20 @@ def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        resumen_mensual_ingresos_sd = pd.merge(
-            merged_ingresos_inventario, rpsdt_productos[['bodega', 'idubica', 'idingreso']], on='idingreso', how='left')
+        # dup_key is unique at this point, so only the first rpsdt row per idingreso can be kept
+        resumen_mensual_ingresos_sd = merge_at_grain(
+            merged_ingresos_inventario, rpsdt_productos[['bodega', 'idubica', 'idingreso']], on='idingreso',
+            how='left', right_grain='idingreso', stage='monthly_receptions_summary: rpsdt_productos')
+        memory_checkpoint('monthly_receptions_summary: merge rpsdt_productos',
+                          merged_ingresos_inventario=merged_ingresos_inventario,
+                          resumen_mensual_ingresos_sd=resumen_mensual_ingresos_sd)
 
         # Step: Merging data
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        resumen_mensual_ingresos_sd['dup_key'] = (resumen_mensual_ingresos_sd['idingreso'] +
-                                                  resumen_mensual_ingresos_sd['itemno'])
+        resumen_mensual_ingresos_sd['dup_key'] = duplicate_key(resumen_mensual_ingresos_sd['idingreso'],
+                                                               resumen_mensual_ingresos_sd['itemno'])
 
         resumen_mensual_ingresos_sd = resumen_mensual_ingresos_sd.drop_duplicates(subset='dup_key', keep='first')
 
@@ -144,8 +175,8 @@ def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_
         resumen_mensual_ingresos_sd['bodega_x'] = resumen_mensual_ingresos_sd['bodega_x'].str.strip().str.upper()
         resumen_mensual_ingresos_sd['bodega_y'] = resumen_mensual_ingresos_sd['bodega_y'].str.strip().str.upper()
 
-        # Apply the function to your dataframe to create a unified Bodega column
-        resumen_mensual_ingresos_sd['Bodega'] = resumen_mensual_ingresos_sd.apply(resolve_bodega, axis=1)
+        # Resolve the bodega conflicts into a unified Bodega column
+        resumen_mensual_ingresos_sd['Bodega'] = resolve_bodega_column(resumen_mensual_ingresos_sd)
 
         resumen_mensual_ingresos_fact = resumen_mensual_ingresos_sd
 
@@ -182,62 +213,21 @@ def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Rename the columns accordingly
-        resumen_mensual_ingresos.rename(columns={
-            # 'month': 'first',
-            'pesokgs': 'Unidades',
-            'inicial': 'CBM',
-            'retnum_x': 'Pallets',
-            'ddma': 'Desprendimientos despues del mes de analisis'
-        }, inplace=True)
-
-        # Step: Renaming columns
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Adjust 'CBM' by adding 'Desprendimientos despues del mes de analisis' where 'ddma' is not zero
-        resumen_mensual_ingresos['CBM'] += resumen_mensual_ingresos['Desprendimientos despues del mes de analisis']
+        resumen_mensual_ingresos_clientes = group_receptions_by_client(resumen_mensual_ingresos, supplier_info)
 
-        # Step: Complementing CBM data with partial shipments
+        # Step: Renaming columns, complementing CBM data with partial shipments and merging data
         time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        # Merge dataframe with incontac to obtain client name
-        resumen_mensual_ingresos_clientes = pd.merge(resumen_mensual_ingresos, supplier_info, on='idcontacto',
-                                                     how='left')
-
-        # Step: Merging data
-        time.sleep(1)  # Simulate a task
-        progress.update(task, advance=1)
-
-        resumen_mensual_ingresos_clientes['descrip'] = resumen_mensual_ingresos_clientes.rename(
-            columns={'descrip': 'Cliente'}, inplace=True)
-
-        # print("Ingresos mensuales por idcliente y Bodega (agrupado 1):\n", resumen_mensual_ingresos_clientes)
-
-        # Continue with your aggregation, now grouping by 'month' as well
-        resumen_mensual_ingresos_clientes = resumen_mensual_ingresos_clientes.groupby(
-            ['month', 'Bodega', 'Cliente']).agg({
-            'fecha_x': 'first',
-            'idcontacto': 'first',  # Assuming 'idcontacto' is the same within each group
-            'Pallets': 'sum',
-            'Unidades': 'sum',
-            'CBM': 'sum'
-        }).reset_index()
-
-        if 'Bodega' in resumen_mensual_ingresos_clientes.columns:
-            # Check if column values in 'Bodega' start with 'B'
-            if resumen_mensual_ingresos_clientes['Bodega'].astype(str).str.startswith('B').any():
-                resumen_mensual_ingresos_clientes.rename(columns={'Bodega': 'bodega'}, inplace=True)
+        progress.update(task, advance=3)
 
         # Step: Grouping data
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        output_path = os.path.join(get_base_output_path(), 'resumen_mensual_ingresos_fact.csv')
-        resumen_mensual_ingresos_fact.to_csv(output_path, index=True)
-        output_path = os.path.join(get_base_output_path(), 'resumen_mensual_ingresos_sd.csv')
-        resumen_mensual_ingresos_sd.to_csv(output_path, index=True)
+        if write_csv:
+            output_path = os.path.join(get_base_output_path(), 'resumen_mensual_ingresos_fact.csv')
+            resumen_mensual_ingresos_fact.to_csv(output_path, index=True)
+            output_path = os.path.join(get_base_output_path(), 'resumen_mensual_ingresos_sd.csv')
+            resumen_mensual_ingresos_sd.to_csv(output_path, index=True)
 
         # Step: Printing CSV data
         time.sleep(1)  # Simulate a task
@@ -249,7 +239,23 @@ def monthly_receptions_summary(registro_ingresos, supplier_info, inventario_sin_
     return resumen_mensual_ingresos_clientes, resumen_mensual_ingresos_sd, resumen_mensual_ingresos_fact
 
 
-def monthly_dispatch_summary(registro_salidas, dispatched_inventory, supplier_info):
+def monthly_dispatch_summary(registro_salidas, dispatched_inventory, supplier_info, fill_unknown=True,
+                             write_csv=True):
+    """
+    Monthly dispatches by client and warehouse.
+
+    Args:
+        registro_salidas (pd.DataFrame): Dispatch lines (inmovid).
+        dispatched_inventory (pd.DataFrame): Inventory rows of the dispatched receptions.
+        supplier_info (pd.DataFrame): Client information.
+        fill_unknown (bool): Back-fill 'DESCONOCIDO' warehouses from the client's only known warehouse. The
+            incremental summaries turn it off and back-fill over the whole history instead.
+        write_csv (bool): Save the monthly dispatches to CSV. Off for subset recomputes, which must not overwrite
+            the full-history file.
+
+    Returns:
+        tuple: (monthly dispatches by month, Bodega and Cliente, merged dispatch lines, dispatch fact table)
+    """
     with Progress() as progress:
         # Add a new task
         task = progress.add_task("[green]Analyzing historic dispatch data: ", total=11)
@@ -291,21 +297,29 @@ def monthly_dispatch_summary(registro_salidas, dispatched_inventory, supplier_in
         progress.update(task, advance=1)
 
         # Sort dataframes
-        registro_salidas = registro_salidas.sort_values(by='fecha', ascending=False)
-        dispatched_inventory = dispatched_inventory.sort_values(by='fecha', ascending=False)
+        registro_salidas = registro_salidas.sort_values(by='fecha', ascending=False, kind='stable')
+        dispatched_inventory = dispatched_inventory.sort_values(by='fecha', ascending=False, kind='stable')
 
         # Step: Sorting data
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Perform a left merge to keep all rows from registro_salidas
-        merged_despachos_inventario = pd.merge(
+        # Perform a left merge to keep all rows from registro_salidas. dup_key (idingreso + itemno of the dispatch)
+        # keeps the first dispatch line per (idingreso, itemno) paired with the first inventory row of the idingreso,
+        # so each side is reduced to that grain first
+        merged_despachos_inventario = merge_at_grain(
             registro_salidas,
             dispatched_inventory,
             on='idingreso',
             how='left',
+            left_grain=['idingreso', 'itemno'],
+            right_grain='idingreso',
+            stage='monthly_dispatch_summary: registro_salidas/dispatched_inventory',
             suffixes=('_x', '_y')
         )
+        memory_checkpoint('monthly_dispatch_summary: merge registro_salidas/dispatched_inventory',
+                          registro_salidas=registro_salidas, dispatched_inventory=dispatched_inventory,
+                          merged_despachos_inventario=merged_despachos_inventario)
 
         # Step: Merging data
         time.sleep(1)  # Simulate a task
@@ -322,8 +336,8 @@ def monthly_dispatch_summary(registro_salidas, dispatched_inventory, supplier_in
         progress.update(task, advance=1)
 
         # Create a unique key for duplicates
-        merged_despachos_inventario['dup_key'] = (merged_despachos_inventario['idingreso'] +
-                                                  merged_despachos_inventario['itemno_x'])
+        merged_despachos_inventario['dup_key'] = duplicate_key(merged_despachos_inventario['idingreso'],
+                                                               merged_despachos_inventario['itemno_x'])
 
         # Drop duplicates based on 'dup_key'
         merged_despachos_inventario = merged_despachos_inventario.drop_duplicates(subset='dup_key', keep='first')
@@ -333,14 +347,8 @@ def monthly_dispatch_summary(registro_salidas, dispatched_inventory, supplier_in
         progress.update(task, advance=1)
 
         # Handle 'DESCONOCIDO' in 'bodega'
-        filtered_bodegas = merged_despachos_inventario[merged_despachos_inventario['bodega'] != 'DESCONOCIDO']
-        replacement_bodega = filtered_bodegas.groupby('idcontacto_x').filter(lambda x: len(x['bodega'].unique()) == 1)
-        replacement_bodega = replacement_bodega.groupby('idcontacto_x')['bodega'].first()
-        mask = (merged_despachos_inventario['bodega'] == 'DESCONOCIDO') & merged_despachos_inventario[
-            'idcontacto_x'].isin(
-            replacement_bodega.index)
-        merged_despachos_inventario.loc[mask, 'bodega'] = merged_despachos_inventario.loc[mask, 'idcontacto_x'].map(
-            replacement_bodega)
+        if fill_unknown:
+            merged_despachos_inventario = fill_unknown_bodega(merged_despachos_inventario, client_col='idcontacto_x')
 
         # Step: Identifying unknowns and cleaning data
         time.sleep(1)  # Simulate a task
@@ -360,45 +368,21 @@ def monthly_dispatch_summary(registro_salidas, dispatched_inventory, supplier_in
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Rename the columns
-        resumen_mensual_despachos.rename(columns={
-            'idcontacto_x': 'idcontacto',
-            'bodega': 'Bodega',
-            'pesokgs': 'Unidades',
-            'cantidad': 'CBM',
-            'numero': 'Pallets',
-        }, inplace=True)
-
-        # Merge with 'supplier_info' to get 'Cliente' information
-        resumen_mensual_despachos_clientes = pd.merge(
-            resumen_mensual_despachos, supplier_info[['idcontacto', 'descrip']], on='idcontacto', how='left'
-        )
-
         # Step: Renaming columns and merging data
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Rename 'descrip' to 'Cliente'
-        resumen_mensual_despachos_clientes.rename(columns={'descrip': 'Cliente'}, inplace=True)
-
-        # Group by 'month', 'Bodega', and 'Cliente', summing numerical values
-        resumen_mensual_despachos_clientes_grouped = resumen_mensual_despachos_clientes.groupby(
-            ['month', 'Bodega', 'Cliente']
-        ).agg({
-            'fecha_x': 'first',
-            'idcontacto': 'first',
-            'Pallets': 'sum',
-            'Unidades': 'sum',
-            'CBM': 'sum',
-        }).reset_index()
+        resumen_mensual_despachos_clientes_grouped = group_dispatches_by_client(resumen_mensual_despachos,
+                                                                                supplier_info)
 
         # Step: Renaming columns and grouping data
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
         # Save the final DataFrame to CSV
-        output_path = os.path.join(get_base_output_path(), 'despachos_cliente_bodega_mensual_historico.csv')
-        resumen_mensual_despachos_clientes_grouped.to_csv(output_path, index=False)
+        if write_csv:
+            output_path = os.path.join(get_base_output_path(), 'despachos_cliente_bodega_mensual_historico.csv')
+            resumen_mensual_despachos_clientes_grouped.to_csv(output_path, index=False)
 
         # Step: Printing CSV data
         time.sleep(1)  # Simulate a task
@@ -410,3 +394,92 @@ def monthly_dispatch_summary(registro_salidas, dispatched_inventory, supplier_in
     print("\nMonthly shipment data processed correctly.\n")
 
     return resumen_mensual_despachos_clientes_grouped, merged_despachos_inventario, resumen_despachos_cliente_fact
+
+
+def group_receptions_by_client(resumen_mensual_ingresos, supplier_info):
+    """
+    Roll the monthly receptions by (month, idcontacto, Bodega) up to (month, Bodega, Cliente).
+
+    Args:
+        resumen_mensual_ingresos (pd.DataFrame): Monthly receptions by month, idcontacto and Bodega, with the
+            fecha_x, retnum_x, pesokgs, inicial and ddma aggregates.
+        supplier_info (pd.DataFrame): Client names, with `idcontacto` normalized as in the receptions.
+
+    Returns:
+        pd.DataFrame: Pallets, units and CBM (including partial shipments) by month, warehouse and client.
+    """
+    # Rename the columns accordingly
+    resumen_mensual_ingresos = resumen_mensual_ingresos.rename(columns={
+        'pesokgs': 'Unidades',
+        'inicial': 'CBM',
+        'retnum_x': 'Pallets',
+        'ddma': 'Desprendimientos despues del mes de analisis'
+    })
+
+    # Adjust 'CBM' by adding 'Desprendimientos despues del mes de analisis' where 'ddma' is not zero
+    resumen_mensual_ingresos['CBM'] += resumen_mensual_ingresos['Desprendimientos despues del mes de analisis']
+
+    # Merge dataframe with incontac to obtain client name
+    resumen_mensual_ingresos_clientes = pd.merge(resumen_mensual_ingresos, supplier_info, on='idcontacto',
+                                                 how='left')
+
+    resumen_mensual_ingresos_clientes['descrip'] = resumen_mensual_ingresos_clientes.rename(
+        columns={'descrip': 'Cliente'}, inplace=True)
+
+    # Continue with your aggregation, now grouping by 'month' as well
+    resumen_mensual_ingresos_clientes = resumen_mensual_ingresos_clientes.groupby(
+        ['month', 'Bodega', 'Cliente']).agg({
+        'fecha_x': 'first',
+        'idcontacto': 'first',  # Assuming 'idcontacto' is the same within each group
+        'Pallets': 'sum',
+        'Unidades': 'sum',
+        'CBM': 'sum'
+    }).reset_index()
+
+    if 'Bodega' in resumen_mensual_ingresos_clientes.columns:
+        # Check if column values in 'Bodega' start with 'B'
+        if resumen_mensual_ingresos_clientes['Bodega'].astype(str).str.startswith('B').any():
+            resumen_mensual_ingresos_clientes.rename(columns={'Bodega': 'bodega'}, inplace=True)
+
+    return resumen_mensual_ingresos_clientes
+
+
+def group_dispatches_by_client(resumen_mensual_despachos, supplier_info):
+    """
+    Roll the monthly dispatches by (month, idcontacto_x, bodega) up to (month, Bodega, Cliente).
+
+    Args:
+        resumen_mensual_despachos (pd.DataFrame): Monthly dispatches by month, idcontacto_x and bodega, with the
+            fecha_x, numero, pesokgs and cantidad aggregates.
+        supplier_info (pd.DataFrame): Client names, with `idcontacto` normalized as in the dispatches.
+
+    Returns:
+        pd.DataFrame: Pallets, units and CBM by month, warehouse and client.
+    """
+    # Rename the columns
+    resumen_mensual_despachos = resumen_mensual_despachos.rename(columns={
+        'idcontacto_x': 'idcontacto',
+        'bodega': 'Bodega',
+        'pesokgs': 'Unidades',
+        'cantidad': 'CBM',
+        'numero': 'Pallets',
+    })
+
+    # Merge with 'supplier_info' to get 'Cliente' information
+    resumen_mensual_despachos_clientes = pd.merge(
+        resumen_mensual_despachos, supplier_info[['idcontacto', 'descrip']], on='idcontacto', how='left'
+    )
+
+    # Rename 'descrip' to 'Cliente'
+    resumen_mensual_despachos_clientes.rename(columns={'descrip': 'Cliente'}, inplace=True)
+
+    # Group by 'month', 'Bodega', and 'Cliente', summing numerical values
+    return resumen_mensual_despachos_clientes.groupby(
+        ['month', 'Bodega', 'Cliente']
+    ).agg({
+        'fecha_x': 'first',
+        'idcontacto': 'first',
+        'Pallets': 'sum',
+        'Unidades': 'sum',
+        'CBM': 'sum',
+    }).reset_index()
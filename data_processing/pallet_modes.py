@@ -0,0 +1,93 @@
+import hashlib
+import os
+import socket
+import pandas as pd
+
+
+def estimate_pallet_modes(saldo_inv_cliente_fact, location_col='idubica1'):
+    """
+    Modal number of inventory rows per pallet location for every SKU.
+
+    Counts the rows of every (SKU, location) pair and keeps, for each SKU, the most frequent count. Ties go to
+    the smallest count, as `Series.mode()[0]` does.
+
+    Args:
+        saldo_inv_cliente_fact (pd.DataFrame): Current inventory with a pallet location per row.
+        location_col (str): Pallet location column.
+
+    Returns:
+        pd.DataFrame: One row per SKU with its 'mode_count'.
+    """
+    rows = saldo_inv_cliente_fact.dropna(subset=['idmodelo', location_col])
+    counts = rows.groupby(['idmodelo', location_col]).size().rename('count').reset_index()
+
+    frequencies = counts.groupby(['idmodelo', 'count']).size().rename('frequency').reset_index()
+    frequencies = frequencies.sort_values(['idmodelo', 'frequency', 'count'], ascending=[True, False, True],
+                                          kind='stable')
+
+    modes = frequencies.drop_duplicates(subset='idmodelo', keep='first')
+    return modes[['idmodelo', 'count']].rename(columns={'count': 'mode_count'}).reset_index(drop=True)
+
+
+def get_pallet_mode_overrides_path():
+    """
+    Returns the path to 'pallet_mode_KC.xlsx' on this host, or None where it is not available.
+    """
+    if os.name == 'nt':  # Windows
+        return None
+    hostname = socket.gethostname()
+    if 'JM-MS.local' in hostname:  # For Mac Studio
+        return (r'/Users/jm/Library/Mobile Documents/com~apple~CloudDocs/GM/MOBU - OPL/assets/'
+                r'inventory_analysis_client/pallet_mode_KC.xlsx')
+    if 'MacBook-Pro.local' in hostname:  # For MacBook Pro
+        return (r'/Users/j.m./Library/Mobile Documents/com~apple~CloudDocs/GM/MOBU - OPL/assets/'
+                r'inventory_analysis_client/pallet_mode_KC.xlsx')
+    return None
+
+
+def load_pallet_mode_overrides(path=None):
+    """
+    Manually maintained SKU -> mode_count table, first row per SKU, or None if the file is not available.
+    """
+    path = path or get_pallet_mode_overrides_path()
+    if path is None or not os.path.exists(path):
+        return None
+
+    overrides = pd.read_excel(path)
+    overrides['idmodelo'] = overrides['idmodelo'].astype(str).str.strip()
+    overrides['mode_count'] = pd.to_numeric(overrides['mode_count'], errors='coerce')
+    return overrides.drop_duplicates(subset='idmodelo', keep='first')[['idmodelo', 'mode_count']]
+
+
+def pallet_mode_overrides_version(path=None):
+    """
+    Content hash of 'pallet_mode_KC.xlsx', or 'none' if the file is not available, so results built with the
+    overrides are rebuilt when the file changes.
+    """
+    path = path or get_pallet_mode_overrides_path()
+    if path is None or not os.path.exists(path):
+        return 'none'
+    with open(path, 'rb') as file:
+        return hashlib.blake2b(file.read(), digest_size=8).hexdigest()
+
+
+def attach_pallet_modes(df, modes, sku_col='idmodelo', overrides=None, default=1):
+    """
+    Add the 'mode_count' of every row's SKU to `df`, in place.
+
+    Args:
+        df (pd.DataFrame): Movements with a SKU column.
+        modes (pd.DataFrame): Output of estimate_pallet_modes.
+        sku_col (str): SKU column of `df`.
+        overrides (pd.DataFrame, optional): Output of load_pallet_mode_overrides; an override replaces the
+            estimated mode when it is larger.
+        default (int): Mode of the SKUs without an estimate.
+
+    Returns:
+        pd.DataFrame: The same frame with 'mode_count'.
+    """
+    df['mode_count'] = df[sku_col].map(modes.set_index('idmodelo')['mode_count']).fillna(default)
+    if overrides is not None:
+        override = df[sku_col].map(overrides.set_index('idmodelo')['mode_count'])
+        df['mode_count'] = df['mode_count'].where(~(override > df['mode_count']), override)
+    return df
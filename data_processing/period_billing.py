@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import pandas as pd
+from utils import get_base_output_path, consolidate_actual_inventory, dataset_version
+from data_processing.billing_reconstruction import (
+    billing_data_reconstruction, group_inflow_for_billing, group_outflow_for_billing, normalize_pallet_locations
+)
+from data_processing.pallet_modes import pallet_mode_overrides_version
+
+BILLING_HISTORY_NAME = 'billing_history.pkl'
+HISTORY_VERSION = 3
+
+
+class BillingHistory:
+    """
+    Historical inflow and outflow rows enriched with pallets and CBM, indexed by date for period billing.
+
+    The rows keep their original order; a stable argsort of 'fecha_x' turns every period into two binary searches,
+    and the rows found are put back in their original order so the 'first' / 'last' aggregates of the billing
+    tables match a plain date filter.
+
+    Args:
+        inflow_with_mode_historical (pd.DataFrame): First output of billing_data_reconstruction.
+        outflow_with_mode_historical (pd.DataFrame): Second output of billing_data_reconstruction.
+        final_df (pd.DataFrame): Third output of billing_data_reconstruction (actual inventory as of today).
+        version (str, optional): Dataset version the history was built from.
+    """
+
+    def __init__(self, inflow_with_mode_historical, outflow_with_mode_historical, final_df, version=None):
+        self.inflow = inflow_with_mode_historical
+        self.outflow = outflow_with_mode_historical
+        self.final_df = final_df
+        self.version = version
+        self._inflow_index = self._date_index(self.inflow)
+        self._outflow_index = self._date_index(self.outflow)
+
+    @staticmethod
+    def _date_index(df):
+        # Sorted dates and the positions of their rows, leaving out the rows without a date
+        dates = pd.to_datetime(df['fecha_x']).to_numpy()
+        positions = np.flatnonzero(~np.isnat(dates))
+        order = positions[np.argsort(dates[positions], kind='stable')]
+        return dates[order], order
+
+    @staticmethod
+    def _rows_between(df, index, start_dates, end_dates):
+        dates, order = index
+        lows = np.searchsorted(dates, start_dates, side='left')
+        highs = np.searchsorted(dates, end_dates, side='right')
+        return [df.iloc[np.sort(order[low:high])] for low, high in zip(lows, highs)]
+
+    def bill_periods(self, periods):
+        """
+        Inflow and outflow billing tables of many periods in one call.
+
+        Args:
+            periods (list of tuple or pd.PeriodIndex): Inclusive (start_date, end_date) pairs, or periods.
+
+        Returns:
+            dict: {period: (inflow_grouped, outflow_grouped)}, keyed by the (start_date, end_date) pair or the period.
+        """
+        if isinstance(periods, pd.PeriodIndex):
+            keys = list(periods)
+            start_dates = periods.start_time.to_numpy()
+            end_dates = periods.end_time.to_numpy()
+        else:
+            keys = [tuple(period) for period in periods]
+            start_dates = pd.to_datetime([start for start, _ in keys]).to_numpy()
+            end_dates = pd.to_datetime([end for _, end in keys]).to_numpy()
+
+        inflows = self._rows_between(self.inflow, self._inflow_index, start_dates, end_dates)
+        outflows = self._rows_between(self.outflow, self._outflow_index, start_dates, end_dates)
+
+        return {
+            key: (group_inflow_for_billing(inflow), group_outflow_for_billing(outflow))
+            for key, inflow, outflow in zip(keys, inflows, outflows)
+        }
+
+    def bill(self, start_date, end_date):
+        """
+        Inflow and outflow billing tables of a single period, as billing_data_reconstruction builds them.
+        """
+        return self.bill_periods([(start_date, end_date)])[(start_date, end_date)]
+
+
+def get_billing_history_path(idcontacto=None):
+    # One history per client, so switching clients does not overwrite the history of the previous one
+    name = BILLING_HISTORY_NAME if idcontacto is None else f'billing_history_{idcontacto}.pkl'
+    return os.path.join(get_base_output_path(), name)
+
+
+def get_billing_history(saldo_inv_cliente_fact, resumen_mensual_ingresos_fact, resumen_despachos_cliente_fact,
+                        registro_ingresos, supplier_info, idcontacto=None, path=None):
+    """
+    Billing history of the current dataset, read from disk when it was already built for the same version.
+
+    The history is built with billing_data_reconstruction over the whole date range, on copies of the inputs.
+    Only the inflow and outflow movements are stored: the actual inventory ('Days' counted up to today) is
+    consolidated again on every call. The version covers the inputs, in row order, and 'pallet_mode_KC.xlsx'.
+
+    Args:
+        saldo_inv_cliente_fact, resumen_mensual_ingresos_fact, resumen_despachos_cliente_fact, registro_ingresos,
+            supplier_info (pd.DataFrame): Same inputs as billing_data_reconstruction.
+        idcontacto (str, optional): Client of the inputs; every client keeps its own history on disk.
+        path (str, optional): Pickle holding the last history built. Defaults to get_billing_history_path().
+
+    Returns:
+        BillingHistory: The history of the dataset version.
+    """
+    path = path or get_billing_history_path(idcontacto)
+    inputs = [saldo_inv_cliente_fact, resumen_mensual_ingresos_fact, resumen_despachos_cliente_fact,
+              registro_ingresos, supplier_info]
+    # The outflow pallets also depend on the manual overrides read by billing_data_reconstruction
+    version = f'{dataset_version(*inputs)}-{pallet_mode_overrides_version()}'
+
+    if os.path.exists(path):
+        stored = pd.read_pickle(path)
+        if stored.get('history_version') == HISTORY_VERSION and stored.get('version') == version:
+            print("\nBilling history is up to date, reusing it.\n")
+            final_df, _ = consolidate_actual_inventory(normalize_pallet_locations(saldo_inv_cliente_fact.copy()))
+            return BillingHistory(stored['inflow'], stored['outflow'], final_df, version)
+
+    # All-history totals are not meaningful for the selected range, so the build does not print them
+    inflow_with_mode_historical, outflow_with_mode_historical, final_df = billing_data_reconstruction(
+        *[df.copy() for df in inputs[:3]], pd.Timestamp.min, pd.Timestamp.max,
+        registro_ingresos.copy(), supplier_info.copy(), verbose=False)
+
+    pd.to_pickle({
+        'history_version': HISTORY_VERSION,
+        'version': version,
+        'inflow': inflow_with_mode_historical,
+        'outflow': outflow_with_mode_historical,
+    }, path)
+    return BillingHistory(inflow_with_mode_historical, outflow_with_mode_historical, final_df, version)
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+from data_processing.inventory_ledger import daily_inventory_flows, replay_ledger, LEDGER_KEYS
+
+STORAGE_KEYS = LEDGER_KEYS + ['idmodelo']
+STORAGE_MEASURES = {'Pallets': 'Pallet-days', 'CBM': 'CBM-days'}
+
+
+def _day_numbers(dates):
+    return pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+class StorageBillingAccumulator:
+    """
+    Pallet-days and CBM-days of every client, warehouse and SKU over any billing period.
+
+    The closing level of a key only changes on its days with movements, so the level-days up to any day are the
+    level-days up to its last movement plus that movement's closing level times the days since. Those prefix sums
+    are computed once per event; every period is then two binary searches per key, for all keys and periods at
+    once, instead of filtering and summing daily levels per period.
+
+    Args:
+        ledger (pd.DataFrame): Ledger rows by STORAGE_KEYS (replay_ledger over daily_inventory_flows(by_sku=True)).
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger.sort_values(STORAGE_KEYS + ['date'], kind='stable').reset_index(drop=True)
+        codes = self.ledger.groupby(STORAGE_KEYS, sort=False).ngroup().to_numpy()
+        self.keys = self.ledger.drop_duplicates(STORAGE_KEYS)[STORAGE_KEYS].reset_index(drop=True)
+        self._first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], int)
+
+        # Key code in the high bits and day number in the low bits: one sorted array for every key's events
+        self._days = _day_numbers(self.ledger['date'])
+        self._day_origin = int(self._days.min()) if len(codes) else 0
+        self._search = codes.astype(np.int64) * (1 << 32) + (self._days - self._day_origin)
+
+        self._closing = {}
+        self._prefix = {}
+        for measure in STORAGE_MEASURES:
+            closing = self.ledger[f'Closing {measure}'].to_numpy(dtype='float64')
+            # Level-days from the key's first movement through the day before every movement
+            held = np.r_[0.0, closing[:-1] * np.diff(self._days)]
+            held[self._first] = 0.0
+            self._prefix[measure] = pd.Series(held).groupby(codes).cumsum().to_numpy()
+            self._closing[measure] = closing
+
+    def _level_days_through(self, key_codes, days):
+        """
+        Level-days of every key from its first movement through `days` (inclusive), for every measure.
+        """
+        query = key_codes.astype(np.int64) * (1 << 32) + (days - self._day_origin)
+        positions = np.searchsorted(self._search, query, side='right') - 1
+        before_first = (positions < self._first[key_codes])
+        positions = np.where(before_first, self._first[key_codes], positions)
+
+        elapsed = days - self._days[positions]
+        totals = {}
+        for measure in STORAGE_MEASURES:
+            through = self._prefix[measure][positions] + self._closing[measure][positions] * (elapsed + 1)
+            # Nothing is stored before the first movement of a key
+            totals[measure] = np.where(before_first, 0.0, through)
+        return totals
+
+    def accumulate(self, periods):
+        """
+        Pallet-days, CBM-days and average occupancy of every client, warehouse and SKU in every period.
+
+        Args:
+            periods (list of tuple or pd.PeriodIndex): Inclusive (start_date, end_date) pairs, or periods.
+
+        Returns:
+            pd.DataFrame: One row per period and key with stock, with 'period', the STORAGE_KEYS, 'Days',
+            'Pallet-days', 'CBM-days', 'Average pallets' and 'Average CBM'.
+        """
+        if isinstance(periods, pd.PeriodIndex):
+            labels = list(periods)
+            starts = _day_numbers(periods.start_time)
+            ends = _day_numbers(periods.end_time)
+        else:
+            labels = [tuple(period) for period in periods]
+            starts = _day_numbers(pd.to_datetime([start for start, _ in labels]))
+            ends = _day_numbers(pd.to_datetime([end for _, end in labels]))
+
+        num_keys = len(self.keys)
+        if not num_keys:
+            return pd.DataFrame(columns=['period'] + STORAGE_KEYS + ['Days', 'Pallet-days', 'CBM-days',
+                                                                     'Average pallets', 'Average CBM'])
+        key_codes = np.tile(np.arange(num_keys), len(labels))
+        through_end = self._level_days_through(key_codes, np.repeat(ends, num_keys))
+        through_start = self._level_days_through(key_codes, np.repeat(starts - 1, num_keys))
+
+        billed = self.keys.iloc[key_codes].reset_index(drop=True)
+        billed.insert(0, 'period', pd.Series(labels, dtype=object).repeat(num_keys).to_numpy())
+        billed['Days'] = np.repeat(ends - starts + 1, num_keys)
+        for measure, column in STORAGE_MEASURES.items():
+            billed[column] = through_end[measure] - through_start[measure]
+        billed['Average pallets'] = billed['Pallet-days'] / billed['Days']
+        billed['Average CBM'] = billed['CBM-days'] / billed['Days']
+
+        return billed[(billed['Pallet-days'] > 0) | (billed['CBM-days'] > 0)].reset_index(drop=True)
+
+    def bill(self, start_date, end_date, by=STORAGE_KEYS):
+        """
+        Pallet-days and CBM-days of a single period, summed by `by` (e.g. ['idcontacto', 'Bodega']).
+        """
+        billed = self.accumulate([(start_date, end_date)])
+        totals = billed.groupby(list(by))[['Pallet-days', 'CBM-days']].sum().reset_index()
+        days = (pd.Timestamp(end_date).normalize() - pd.Timestamp(start_date).normalize()).days + 1
+        totals['Average pallets'] = totals['Pallet-days'] / days
+        totals['Average CBM'] = totals['CBM-days'] / days
+        return totals
+
+
+def build_storage_accumulator(inflow_with_mode_historical, outflow_with_mode_historical):
+    """
+    Storage billing accumulator over the inflow and outflow movements of billing_data_reconstruction.
+
+    Args:
+        inflow_with_mode_historical (pd.DataFrame): Inflow rows with their pallets.
+        outflow_with_mode_historical (pd.DataFrame): Outflow rows with their pallets.
+
+    Returns:
+        StorageBillingAccumulator: Levels by client, warehouse and SKU, ready for any billing period.
+    """
+    flows = daily_inventory_flows(inflow_with_mode_historical, outflow_with_mode_historical, by_sku=True)
+    return StorageBillingAccumulator(replay_ledger(flows, keys=STORAGE_KEYS))
@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
 import os
+from utils import map_distinct
 
 
 # Function to resolve Bodega conflicts
@@ -50,34 +52,104 @@ def resolve_bodega(row):
     # All other cases as incoherent
     return "INCOHERENT VALUES"
 
-def handle_unknown_bodega(merged_ingresos_inventario):
+def _normalize_bodega_values(column):
+    # Same normalization as resolve_bodega: strip and upper-case strings, leave anything else untouched
+    return map_distinct(column, lambda values: [v.strip().upper() if isinstance(v, str) else v for v in values])
+
+
+def resolve_bodega_column(df):
     """
-    Handles rows with 'DESCONOCIDO' in the 'bodega' column.
+    Vectorized `resolve_bodega` over a whole frame.
+
+    Decision table over (`bodega_x`, `bodega_y`, `idubica_x`, `idubica`) evaluated with `np.select`, so the
+    first matching branch wins exactly as in the row-wise function, which remains the reference.
 
     Args:
-        merged_ingresos_inventario (pd.DataFrame): The merged DataFrame with `bodega` and other columns.
+        df (pd.DataFrame): Frame with `bodega_x`, `bodega_y`, `idubica_x` and `idubica` columns.
 
     Returns:
-        pd.DataFrame: Updated DataFrame after handling 'DESCONOCIDO' values.
-        pd.DataFrame: Eligible rows for replacement.
-        pd.DataFrame: Rows successfully replaced.
-        pd.DataFrame: Remaining rows with 'DESCONOCIDO'.
+        pd.Series: Resolved warehouse per row, aligned with `df.index`.
     """
+    x = _normalize_bodega_values(df['bodega_x'])
+    y = _normalize_bodega_values(df['bodega_y'])
+    id_x = _normalize_bodega_values(df['idubica_x'])
+    id_y = _normalize_bodega_values(df['idubica'])
 
-    # Create a filtered DataFrame excluding 'DESCONOCIDO'
-    filtered_bodegas = merged_ingresos_inventario[merged_ingresos_inventario['bodega'] != 'DESCONOCIDO']
+    x_na, y_na = x.isna(), y.isna()
+    x_desc, y_desc = x.eq("DESCONOCIDO"), y.eq("DESCONOCIDO")
+    x_piso, y_piso = x.eq("PISO"), y.eq("PISO")
 
-    # Find replacement bodega for each idcontacto_x where there is exactly one unique bodega
-    replacement_bodega = filtered_bodegas.groupby('idcontacto').filter(lambda x: len(x['bodega'].unique()) == 1)
-    replacement_bodega = replacement_bodega.groupby('idcontacto')['bodega'].first()
+    # The idubica checks of the first three branches in resolve_bodega always hold, so they reduce to
+    # returning the other side's bodega.
+    decision_table = [
+        (x_desc & ~y_desc, y),
+        (y_desc & ~x_desc, x),
+        (~x_na & ~y_na & x.ne(y), y),
+        (x_piso & ~y_desc & id_y.notna(), y),
+        (x_piso & ~y_desc, "INCOHERENT VALUES"),
+        (y_piso & ~x_desc & id_x.notna(), x),
+        (y_piso & ~x_desc, "INCOHERENT VALUES"),
+        (x_na & y_na, "INCOHERENT VALUES"),
+        (x_desc & y_desc, "DESCONOCIDO"),
+        (x_na, y),
+        (y_na, x),
+        (x.eq(y), x),
+    ]
 
-    # Create mask for rows where bodega is 'DESCONOCIDO' and valid replacement exists
-    mask = (merged_ingresos_inventario['bodega'] == 'DESCONOCIDO') & \
-           merged_ingresos_inventario['idcontacto'].isin(replacement_bodega.index)
+    conditions = [condition.to_numpy(dtype=bool) for condition, _ in decision_table]
+    choices = [choice.to_numpy(dtype=object) if isinstance(choice, pd.Series) else choice
+               for _, choice in decision_table]
+    resolved = np.select(conditions, choices, default="INCOHERENT VALUES")
 
-    # Apply the replacement
-    merged_ingresos_inventario.loc[mask, 'bodega'] = merged_ingresos_inventario.loc[mask, 'idcontacto'].map(
-        replacement_bodega)
+    return pd.Series(resolved, index=df.index, dtype=object)
 
 
-    return merged_ingresos_inventario
+def single_warehouse_clients(df, client_col='idcontacto', bodega_col='bodega', unknown='DESCONOCIDO'):
+    """
+    Find the clients whose known rows all sit in a single warehouse.
+
+    Args:
+        df (pd.DataFrame): Frame with client and warehouse columns.
+        client_col (str): Client column.
+        bodega_col (str): Warehouse column.
+        unknown (str): Placeholder for rows with no known warehouse; ignored when counting warehouses.
+
+    Returns:
+        pd.Series: Warehouse indexed by client, only for clients with exactly one known warehouse.
+    """
+    known = df.loc[df[bodega_col] != unknown, [client_col, bodega_col]]
+    by_client = known.groupby(client_col)[bodega_col]
+    n_bodegas = by_client.nunique(dropna=False)
+    return by_client.first()[n_bodegas == 1]
+
+
+def fill_unknown_bodega(df, client_col='idcontacto', bodega_col='bodega', unknown='DESCONOCIDO'):
+    """
+    Replace `unknown` warehouses with the only warehouse the client is known to use, in place.
+
+    Args:
+        df (pd.DataFrame): Frame with client and warehouse columns.
+        client_col (str): Client column.
+        bodega_col (str): Warehouse column.
+        unknown (str): Placeholder to back-fill.
+
+    Returns:
+        pd.DataFrame: The same frame with the back-filled warehouse column.
+    """
+    replacement_bodega = single_warehouse_clients(df, client_col, bodega_col, unknown)
+    mask = (df[bodega_col] == unknown) & df[client_col].isin(replacement_bodega.index)
+    df.loc[mask, bodega_col] = df.loc[mask, client_col].map(replacement_bodega)
+    return df
+
+
+def handle_unknown_bodega(merged_ingresos_inventario):
+    """
+    Handles rows with 'DESCONOCIDO' in the 'bodega' column.
+
+    Args:
+        merged_ingresos_inventario (pd.DataFrame): The merged DataFrame with `bodega` and other columns.
+
+    Returns:
+        pd.DataFrame: Updated DataFrame after handling 'DESCONOCIDO' values.
+    """
+    return fill_unknown_bodega(merged_ingresos_inventario, client_col='idcontacto')
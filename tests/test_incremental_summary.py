@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processing.monthly_summary as monthly_summary
+from data_processing.incremental_summary import incremental_receptions_summary, incremental_dispatch_summary
+
+
+@pytest.fixture(autouse=True)
+def no_progress_delay(monkeypatch):
+    monkeypatch.setattr(monthly_summary.time, 'sleep', lambda seconds: None)
+
+
+def _dates(rng, n):
+    instants = pd.date_range('2023-10-01', periods=10 ** 6, freq='17s')
+    return pd.Series(pd.DatetimeIndex(rng.choice(instants, n, replace=False)).strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def _operations(seed=0):
+    rng = np.random.default_rng(seed)
+    clients = ['5', '12', '7_c', '9_e']
+    # Some idingreso and itemno are missing, and '1' + '23' builds the same key as '12' + '3'
+    itemnos = np.array(['1', '2', '3', '23', None], dtype=object)
+
+    n = 300
+    idingreso = np.array([str(i) for i in rng.integers(1, 120, n)])
+    idingreso[rng.random(n) < 0.05] = '1'
+    registro_ingresos = pd.DataFrame({
+        'fecha': _dates(rng, n),
+        'items': rng.integers(1, 5, n).astype(str),
+        'idcontacto': rng.choice(clients, n),
+        'idingreso': idingreso,
+        'retnum': rng.integers(1, 9, n).astype(str),
+        'bodega': rng.choice(['BODA', 'BODC', 'DESCONOCIDO', ' boda'], n),
+        'idubica': rng.choice(['A1', 'C2', 'P00000'], n),
+    })
+
+    n = 900
+    inventario = pd.DataFrame({
+        'fecha': _dates(rng, n),
+        'modifica': _dates(rng, n),
+        'ingresa': _dates(rng, n),
+        'inicial': rng.choice([0, 0.5, 1.2, 3], n).astype(str),
+        'salidas': rng.choice(['0', '1'], n),
+        'idpedido': rng.integers(1, 99, n).astype(str),
+        'pesokgs': rng.choice(['0', '3', '10'], n),
+        'idcontacto': rng.choice(clients, n),
+        'idingreso': np.array([str(i) for i in rng.integers(1, 70, n)]),
+        'itemno': rng.choice(itemnos, n),
+        'idmodelo': rng.choice(['M1', 'M2'], n),
+        'idcoldis': 'x',
+        'idubica': rng.choice(['A1', 'G1', 'E2'], n),
+        'retnum': '1',
+        'descrip': rng.choice(['p', 'q'], n),
+    })
+
+    n = 1500
+    rpsdt_productos = pd.DataFrame({
+        'bodega': rng.choice(['BODA', 'BODG', 'DESCONOCIDO'], n),
+        'idubica': rng.choice(['A1', 'G1'], n),
+        'idingreso': np.array([str(i) for i in rng.integers(1, 80, n)]),
+    })
+
+    n = 800
+    registro_salidas = pd.DataFrame({
+        'fecha': _dates(rng, n),
+        'cantidad': rng.choice(['1', '2.5'], n),
+        'idcontacto': rng.choice(clients[:3], n),
+        'idingreso': np.array([str(i) for i in rng.integers(1, 140, n)]),
+        'itemno': rng.choice(itemnos, n),
+        'numero': rng.integers(1, 50, n).astype(str),
+        'bodega': rng.choice(['BODA', 'DESCONOCIDO', 'BODC'], n),
+    })
+
+    supplier_info = pd.DataFrame({'idcontacto': clients, 'descrip': ['A', 'B', 'C', 'D']})
+    return registro_ingresos, inventario, rpsdt_productos, registro_salidas, supplier_info
+
+
+def _assert_incremental_matches_full(operations, store_path):
+    registro_ingresos, inventario, rpsdt_productos, registro_salidas, supplier_info = operations
+
+    receptions = monthly_summary.monthly_receptions_summary(
+        registro_ingresos.copy(), supplier_info.copy(), inventario.copy(), rpsdt_productos.copy(), write_csv=False)[0]
+    dispatches = monthly_summary.monthly_dispatch_summary(
+        registro_salidas.copy(), inventario.copy(), supplier_info.copy(), write_csv=False)[0]
+
+    pd.testing.assert_frame_equal(
+        incremental_receptions_summary(registro_ingresos, supplier_info, inventario, rpsdt_productos,
+                                       store_path=store_path).reset_index(drop=True),
+        receptions.reset_index(drop=True), check_dtype=False)
+    pd.testing.assert_frame_equal(
+        incremental_dispatch_summary(registro_salidas, inventario, supplier_info,
+                                     store_path=store_path).reset_index(drop=True),
+        dispatches.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_incremental_summaries_match_the_full_summaries(seed, tmp_path):
+    store_path = str(tmp_path / 'monthly_summary_store.pkl')
+    registro_ingresos, inventario, rpsdt_productos, registro_salidas, supplier_info = _operations(seed)
+    _assert_incremental_matches_full(
+        (registro_ingresos, inventario, rpsdt_productos, registro_salidas, supplier_info), store_path)
+
+    # A changed month: edited receptions of October and dispatch quantities
+    october = pd.to_datetime(registro_ingresos['fecha']).dt.strftime('%Y-%m') == '2023-10'
+    registro_ingresos.loc[october[october].index[:3], 'items'] = '9'
+    registro_salidas.loc[registro_salidas.index[:2], 'cantidad'] = '7'
+    _assert_incremental_matches_full(
+        (registro_ingresos, inventario, rpsdt_productos, registro_salidas, supplier_info), store_path)
+
+    # Back-dated rows, one of them without itemno
+    back_dated_reception = registro_ingresos.iloc[[0]].assign(fecha='2023-10-02 08:00:00', idingreso='555')
+    back_dated_dispatches = registro_salidas.iloc[[0, 1]].assign(fecha='2023-10-03 08:00:00', idingreso='556',
+                                                                 itemno=['1', None])
+    registro_ingresos = pd.concat([registro_ingresos, back_dated_reception], ignore_index=True)
+    registro_salidas = pd.concat([registro_salidas, back_dated_dispatches], ignore_index=True)
+    _assert_incremental_matches_full(
+        (registro_ingresos, inventario, rpsdt_productos, registro_salidas, supplier_info), store_path)
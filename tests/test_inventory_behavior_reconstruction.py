@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processing.inventory_behavior_reconstruction as reconstruction
+from data_processing.inventory_ledger import (
+    daily_inventory_flows, replay_ledger, update_inventory_ledger, ledger_levels_on
+)
+
+
+@pytest.fixture(autouse=True)
+def no_progress_delay(monkeypatch):
+    monkeypatch.setattr(reconstruction.time, 'sleep', lambda seconds: None)
+
+
+def _movements(seed=0, n=400):
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 120, n), unit='D')
+    clients = np.array(['001', '002', '003', None], dtype=object)
+    inflow = pd.DataFrame({
+        'fecha_x': days + pd.to_timedelta(rng.integers(0, 86400, n), unit='s'),
+        'idcontacto': rng.choice(clients, n, p=[0.4, 0.3, 0.25, 0.05]),
+        'Bodega': rng.choice(['BODA', 'BODC', 'INCOHERENT VALUES', 'DESCONOCIDO'], n),
+        'idingreso': rng.integers(1, 60, n).astype(str),
+        'itemno': rng.integers(1, 4, n).astype(str),
+        'idmodelo': rng.choice(['M1', 'M2'], n),
+        'inicial': rng.random(n) * 3,
+        'pesokgs': rng.integers(1, 20, n).astype(float),
+        'pallets_final': rng.integers(1, 4, n).astype(float),
+    })
+    # Raw outflow warehouses, and more CBM shipped than received so the level hits zero
+    outflow = pd.DataFrame({
+        'fecha_x': pd.Timestamp('2024-01-10') + pd.to_timedelta(rng.integers(0, 120, n), unit='D'),
+        'idcontacto': rng.choice(clients, n, p=[0.4, 0.3, 0.25, 0.05]),
+        'bodega': rng.choice([' boda', 'BODC', 'bodc ', None, 'DESCONOCIDO'], n),
+        'idingreso': rng.integers(1, 60, n).astype(str),
+        'itemno': rng.integers(1, 4, n).astype(str),
+        'trannum': rng.integers(1, 150, n).astype(str),
+        'idmodelo_x': rng.choice(['M1', 'M2'], n),
+        'cantidad': rng.random(n) * 4,
+        'pesokgs': rng.integers(1, 25, n).astype(float),
+        'calculated_pallets': rng.integers(1, 4, n).astype(float),
+    })
+    return inflow, outflow
+
+
+def _old_company_levels(inflow, outflow, initial_inventory=None):
+    """
+    Company-wide 'Inventory level (CBM)' as the original iterrows loop computed it.
+    """
+    inflow = inflow.assign(fecha_x=inflow['fecha_x'].dt.normalize())
+    outflow = outflow.assign(fecha_x=outflow['fecha_x'].dt.normalize())
+    dates = sorted(set(inflow['fecha_x']) | set(outflow['fecha_x']))
+
+    daily_inflows = inflow.groupby(['fecha_x', 'idcontacto'])['inicial'].sum().groupby('fecha_x').sum()
+    daily_outflows = outflow.groupby(['fecha_x', 'idcontacto'])['cantidad'].sum().groupby('fecha_x').sum()
+    daily_agg = pd.DataFrame({'Inflow (CBM)': daily_inflows.reindex(dates, fill_value=0),
+                              'Outflow (CBM)': daily_outflows.reindex(dates, fill_value=0)})
+
+    clients = pd.concat([inflow['idcontacto'], outflow['idcontacto']]).dropna().unique()
+    current_inventory = 0.0
+    if initial_inventory is not None:
+        current_inventory = initial_inventory.set_index('idcontacto')['initial_inventory'].reindex(clients).sum()
+
+    inventory_levels = []
+    for idx, row in daily_agg.iterrows():
+        new_inventory = current_inventory + row['Inflow (CBM)'] - row['Outflow (CBM)']
+        if new_inventory < 0:
+            new_inventory = 0
+        inventory_levels.append(new_inventory)
+        current_inventory = new_inventory
+
+    return pd.Series(inventory_levels, index=pd.DatetimeIndex(dates), name='Inventory level (CBM)')
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('with_initial', [False, True])
+def test_company_level_matches_original_loop(seed, with_initial):
+    inflow, outflow = _movements(seed)
+    initial_inventory = None
+    if with_initial:
+        initial_inventory = pd.DataFrame({'idcontacto': ['001', '003'], 'initial_inventory': [25.0, 7.5]})
+    expected = _old_company_levels(inflow, outflow, initial_inventory)
+
+    inventory_over_time, _ = reconstruction.reconstruct_inventory_over_time(
+        inflow.copy(), outflow.copy(), initial_inventory=initial_inventory)
+
+    assert list(inventory_over_time['date']) == list(expected.index)
+    np.testing.assert_allclose(inventory_over_time['Inventory level (CBM)'].to_numpy(), expected.to_numpy(),
+                               rtol=0, atol=1e-9)
+
+
+def test_inflow_and_outflow_share_warehouse_labels():
+    inflow, outflow = _movements(3)
+
+    flows = daily_inventory_flows(inflow, outflow)
+
+    assert set(flows['Bodega']) <= {'BODA', 'BODC', 'DESCONOCIDO'}
+
+
+def test_stored_ledger_gives_the_same_reconstruction(tmp_path):
+    inflow, outflow = _movements(4)
+    replayed = reconstruction.reconstruct_inventory_over_time(inflow.copy(), outflow.copy())
+
+    ledger = update_inventory_ledger(inflow.copy(), outflow.copy(), path=str(tmp_path / 'inventory_ledger.pkl'))
+    from_ledger = reconstruction.reconstruct_inventory_over_time(inflow.copy(), outflow.copy(), ledger=ledger)
+
+    for expected, result in zip(replayed, from_ledger):
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_ledger_levels_carry_the_last_closing_level_forward():
+    inflow, outflow = _movements(5)
+    ledger = replay_ledger(daily_inventory_flows(inflow, outflow))
+    days = pd.date_range('2023-12-30', '2024-05-15', freq='7D')
+    levels = ledger_levels_on(ledger, days)
+
+    for (client, bodega, day), level in levels.set_index(['idcontacto', 'Bodega', 'date'])['Closing CBM'].items():
+        rows = ledger[(ledger['idcontacto'] == client) & (ledger['Bodega'] == bodega) & (ledger['date'] <= day)]
+        assert level == (rows['Closing CBM'].iloc[-1] if len(rows) else 0.0)
+
+    by_warehouse = ledger_levels_on(ledger, days, by=['Bodega']).set_index(['Bodega', 'date'])
+    expected = levels.groupby(['Bodega', 'date'])[['Closing CBM', 'Closing Units', 'Closing Pallets']].sum()
+    pd.testing.assert_frame_equal(by_warehouse, expected)
+
+
+def test_updated_ledger_matches_a_full_replay(tmp_path):
+    inflow, outflow = _movements(6)
+    path = str(tmp_path / 'inventory_ledger.pkl')
+    update_inventory_ledger(inflow.copy(), outflow.copy(), path=path)
+
+    # A back-dated reception and a few later dispatches deleted since the stored run: the days before the
+    # earliest change are kept and the rest is replayed
+    back_dated = inflow.iloc[[0]].assign(fecha_x=pd.Timestamp('2024-02-15'), idcontacto='001', Bodega='BODA',
+                                       idingreso='999', inicial=5.0)
+    inflow = pd.concat([inflow, back_dated], ignore_index=True)
+    deleted = outflow.index[outflow['fecha_x'] >= pd.Timestamp('2024-03-01')][:10]
+    outflow = outflow.drop(deleted).reset_index(drop=True)
+
+    updated = update_inventory_ledger(inflow.copy(), outflow.copy(), path=path)
+    expected = replay_ledger(daily_inventory_flows(inflow, outflow))
+    pd.testing.assert_frame_equal(updated.reset_index(drop=True), expected)
@@ -0,0 +1,37 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processing.warehouse_handler import resolve_bodega, resolve_bodega_column
+
+BODEGA_COLUMNS = ['bodega_x', 'bodega_y', 'idubica_x', 'idubica']
+
+# Blank, missing, mixed-case and padded values, the sentinels and real warehouses / locations
+VALUES = ['', '   ', np.nan, None, 'DESCONOCIDO', ' desconocido', 'PISO', 'Piso ', 'TIENDA', 'tienda',
+          'BODA', ' boda', 'BODC', 'A1']
+
+
+@pytest.fixture(scope='module')
+def all_combinations():
+    return pd.DataFrame(list(itertools.product(VALUES, repeat=len(BODEGA_COLUMNS))), columns=BODEGA_COLUMNS,
+                        dtype=object)
+
+
+def test_resolve_bodega_column_matches_row_wise(all_combinations):
+    expected = all_combinations.apply(resolve_bodega, axis=1)
+    resolved = resolve_bodega_column(all_combinations)
+
+    pd.testing.assert_series_equal(resolved, expected.astype(object), check_names=False)
+
+
+def test_resolve_bodega_column_keeps_index(all_combinations):
+    shuffled = all_combinations.sample(frac=1, random_state=0)
+    shuffled.index = shuffled.index * 3 + 7
+
+    resolved = resolve_bodega_column(shuffled)
+
+    assert resolved.index.equals(shuffled.index)
+    pd.testing.assert_series_equal(resolved, shuffled.apply(resolve_bodega, axis=1).astype(object),
+                                   check_names=False)
@@ -1,12 +1,21 @@
 from .data_utils import (
-    parse_date, filter_dataframes_by_idcontacto, filter_dataframes_by_warehouse,
-    clip_near_zero
+    parse_date, filter_dataframes_by_idcontacto, filter_dataframes_by_warehouse, DataFrameFilterIndex,
+    map_distinct, fill_blank_with_sentinel, dataset_version
 )
+from .date_utils import parse_date_column, detect_date_format, clear_date_format_cache
+from .numeric_utils import clip_near_zero, inf_to_nan, safe_divide, pct_change_safe
+from .inventory_kernels import clipped_cumsum, clipped_cumsum_by_group
+from .join_planner import estimate_merge_fanout, merge_at_grain, join_report
 from .path_utils import get_clean_hostname, get_base_path, get_base_output_path
 from .actual_inventory import (
-    capacity_measured_in_cubic_meters, inventory_oldest_products, filtering_historic_insaldo
+    capacity_measured_in_cubic_meters, inventory_oldest_products, filtering_historic_insaldo,
+    consolidate_actual_inventory
 )
 from .grouping_functions import group_by_month_bodega
 from .insaldo_complement import insaldo_bode_comp
 from .inventory_proportions import inventory_proportions_by_product
-from .kpi_calculations import kpi_calculation
\ No newline at end of file
+from .kpi_calculations import kpi_calculation
+from .memory_profiler import (
+    memory_checkpoint, memory_report, enable_memory_profiling, disable_memory_profiling,
+    is_memory_profiling_enabled, MemoryBudgetExceeded
+)
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import time
 from rich.progress import Progress
@@ -342,3 +343,95 @@ def filtering_historic_insaldo(inventory_over_time, start_date, end_date):
 
     return selected_month_data
 
+
+
+def _pallet_keys(idubica1):
+    """
+    Pallet key of every inventory row: rows on the same tagged location ('idubica1' not blank and not starting with
+    'R' or 'TM') share the rank of the location, rows without a location get a key of their own after every location,
+    and the other rows get NaN. Also returns the mask of the tagged rows.
+    """
+    location = idubica1.astype('string')
+    tagged = location.notna() & (location != '') & ~location.str.startswith('R', na=False) & \
+        ~location.str.startswith('TM', na=False)
+    loose = location.isna() | (location == '')
+
+    codes, _ = pd.factorize(location.where(tagged), sort=True)
+    keys = pd.Series(np.nan, index=idubica1.index)
+    keys[tagged.to_numpy()] = codes[tagged.to_numpy()]
+    keys[loose.to_numpy()] = codes.max(initial=-1) + 1 + np.arange(loose.sum())
+    return keys, tagged
+
+
+def consolidate_actual_inventory(saldo_inv_cliente_fact, today=None):
+    """
+    Current inventory by idingreso, counting one pallet per tagged location ('TA...' idubica1) and one per row
+    without a location, for every client in `saldo_inv_cliente_fact`.
+
+    Args:
+        saldo_inv_cliente_fact (pd.DataFrame): Output of `capacity_measured_in_cubic_meters`, one or many clients.
+        today (datetime.date, optional): Reference date for 'Days'. Defaults to the current date.
+
+    Returns:
+        tuple: (inventory by idingreso with its Date, location, CBM, pallets, units, warehouse and age in days,
+        summary by ClientID)
+    """
+    today = pd.Timestamp(today or datetime.now().date())
+    pallet_keys, tagged = _pallet_keys(saldo_inv_cliente_fact['idubica1'])
+    saldo = saldo_inv_cliente_fact.assign(pallet_key=pallet_keys)
+    if 'dup_key' not in saldo.columns:
+        # Label of the tagged pallets only
+        saldo['dup_key'] = (saldo['idingreso'] + saldo['itemno']).where(tagged)
+
+    # Step 1: One row per pallet (rows of a tagged location together, the loose rows on their own), tagged
+    # locations first
+    pallets = saldo.groupby('pallet_key').agg({
+        'idingreso': 'first',
+        'itemno': 'last',
+        'fecha': 'first',
+        'idcontacto': 'first',
+        'idubica': 'first',
+        'pesokgs': 'sum',
+        'inicial': 'sum',
+        'bodega': 'first',
+        'dup_key': 'first',
+    })
+
+    # Step 2: Group by 'idingreso', one pallet per row of step 1
+    final_df = pallets.groupby('idingreso').agg(
+        itemno=('itemno', 'first'),
+        dup_key=('dup_key', 'first'),
+        fecha=('fecha', 'first'),
+        idcontacto=('idcontacto', 'first'),
+        idubica=('idubica', 'first'),
+        inicial=('inicial', 'sum'),
+        pallets=('idingreso', 'size'),
+        pesokgs=('pesokgs', 'sum'),
+        bodega=('bodega', 'first'),
+    ).reset_index()
+
+    # Age in days of every idingreso, counting the reception day
+    fecha = pd.to_datetime(final_df['fecha'])
+    final_df['fecha'] = fecha.dt.date
+    final_df['Days'] = (today - fecha.dt.normalize()).dt.days + 1
+
+    final_df = final_df.rename(columns={
+        'fecha': 'Date',
+        'idubica': 'locationID',
+        'inicial': 'CBM',
+        'pesokgs': 'Weight or Units',
+        'bodega': 'Warehouse',
+        'idcontacto': 'ClientID',
+        'pallets': 'Pallets',
+        'dup_key': 'Label'
+    })
+
+    by_client = final_df.groupby('ClientID').agg(
+        Receptions=('idingreso', 'size'),
+        Pallets=('Pallets', 'sum'),
+        CBM=('CBM', 'sum'),
+        Units=('Weight or Units', 'sum'),
+        Oldest_Days=('Days', 'max'),
+    ).reset_index().rename(columns={'Units': 'Weight or Units', 'Oldest_Days': 'Oldest Days'})
+
+    return final_df, by_client
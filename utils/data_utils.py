@@ -1,68 +1,144 @@
-import datetime
+import hashlib
 import pandas as pd
 import numpy as np
+from utils.date_utils import parse_date
 
 
-def parse_date(date_str):
-    for fmt in ('%d-%m-%Y', '%d-%m-%y', '%d/%m/%Y', '%d/%m/%y'):
-        try:
-            return datetime.strptime(date_str, fmt)
-        except ValueError:
-            continue
-    raise ValueError("Invalid date format. Please enter dates in dd/mm/yy or dd-mm-yy format.")
+def _row_positions_by_value(df, pattern):
+    """
+    Map each stripped value of the columns whose name contains `pattern` to the sorted row positions holding it.
+    Returns None if the table has no such column.
+    """
+    columns = [col for col in df.columns if pattern in col]
+    if not columns:
+        return None
 
-def filter_dataframes_by_idcontacto(dataframes, idcontacto):
-    filtered_dataframes = []
-    for df in dataframes:
+    row_positions = pd.Series(np.arange(len(df)))
+    index = {}
+    for col in columns:
+        keys = df[col].astype(str).str.strip()
+        for value, positions in row_positions.groupby(keys.to_numpy()).indices.items():
+            index[value] = np.union1d(index[value], positions) if value in index else positions
+    return index
+
+
+class DataFrameFilterIndex:
+    """
+    Row-position indexes of a list of tables by client (`idcontacto` columns) and by warehouse (`bodega` columns).
+
+    The indexes are built once per column family on first use; each selection afterwards only slices the
+    matching rows, so interactive selections and loops over every client don't rescan the tables.
+
+    Args:
+        dataframes (list of pd.DataFrame): The tables to index.
+    """
+
+    def __init__(self, dataframes):
+        self.dataframes = list(dataframes)
+        self._indexes = {}
+
+    def _index(self, pattern):
+        if pattern not in self._indexes:
+            self._indexes[pattern] = [_row_positions_by_value(df, pattern) for df in self.dataframes]
+        return self._indexes[pattern]
+
+    def select(self, pattern, value):
+        """
+        Rows of every table where any column containing `pattern` equals `value` (after stripping).
+        Tables without such a column are returned as they are.
+        """
+        no_rows = np.array([], dtype=np.int64)
+        filtered_dataframes = []
+        for df, index in zip(self.dataframes, self._index(pattern)):
+            if index is None:
+                filtered_dataframes.append(df)
+            else:
+                filtered_dataframes.append(df.iloc[index.get(value, no_rows)])
+        return filtered_dataframes
+
+    def values(self, pattern):
+        """
+        Sorted distinct values found in the columns containing `pattern` across all tables.
+        """
+        return sorted(set().union(*(index for index in self._index(pattern) if index is not None)))
+
+    def selections(self, pattern):
+        """
+        (value, tables) for every distinct value of the columns containing `pattern`, e.g. every client for a batch
+        run over all clients, all of them from the same index.
+        """
+        for value in self.values(pattern):
+            yield value, self.select(pattern, value)
 
-        # Identify all columns that could represent 'idcontacto'
-        idcontacto_columns = [col for col in df.columns if 'idcontacto' in col]
-        if idcontacto_columns:
+    def by_idcontacto(self, idcontacto):
+        return self.select('idcontacto', idcontacto)
 
-            # Create a mask for rows where any 'idcontacto' column matches the target idcontacto
-            mask = pd.Series(False, index=df.index)
-            for col in idcontacto_columns:
-                mask |= (df[col].astype(str).str.strip() == idcontacto)
-            df_filtered = df[mask].copy()
-            filtered_dataframes.append(df_filtered)
-        else:
+    def by_warehouse(self, warehouse):
+        return self.select('bodega', warehouse)
 
-            # If 'idcontacto' not in columns, keep the DataFrame as is
-            filtered_dataframes.append(df)
-    return filtered_dataframes
+
+def _filter_index(dataframes):
+    # An index built once over the tables is reused as it is; a plain list of tables gets a one-off index
+    return dataframes if isinstance(dataframes, DataFrameFilterIndex) else DataFrameFilterIndex(dataframes)
+
+def filter_dataframes_by_idcontacto(dataframes, idcontacto):
+    return _filter_index(dataframes).by_idcontacto(idcontacto)
 
 def filter_dataframes_by_warehouse(dataframes, warehouse):
-    filtered_dataframes = []
-    for df in dataframes:
-
-        # Identify all columns that could represent 'bodega'
-        bodega_columns = [col for col in df.columns if 'bodega' in col]
-        if bodega_columns:
-
-            # Create a mask for rows where any 'bodega' column matches the target warehouse
-            mask = pd.Series(False, index=df.index)
-            for col in bodega_columns:
-                mask |= (df[col].astype(str).str.strip() == warehouse)
-            df_filtered = df[mask].copy()
-            filtered_dataframes.append(df_filtered)
-        else:
-
-            # If 'bodega' not in columns, keep the DataFrame as is
-            filtered_dataframes.append(df)
-    return filtered_dataframes
-
-def clip_near_zero(df, columns=None, epsilon=1e-6):
+    return _filter_index(dataframes).by_warehouse(warehouse)
+
+def map_distinct(series, func, na_value=np.nan):
     """
-    For each column in `columns`, set the value to 0 if abs(value) < epsilon.
-    If columns is None, applies to all float columns in df.
+    Evaluate `func` once over the distinct values of `series` and broadcast the result back to every row.
+
+    Args:
+        series (pd.Series): Column with few distinct values relative to its length (locations, clients...).
+        func (callable): Vectorized function taking a Series of distinct values and returning a same-length
+            array-like.
+        na_value: Result for missing values in `series`.
+
+    Returns:
+        pd.Series: Result aligned with `series.index`.
     """
-    if columns is None:
-        # Identify float columns automatically
-        columns = df.select_dtypes(include=[np.number]).columns
+    codes, uniques = pd.factorize(series)
+    values = np.asarray(func(pd.Series(uniques, dtype=object)), dtype=object)
+    # Code -1 (missing) picks the trailing na_value
+    values = np.append(values, na_value)
+    return pd.Series(values[codes], index=series.index, dtype=object)
 
-    for col in columns:
-        df[col] = df[col].apply(lambda x: 0 if abs(x) < epsilon else x)
+def fill_blank_with_sentinel(df, columns, sentinel="DESCONOCIDO"):
+    """
+    Replace missing or blank (whitespace-only) values with `sentinel` in the given columns, in place.
 
+    The blank check runs once per distinct value through the factorized codes.
+
+    Args:
+        df (pd.DataFrame): Table to normalize.
+        columns (list of str): Columns to normalize.
+        sentinel (str): Value for missing or blank cells.
+
+    Returns:
+        pd.DataFrame: The same DataFrame with normalized columns.
+    """
+    for col in columns:
+        codes, uniques = pd.factorize(df[col])
+        # Trailing True flags missing values (code -1)
+        blank = np.append([str(value).strip() == "" for value in uniques], True)
+        df[col] = df[col].mask(blank[codes], sentinel)
     return df
 
 
+def dataset_version(*tables):
+    """
+    Content hash of the given tables, used to tell whether results stored on disk belong to the current dataset.
+
+    The row hashes are digested in order, so reordered rows give another version: 'first' / 'last' aggregates
+    depend on the order.
+    """
+    hashes = []
+    for df in tables:
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(repr(list(df.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        hashes.append(f'{len(df)}:{digest.hexdigest()}')
+    return '-'.join(hashes)
@@ -1,6 +1,17 @@
 import pandas as pd
 from datetime import datetime
 
+# Formatos aceptados para fechas ingresadas por el usuario
+DATE_FORMATS = ('%d-%m-%Y', '%d-%m-%y', '%d/%m/%Y', '%d/%m/%y')
+
+# Candidate formats for date columns, tried in order on a sample of each column
+ISO_DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d')
+DAYFIRST_DATE_FORMATS = DATE_FORMATS + ('%d/%m/%Y %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%d/%m/%Y %H:%M')
+
+# (source file, column) -> detected format, so each source is only sniffed once per run
+_FORMAT_CACHE = {}
+
+
 def parse_date(date_str):
     """
     Parse a date string into a datetime object.
@@ -11,13 +22,100 @@ def parse_date(date_str):
     Returns:
         datetime: Parsed datetime object.
     """
-    for fmt in ('%d-%m-%Y', '%d-%m-%y', '%d/%m/%Y', '%d/%m/%y'):
+    for fmt in DATE_FORMATS:
         try:
             return datetime.strptime(date_str, fmt)
         except ValueError:
             continue
     raise ValueError("Invalid date format. Please enter dates in dd/mm/yy or dd-mm-yy format.")
 
+
+def detect_date_format(values, formats, sample_size=1000):
+    """
+    Find the format that parses most of a sample of distinct, non-empty date strings.
+
+    Args:
+        values (pd.Series): Date strings.
+        formats (sequence of str): Candidate `strptime` formats, in order of preference.
+        sample_size (int): Number of distinct values to test.
+
+    Returns:
+        str or None: The detected format, or None if no candidate parses at least half of the sample.
+    """
+    sample = pd.Series(pd.unique(values.dropna().head(sample_size * 10).to_numpy())).astype(str).str.strip()
+    sample = sample[sample != ''].head(sample_size)
+    if sample.empty:
+        return None
+
+    best_format, best_count = None, len(sample) / 2
+    for fmt in formats:
+        count = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if count == len(sample):
+            return fmt
+        if count > best_count:
+            best_format, best_count = fmt, count
+    return best_format
+
+
+def parse_date_column(series, formats=None, sample_size=1000, cache_key=None, dayfirst=True, errors='raise'):
+    """
+    Parse a whole column of date strings with one explicit format instead of per-element inference.
+
+    The format is detected once from a sample of the column and cached under (cache_key, column name),
+    so later calls for the same source file reuse it. Padded values are retried stripped, and values the
+    detected format still cannot parse (mixed formats in the file) fall back to
+    `pd.to_datetime(..., dayfirst=dayfirst)`.
+
+    Args:
+        series (pd.Series): Column to parse. Columns that are already datetime are returned unchanged.
+        formats (sequence of str, optional): Candidate formats. Defaults to ISO formats, plus the
+            day-first formats when `dayfirst` is True.
+        sample_size (int): Number of distinct values used to detect the format.
+        cache_key (str, optional): Source file of the column. Without it the format is not cached.
+        dayfirst (bool): Day-first interpretation for the fallback parser.
+        errors (str): 'raise' or 'coerce', as in `pd.to_datetime`.
+
+    Returns:
+        pd.Series: Parsed datetimes, aligned with `series`.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if formats is None:
+        formats = ISO_DATE_FORMATS + DAYFIRST_DATE_FORMATS if dayfirst else ISO_DATE_FORMATS
+
+    key = (cache_key, series.name)
+    fmt = _FORMAT_CACHE.get(key) if cache_key is not None else None
+    cached = fmt is not None
+    if fmt is None:
+        fmt = detect_date_format(series, formats, sample_size)
+        if fmt is None:
+            return pd.to_datetime(series, dayfirst=dayfirst, errors=errors)
+        if cache_key is not None:
+            _FORMAT_CACHE[key] = fmt
+
+    parsed = pd.to_datetime(series, format=fmt, errors='coerce')
+
+    # Only the values the detected format missed (other than blanks) need a second look
+    missed = (parsed.isna() & series.notna()).to_numpy().nonzero()[0]
+    text = series.iloc[missed].astype(str).str.strip()
+    missed, text = missed[(text != '').to_numpy()], text[text != '']
+    if cached and len(missed) > len(series) // 2:
+        # Most of the column no longer fits: the source file changed its format since it was cached
+        del _FORMAT_CACHE[key]
+        return parse_date_column(series, formats, sample_size, cache_key, dayfirst, errors)
+    if len(missed):
+        values = pd.to_datetime(text, format=fmt, errors='coerce')
+        other = values.isna()
+        if other.any():
+            values[other] = pd.to_datetime(text[other], dayfirst=dayfirst, errors=errors)
+        parsed.iloc[missed] = values.to_numpy()
+    return parsed
+
+
+def clear_date_format_cache():
+    _FORMAT_CACHE.clear()
+
+
 def get_date_range(default_start=None, default_end=None):
     """
     Get a date range from user input with optional defaults.
@@ -5,6 +5,18 @@ from utils import get_base_output_path
 
 def group_by_month_bodega(resumen_mensual_ingresos_clientes, resumen_mensual_despachos_clientes, start_date,
                           end_date):
+    """
+    Inflow and outflow CBM, pallets and units by warehouse for the selected dates.
+
+    Args:
+        resumen_mensual_ingresos_clientes (pd.DataFrame): Output of `monthly_receptions_summary`.
+        resumen_mensual_despachos_clientes (pd.DataFrame): Output of `monthly_dispatch_summary`.
+        start_date, end_date (datetime): Selected date range; keeps the monthly rows whose last movement
+            (`fecha_x`) falls in it.
+
+    Returns:
+        tuple: (inflows by warehouse, outflows by warehouse)
+    """
     print("\n*** Final monthly inflow and outflow dataframes by warehouse ***\n")
 
     # Ensure 'fecha_x' is in datetime format
@@ -0,0 +1,116 @@
+import pandas as pd
+
+# Plans of the merges run so far, see join_report()
+_join_plans = []
+
+
+def _key_counts(df, on):
+    return df.groupby(on, dropna=False, sort=False).size()
+
+
+def estimate_merge_fanout(left, right, on, how='left'):
+    """
+    Estimate the number of rows a merge will produce from the key counts of both sides, without running it.
+
+    Args:
+        left (pd.DataFrame): Left side of the merge.
+        right (pd.DataFrame): Right side of the merge.
+        on (str or list): Join key column(s).
+        how (str): 'left', 'right', 'inner' or 'outer', as in `pd.merge`.
+
+    Returns:
+        dict: Rows of each side, estimated output rows and fan-out (output rows / left rows).
+    """
+    counts = pd.concat([_key_counts(left, on).rename('left'), _key_counts(right, on).rename('right')], axis=1)
+    matched = (counts['left'] * counts['right']).sum()
+    left_only = counts.loc[counts['right'].isna(), 'left'].sum()
+    right_only = counts.loc[counts['left'].isna(), 'right'].sum()
+
+    estimated_rows = matched + {
+        'inner': 0,
+        'left': left_only,
+        'right': right_only,
+        'outer': left_only + right_only,
+    }[how]
+
+    return {
+        'left_rows': len(left),
+        'right_rows': len(right),
+        'estimated_rows': int(estimated_rows),
+        'fanout': estimated_rows / len(left) if len(left) else float('nan'),
+    }
+
+
+def merge_at_grain(left, right, on, how='left', left_grain=None, right_grain=None, stage=None, verbose=True,
+                   **merge_kwargs):
+    """
+    Merge two frames after reducing each side to its join grain.
+
+    Each side is deduplicated on its grain (keeping the first row, so the current sort order decides which row
+    survives) before merging. The estimated fan-out of the merge as written and as planned is recorded and
+    optionally printed.
+
+    Args:
+        left (pd.DataFrame): Left side of the merge.
+        right (pd.DataFrame): Right side of the merge.
+        on (str or list): Join key column(s).
+        how (str): Merge type, as in `pd.merge`.
+        left_grain (str or list, optional): Columns identifying a left row at the grain the result needs.
+            None keeps every left row.
+        right_grain (str or list, optional): Columns identifying a right row at the grain the result needs.
+            None keeps every right row.
+        stage (str, optional): Name of the merge in the report.
+        verbose (bool): Print the plan.
+        **merge_kwargs: Extra arguments for `pd.merge` (suffixes, ...).
+
+    Returns:
+        pd.DataFrame: The merged frame.
+    """
+    naive = estimate_merge_fanout(left, right, on, how)
+
+    if left_grain is not None:
+        left = left.drop_duplicates(subset=left_grain, keep='first')
+    if right_grain is not None:
+        right = right.drop_duplicates(subset=right_grain, keep='first')
+
+    planned = estimate_merge_fanout(left, right, on, how)
+    merged = pd.merge(left, right, on=on, how=how, **merge_kwargs)
+
+    plan = {
+        'stage': stage,
+        'naive_rows': naive['estimated_rows'],
+        'naive_fanout': naive['fanout'],
+        'left_rows': planned['left_rows'],
+        'right_rows': planned['right_rows'],
+        'planned_rows': planned['estimated_rows'],
+        'planned_fanout': planned['fanout'],
+        'actual_rows': len(merged),
+    }
+    _join_plans.append(plan)
+
+    if verbose:
+        print(f"\nMerge plan [{stage or on}]: {naive['estimated_rows']:,} rows as written "
+              f"(fan-out {naive['fanout']:.2f}), {planned['estimated_rows']:,} rows at grain "
+              f"(fan-out {planned['fanout']:.2f}), {len(merged):,} rows produced.")
+
+    return merged
+
+
+def join_report(verbose=True):
+    """
+    Summarize the merges planned so far.
+
+    Args:
+        verbose (bool): Print the report.
+
+    Returns:
+        pd.DataFrame: One row per merge with the estimated rows as written, at grain, and the rows produced.
+    """
+    report = pd.DataFrame(_join_plans, columns=['stage', 'naive_rows', 'naive_fanout', 'left_rows', 'right_rows',
+                                                'planned_rows', 'planned_fanout', 'actual_rows'])
+    report[['naive_fanout', 'planned_fanout']] = report[['naive_fanout', 'planned_fanout']].round(2)
+
+    if verbose:
+        print("\nMerge plans:\n", report.to_string(index=False))
+
+    return report
@@ -2,6 +2,7 @@ from rich.progress import Progress
 import pandas as pd
 import time
 import numpy as np
+from utils.numeric_utils import safe_divide, pct_change_safe
 
 
 
@@ -43,43 +44,30 @@ def kpi_calculation(inventory_over_time, inventory_ot_by_month, start_date, end_
         progress.update(task, advance=1)
 
         # Calculate Inventory Turnover per month
-        monthly_data['Inventory Turnover'] = monthly_data.apply(
-            lambda row: (row['Outflow (CBM)'] / row['Average Inventory Level (CBM)'])
-            if row['Average Inventory Level (CBM)'] != 0 else np.nan,
-            axis=1
-        )
+        monthly_data['Inventory Turnover'] = safe_divide(monthly_data['Outflow (CBM)'],
+                                                         monthly_data['Average Inventory Level (CBM)'])
 
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Replace infinite values with NaN
-        monthly_data['Inventory Turnover'].replace([np.inf, -np.inf], np.nan, inplace=True)
-
         # Calculate Days on Hand per month
-        monthly_data['Days on Hand'] = monthly_data.apply(
-            lambda row: (row['Inventory level (CBM)'] / (row['Outflow (CBM)'] / row['month'].asfreq('M').days_in_month))
-            if row['Outflow (CBM)'] != 0 else np.nan,
-            axis=1
-        )
+        daily_outflow = monthly_data['Outflow (CBM)'] / monthly_data['month'].dt.days_in_month
+        monthly_data['Days on Hand'] = safe_divide(monthly_data['Inventory level (CBM)'], daily_outflow)
 
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Calculate MoM Percentage Changes for KPIs
-        monthly_data['Inflow MoM %'] = monthly_data['Inflow (CBM)'].pct_change() * 100
-        monthly_data['Outflow MoM %'] = monthly_data['Outflow (CBM)'].pct_change() * 100
-        monthly_data['Inventory Level MoM %'] = monthly_data['Inventory level (CBM)'].pct_change() * 100
+        # Calculate MoM Percentage Changes for KPIs (NaN where the previous month is zero)
+        monthly_data['Inflow MoM %'] = pct_change_safe(monthly_data['Inflow (CBM)'])
+        monthly_data['Outflow MoM %'] = pct_change_safe(monthly_data['Outflow (CBM)'])
+        monthly_data['Inventory Level MoM %'] = pct_change_safe(monthly_data['Inventory level (CBM)'])
 
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
 
-        # Replace infinite values with NaN
-        for col in ['Inflow MoM %', 'Outflow MoM %', 'Inventory Level MoM %']:
-            monthly_data[col].replace([np.inf, -np.inf], np.nan, inplace=True)
-
         # Step:
         time.sleep(1)  # Simulate a task
         progress.update(task, advance=1)
@@ -0,0 +1,123 @@
+import os
+import sys
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised when the peak RSS of the process goes over the configured memory budget."""
+
+
+# Opt-in through the environment (OPS_MEMORY_PROFILE=1, OPS_MEMORY_BUDGET_MB=12000) or enable_memory_profiling().
+_settings = {
+    'enabled': os.environ.get('OPS_MEMORY_PROFILE', '').strip() not in ('', '0'),
+    'budget_mb': float(os.environ['OPS_MEMORY_BUDGET_MB']) if os.environ.get('OPS_MEMORY_BUDGET_MB') else None,
+}
+_checkpoints = []
+
+
+def enable_memory_profiling(budget_mb=None):
+    """
+    Turn on stage-boundary memory profiling.
+
+    Args:
+        budget_mb (float, optional): Peak RSS budget in MB. When exceeded, the next checkpoint raises
+            MemoryBudgetExceeded.
+    """
+    _settings['enabled'] = True
+    if budget_mb is not None:
+        _settings['budget_mb'] = float(budget_mb)
+    _checkpoints.clear()
+
+
+def disable_memory_profiling():
+    _settings['enabled'] = False
+
+
+def is_memory_profiling_enabled():
+    return _settings['enabled']
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the current process in MB, or None if it cannot be measured.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    return None
+
+
+def memory_checkpoint(stage, **frames):
+    """
+    Record peak RSS and the deep memory usage of the given DataFrames at a stage boundary.
+
+    Does nothing unless profiling is enabled, so it is safe to leave calls in the pipeline.
+
+    Args:
+        stage (str): Name of the stage boundary (e.g. 'monthly_receptions_summary: merge inventario').
+        **frames (pd.DataFrame): Intermediate frames to measure, keyed by the name used in the report.
+
+    Raises:
+        MemoryBudgetExceeded: If the peak RSS is above the configured budget.
+    """
+    if not _settings['enabled']:
+        return
+
+    rss = peak_rss_mb()
+    for name, df in frames.items():
+        if isinstance(df, (pd.DataFrame, pd.Series)):
+            _checkpoints.append({
+                'stage': stage,
+                'frame': name,
+                'rows': len(df),
+                'frame_mb': df.memory_usage(deep=True).sum() / (1024 * 1024),
+                'peak_rss_mb': rss,
+            })
+    if not frames:
+        _checkpoints.append({'stage': stage, 'frame': None, 'rows': None, 'frame_mb': None, 'peak_rss_mb': rss})
+
+    budget = _settings['budget_mb']
+    if budget is not None and rss is not None and rss > budget:
+        largest = memory_report(top=5, verbose=False)
+        raise MemoryBudgetExceeded(
+            f"Peak RSS {rss:,.0f} MB exceeded the memory budget of {budget:,.0f} MB at stage '{stage}'.\n"
+            f"Largest intermediate frames so far:\n{largest.to_string(index=False)}")
+
+
+def memory_report(top=10, verbose=True):
+    """
+    Summarize the checkpoints recorded so far.
+
+    Args:
+        top (int): Number of largest intermediate frames to report.
+        verbose (bool): Print the report.
+
+    Returns:
+        pd.DataFrame: The `top` largest frames with stage, rows, size in MB and peak RSS at that point.
+    """
+    columns = ['stage', 'frame', 'rows', 'frame_mb', 'peak_rss_mb']
+    report = pd.DataFrame(_checkpoints, columns=columns)
+    report = report.dropna(subset=['frame']).sort_values('frame_mb', ascending=False).head(top)
+    report[['frame_mb', 'peak_rss_mb']] = report[['frame_mb', 'peak_rss_mb']].round(1)
+
+    if verbose:
+        peak = peak_rss_mb()
+        if peak is not None:
+            print(f"\nPeak RSS: {peak:,.1f} MB")
+        print("\nLargest intermediate frames:\n", report.to_string(index=False))
+
+    return report
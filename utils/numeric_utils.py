@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def clip_near_zero(df, columns=None, epsilon=1e-6):
+    """
+    For each column in `columns`, set the value to 0 if abs(value) < epsilon.
+    If columns is None, applies to all numeric columns in df.
+    """
+    if columns is None:
+        # Identify numeric columns automatically
+        columns = df.select_dtypes(include=[np.number]).columns
+
+    columns = list(columns)
+    if columns:
+        values = df[columns]
+        df[columns] = values.mask(values.abs() < epsilon, 0)
+
+    return df
+
+
+def inf_to_nan(values):
+    """
+    Replace +/-inf with NaN in a Series or DataFrame.
+    """
+    return values.replace([np.inf, -np.inf], np.nan)
+
+
+def safe_divide(numerator, denominator):
+    """
+    Element-wise division that yields NaN instead of inf where the denominator is zero.
+
+    Args:
+        numerator (pd.Series or pd.DataFrame): Dividend.
+        denominator (pd.Series or pd.DataFrame): Divisor, aligned with `numerator`.
+
+    Returns:
+        pd.Series or pd.DataFrame: Quotient with NaN for zero or missing denominators.
+    """
+    return inf_to_nan(numerator / denominator.where(denominator != 0))
+
+
+def pct_change_safe(values, periods=1):
+    """
+    Percentage change against the value `periods` rows earlier, NaN where that value is zero or missing.
+
+    Args:
+        values (pd.Series or pd.DataFrame): Ordered values.
+        periods (int): Rows to look back.
+
+    Returns:
+        pd.Series or pd.DataFrame: Change in percent.
+    """
+    previous = values.shift(periods)
+    return safe_divide(values - previous, previous) * 100
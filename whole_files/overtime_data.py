@@ -13,6 +13,41 @@ def get_base_output_path():
     return obase_path
 
 
+# Formatos candidatos para las columnas de fecha, probados en orden sobre una muestra de cada columna
+DATE_FORMATS = ('%d-%m-%Y', '%d-%m-%y', '%d/%m/%Y', '%d/%m/%y', '%d/%m/%Y %H:%M:%S', '%d-%m-%Y %H:%M:%S',
+                '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+# (archivo fuente, columna) -> formato detectado
+_FORMAT_CACHE = {}
+
+
+def parse_date_column(series, cache_key=None, formats=DATE_FORMATS, sample_size=1000):
+    """
+    Parse a day-first date column with one explicit format detected from a sample and cached per source file.
+    Values the detected format cannot parse fall back to pd.to_datetime(..., dayfirst=True).
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    key = (cache_key, series.name)
+    fmt = _FORMAT_CACHE.get(key)
+    if fmt is None:
+        sample = pd.Series(pd.unique(series.dropna().head(sample_size * 10).to_numpy())).astype(str).str.strip()
+        sample = sample[sample != ''].head(sample_size)
+        counts = {f: pd.to_datetime(sample, format=f, errors='coerce').notna().sum() for f in formats}
+        fmt = max(formats, key=counts.get) if not sample.empty else None
+        if fmt is None or counts[fmt] <= len(sample) / 2:
+            return pd.to_datetime(series, dayfirst=True)
+        if cache_key is not None:
+            _FORMAT_CACHE[key] = fmt
+
+    parsed = pd.to_datetime(series, format=fmt, errors='coerce')
+    missed = (parsed.isna() & series.notna() & series.astype(str).str.strip().ne('')).to_numpy()
+    if missed.any():
+        parsed[missed] = pd.to_datetime(series[missed].astype(str).str.strip(), dayfirst=True)
+    return parsed
+
+
 def load_data(start_date=None, end_date=None):
     # Define the paths to your data files
     def get_base_path(file_type):
@@ -50,8 +85,8 @@ def load_data(start_date=None, end_date=None):
     income_overtime_client = pd.read_excel(income_overtime_client_path, header=0)
 
     # Convert 'Fecha' columns to datetime to apply date filtering
-    df_warehouse['Fecha'] = pd.to_datetime(df_warehouse['Fecha'], dayfirst=True)
-    df_delivery['Fecha'] = pd.to_datetime(df_delivery['Fecha'], dayfirst=True)
+    df_warehouse['Fecha'] = parse_date_column(df_warehouse['Fecha'], cache_key=(overtime_file_path, 'Horas en bodega'))
+    df_delivery['Fecha'] = parse_date_column(df_delivery['Fecha'], cache_key=(overtime_file_path, 'Horas en ruta'))
 
     # Apply date filtering if start_date and end_date are provided
     if start_date:
@@ -73,8 +108,8 @@ def load_data(start_date=None, end_date=None):
 
 def data_normalization(df_warehouse, df_delivery, df_salary, income_overtime_client):
     # Convert date columns to datetime with dayfirst=True
-    df_warehouse['Fecha'] = pd.to_datetime(df_warehouse['Fecha'], dayfirst=True)
-    df_delivery['Fecha'] = pd.to_datetime(df_delivery['Fecha'], dayfirst=True)
+    df_warehouse['Fecha'] = parse_date_column(df_warehouse['Fecha'])
+    df_delivery['Fecha'] = parse_date_column(df_delivery['Fecha'])
 
     # Fill NaN values in 'Nombre' column with 'Unknown'
     df_delivery['Nombre'].fillna('Unknown', inplace=True)
@@ -125,8 +160,8 @@ def cost_calculator(df_delivery, df_warehouse, df_salary, start_date=None, end_d
     df_delivery = df_delivery[delivery_ordered_columns]
 
     # Convert 'Fecha' to datetime to check for Sundays
-    df_delivery['Fecha'] = pd.to_datetime(df_delivery['Fecha'], dayfirst=True)
-    df_warehouse['Fecha'] = pd.to_datetime(df_warehouse['Fecha'], dayfirst=True)
+    df_delivery['Fecha'] = parse_date_column(df_delivery['Fecha'])
+    df_warehouse['Fecha'] = parse_date_column(df_warehouse['Fecha'])
 
     # Ensure overtime hour columns and rates are numeric
     for df in [df_delivery, df_warehouse]: